@@ -4,8 +4,13 @@ from typing import Dict
 
 from attr import dataclass
 from helper import extract_json_from_text
-from llm_processor import llm
+from llm_processor import llm, prefix_cache
 from llama_cpp import Any, List, Optional
+from plan_router import PlanRouter
+from plan_cache import PlanCache, file_hash
+from config import (PLAN_CACHE_ENABLED, PLAN_CACHE_MAX_ENTRIES, PLAN_CACHE_SIMILARITY, PLAN_CACHE_TTL_SECONDS,
+                    PLAN_GRAMMAR_ENABLED, ROUTER_ENABLED, ROUTER_MODEL_MIN_CONFIDENCE,
+                    ROUTER_MODEL_MIN_SAMPLES, ROUTER_MODEL_PATH)
 
 @dataclass
 class ActionPlan:
@@ -28,6 +33,77 @@ class ActionPlan:
             )
         result += f"🎯 Kết quả mong đợi: {self.expected_output}"
         return result
+# Các hàm planner được phép dùng (khớp danh sách AVAILABLE FUNCTIONS trong prompt + "general")
+PLAN_FUNCTIONS = ["scan", "read", "write", "classify", "classify_by_topic",
+                  "search_exactly", "search", "export", "learn", "general"]
+
+# JSON schema của ActionPlan: llama.cpp chuyển thành grammar nên output luôn parse được
+# và dừng ngay ở dấu } cuối cùng
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "task_description": {"type": "string"},
+        "steps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "step": {"type": "integer"},
+                    "description": {"type": "string"},
+                    "function": {"type": "string", "enum": PLAN_FUNCTIONS},
+                    "parameters": {"type": "object"},
+                    "required_data": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["step", "description", "function", "parameters", "required_data"],
+            },
+        },
+        "expected_output": {"type": "string"},
+        "recommendations": {"type": "string"},
+    },
+    "required": ["task_description", "steps", "expected_output", "recommendations"],
+}
+
+# Thống kê sinh plan: số lần phải thử lại / gọi fallback
+plan_stats = {"plans": 0, "attempts": 0, "retries": 0, "failed": 0}
+
+def _plan_from_json(parsed: Dict[str, Any]) -> ActionPlan:
+    """Tạo ActionPlan, bỏ qua các key không thuộc ActionPlan"""
+    fields = ("task_description", "steps", "expected_output", "recommendations")
+    return ActionPlan(**{key: parsed[key] for key in fields if key in parsed})
+
+def _known_filenames() -> List[str]:
+    """Tên các file đã index (để router nhận ra tên file người dùng nhắc tới)"""
+    try:
+        from mcp_filesystem_server import file_indexer
+        return [metadata.filename for metadata in file_indexer.snapshot()]
+    except ImportError:
+        return []
+
+plan_router = PlanRouter(ROUTER_MODEL_PATH, known_filenames=_known_filenames, enabled=ROUTER_ENABLED,
+                         min_confidence=ROUTER_MODEL_MIN_CONFIDENCE, min_samples=ROUTER_MODEL_MIN_SAMPLES)
+
+plan_cache = PlanCache(PLAN_CACHE_MAX_ENTRIES, PLAN_CACHE_TTL_SECONDS,
+                       similarity=PLAN_CACHE_SIMILARITY, enabled=PLAN_CACHE_ENABLED)
+
+def _plan_to_json(action_plan: ActionPlan) -> Dict[str, Any]:
+    return {"task_description": action_plan.task_description, "steps": action_plan.steps,
+            "expected_output": action_plan.expected_output, "recommendations": action_plan.recommendations}
+
+def get_action_plan(user_input: str) -> Optional[ActionPlan]:
+    """Router nhanh -> plan cache -> planner LLM (chỉ khi hai bước trước không có kết quả)"""
+    routed = plan_router.route(user_input)
+    if routed is not None:
+        return _plan_from_json(routed)
+    feedback_hash = file_hash("user_feedback.txt")
+    cached = plan_cache.get(user_input, feedback_hash)
+    if cached is not None:
+        return _plan_from_json(cached)
+    action_plan = get_json_response(user_input)
+    if action_plan is not None:
+        plan_cache.put(user_input, feedback_hash, _plan_to_json(action_plan))
+        plan_router.learn(user_input, action_plan.steps)
+    return action_plan
+
 def get_user_feedback() -> str:
     try:
         with open("user_feedback.txt", "r", encoding="utf-8") as f:
@@ -128,15 +204,27 @@ Yêu cầu: So sánh file marketing 2024 và 2025
 [/INST]
 """
 
-def get_json_response(user_input: str, max_retries: int = 3) -> Optional[ActionPlan]:
+def get_json_response(user_input: str, max_retries: int = 3,
+                      constrained: bool = PLAN_GRAMMAR_ENABLED) -> Optional[ActionPlan]:
+    """
+    Sinh ActionPlan. Với constrained=True output bị ràng buộc theo PLAN_SCHEMA (grammar),
+    nên gần như luôn parse được ở lần đầu; vòng retry chỉ còn là lưới an toàn.
+    """
     prompt = get_prompt_english(user_input)
+    extra = {"response_format": {"type": "json_object", "schema": PLAN_SCHEMA}} if constrained else {}
+    plan_stats["plans"] += 1
     
     for attempt in range(max_retries):
+        plan_stats["attempts"] += 1
+        if attempt:
+            plan_stats["retries"] += 1
         try:
-            output = llm.create_chat_completion(
+            output = prefix_cache.create_chat_completion(
+                "planner", PLANNER_PROMPT_PREFIX,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=4096,
                 temperature=0.0,
+                **extra,
             )
             
             raw_output = output["choices"][0]["message"]["content"]
@@ -144,7 +232,7 @@ def get_json_response(user_input: str, max_retries: int = 3) -> Optional[ActionP
             json_text = extract_json_from_text(raw_output)
             if json_text:
                 parsed = json.loads(json_text)
-                action_plan =  ActionPlan(**parsed)
+                action_plan = _plan_from_json(parsed)
                 return action_plan
             else:
                 print(f"⚠️ Thử {attempt + 1}/{max_retries}: Không tìm thấy JSON hợp lệ")
@@ -152,6 +240,7 @@ def get_json_response(user_input: str, max_retries: int = 3) -> Optional[ActionP
         except Exception as e:
             print(f"⚠️ Thử {attempt + 1}/{max_retries}: Lỗi - {e}")
             
+    plan_stats["failed"] += 1
     return None
 
 # Hàm fallback
@@ -166,6 +255,7 @@ Ví dụ: {{"task_description": "Ví dụ", "steps": [], "expected_output": "K
     try:
         output = llm.create_chat_completion(
             messages=[{"role": "user", "content": simple_prompt}],
+            response_format={"type": "json_object", "schema": PLAN_SCHEMA},
             max_tokens=512,
             temperature=0.0,
         )
@@ -175,7 +265,7 @@ Ví dụ: {{"task_description": "Ví dụ", "steps": [], "expected_output": "K
         
         if json_text:
             parsed = json.loads(json_text)
-            return ActionPlan(parsed)
+            return _plan_from_json(parsed)
         return None
     except Exception as e:
         print(f"❌ Fallback error: {e}")
@@ -269,21 +359,21 @@ Bạn là AI Assistant tạo kế hoạch hành động. Trả về **chỉ JSON
 
 
 
-def get_prompt_english(user_input: str) -> str:
-    user_feedback = get_user_feedback()
-    return f"""
+# Phần tĩnh của prompt planner: giữ nguyên giữa các lần gọi để dùng lại KV-cache (prompt_cache),
+# mọi nội dung thay đổi (user feedback, yêu cầu) phải nằm ở phần đuôi
+PLANNER_PROMPT_PREFIX = """
 [INST]
 You are an AI Assistant that creates action plans. Return **only a JSON object**, do not add any text, explanation, markdown, or any characters other than JSON.
 
 **RULES**:
-- JSON must start with {{ and end with }}
+- JSON must start with { and end with }
 - Do not add blank lines, comments, or any content other than JSON
 - If action is not in the FUNCTIONS list, use "general"
 - "general" is always the last step (if necessary, if function is sufficient then this step is not needed)
 - If classify_by_topic or classify steps exist, do not add search step
 - Each step must have: step (number), description (Vietnamese description), function (function name), parameters (object, can be empty), required_data (array)
 - Only use functions as requested by user, do not automatically add other steps
-- Must follow user feedback with {user_feedback}, if empty then can ignore
+- Must follow the user feedback given below the rules, if empty then can ignore
 
 **AVAILABLE FUNCTIONS**:
 - scan: Scan file content to get detailed information
@@ -332,34 +422,42 @@ Must return complete closing brackets and no JSON syntax errors.
 
 **EXAMPLE**:
 Request: Compare marketing 2024 and 2025 files
-{{
+{
   "task_description": "So sánh file marketing 2024 và 2025",
   "steps": [
-    {{
+    {
       "step": 1,
       "description": "Tìm file marketing 2024",
       "function": "search",
-      "parameters": {{"query": "marketing 2024"}},
+      "parameters": {"query": "marketing 2024"},
       "required_data": ["file marketing 2024"]
-    }},
-    {{
+    },
+    {
       "step": 2,
       "description": "Tìm file marketing 2025",
       "function": "search",
-      "parameters": {{"query": "marketing 2025"}},
+      "parameters": {"query": "marketing 2025"},
       "required_data": ["file marketing 2025"]
-    }},
-    {{
+    },
+    {
       "step": 3,
       "description": "So sánh nội dung hai file",
       "function": "general",
-      "parameters": {{}},
+      "parameters": {},
       "required_data": ["so sánh chi tiết"]
-    }}
+    }
   ],
   "expected_output": "Báo cáo so sánh marketing 2024 vs 2025",
   "recommendations": "Bạn có thể thêm bước phân loại file theo chủ đề nếu cần thiết"
-}}
+}
+
+"""
+
+
+def get_prompt_english(user_input: str) -> str:
+    user_feedback = get_user_feedback()
+    return PLANNER_PROMPT_PREFIX + f"""**User feedback**:
+{user_feedback}
 
 **User request**:
 "{user_input}"
@@ -1,17 +1,27 @@
-from typing import Dict
+import threading
+from collections import OrderedDict
+from typing import Dict, Generator, Iterator
 
 from llama_cpp import List
 from pyparsing import Any
-from action_plan import ActionPlan, get_json_response
+from action_plan import ActionPlan, get_action_plan
 from function_result import FunctionResult
-from llm_processor import MCP_AVAILABLE, classify_by_topic_handler, classify_handler, format_mcp_result, generate_classify_result, generate_simple_response, search_handler
-from mcp_client import process_filesystem_query
+from llm_processor import MCP_AVAILABLE, classify_by_topic_handler, classify_handler, format_mcp_result, generate_classify_result, generate_simple_response, search_handler, stream_simple_response, wait_until_ready
+from mcp_client import filesystem_manager, format_hybrid_result, process_filesystem_query
+from llm_scheduler import scheduler
+from llm_utils import count_tokens
+from chunk_store import ChunkStore, build_context
+from summarizer import wants_summary
+from config import GENERAL_CONTEXT_MAX_FILES, GENERAL_CONTEXT_TOKEN_BUDGET, SESSION_STATE_MAX
 
 
 class AgenticProcessor:
     def __init__(self):
         self.context_data = {}  # Lưu trữ dữ liệu giữa các bước
         self.execution_history = []  # Lịch sử thực hiện
+        self.context_files = []  # File các bước của request hiện tại đã dùng (làm ngữ cảnh cho bước general)
+        self.chunk_store = ChunkStore()  # Chunk của output các bước + nội dung file
+        self._step_sources = []
         
     def execute_step(self, step: Dict[str, Any], step_index: int, prompt: str) -> FunctionResult:
         """Thực hiện một bước trong action plan"""
@@ -35,11 +45,7 @@ class AgenticProcessor:
                 return self._execute_add_feedback(prompt, step)
             elif intent == 'general':
                 print(f"Thực hiện tác vụ chung: {step_description}")
-                data_context = ''
-                for i in range(len(self.execution_history)):
-                        output = self.execution_history[i].get('output', '')
-                        data_context += f"Bước {i+1}: {output}\n"
-                generate_info = generate_simple_response(f"Với prompt {prompt} Hãy thực hiện tác vụ này :{step_description} 'với data hiện có là '  {data_context}. prompt không liên quan tới data hiện có. Chỉ trả về kết quả của tác vụ này.")
+                generate_info = generate_simple_response(self._general_prompt(prompt, step_description))
                 return FunctionResult(
                     success=True,
                     data= f"{step_description} \n {generate_info}"
@@ -62,10 +68,60 @@ class AgenticProcessor:
                 error=str(e) + f"\nGợi ý: {recommendation}",
             )
     
+    def _context_sources(self, summarize: bool = False) -> List[str]:
+        """
+        Đưa output các bước trước và nội dung các file đã dùng vào chunk store, trả về danh sách source.
+        summarize=True (tóm tắt, so sánh): dùng bản tóm tắt map-reduce của cả file thay cho toàn văn.
+        """
+        self.chunk_store.remove(self._step_sources)
+        self._step_sources = []
+        for i, history in enumerate(self.execution_history):
+            source = f"Bước {i+1}"
+            self.chunk_store.add(source, str(history.get('output', '')))
+            self._step_sources.append(source)
+        files = []
+        for filepath in dict.fromkeys(self.context_files):
+            if summarize:
+                result = filesystem_manager.summarize_file(filepath)
+                source, text = f"Tóm tắt {result.get('filename', filepath)}", result["summary"]
+            else:
+                result = filesystem_manager.read_file_content(filepath, limit=None)
+                source, text = filepath, result["content"]
+            if result["success"] and text:
+                self.chunk_store.add(source, text)
+                files.append(source)
+        return self._step_sources + files
+
+    def _general_prompt(self, prompt: str, step_description: str) -> str:
+        """
+        Prompt cho bước general: chỉ các chunk (output bước trước, nội dung file) liên quan nhất
+        với yêu cầu, tổng số token không vượt GENERAL_CONTEXT_TOKEN_BUDGET
+        """
+        query = f"{prompt} {step_description}"
+        data_context = build_context(self.chunk_store, query, GENERAL_CONTEXT_TOKEN_BUDGET, count_tokens,
+                                     self._context_sources(summarize=wants_summary(query)))
+        return f"Với prompt {prompt} Hãy thực hiện tác vụ này :{step_description} 'với data hiện có là '  {data_context}. prompt không liên quan tới data hiện có. Chỉ trả về kết quả của tác vụ này."
+
+    def stream_general_step(self, step: Dict[str, Any], prompt: str) -> Generator[str, None, FunctionResult]:
+        """Bước general dạng stream: yield từng đoạn token, trả về FunctionResult khi xong"""
+        step_description = step.get('description', '')
+        print(f"Thực hiện tác vụ chung (stream): {step_description}")
+        pieces = []
+        for piece in stream_simple_response(self._general_prompt(prompt, step_description)):
+            pieces.append(piece)
+            yield piece
+        return FunctionResult(
+            success=True,
+            data=f"{step_description} \n {''.join(pieces).strip()}"
+        )
+
     def _execute_search(self, prompt: str, step: Dict[str, Any]) -> FunctionResult:
         """Thực hiện search với xử lý lỗi"""
         try:
-            keyword = search_handler(prompt)
+            # BM25 cần từ khóa (câu đầy đủ nhiều stopword xếp hạng kém): planner chưa trích thì hỏi LLM.
+            # Câu hỏi đầy đủ chỉ dùng cho nhánh ngữ nghĩa khi có model embedding
+            keyword = (step.get('parameters') or {}).get('query') or search_handler(prompt)
+            semantic_query = prompt if filesystem_manager.vectors_enabled() else None
             if not keyword:
                 return FunctionResult(
                     success=False,
@@ -74,7 +130,9 @@ class AgenticProcessor:
                 )
             print(f"Searching for keyword: {keyword}")
             
-            mcp_result = process_filesystem_query(keyword, "search")
+            result = filesystem_manager.hybrid_search(keyword, semantic_query=semantic_query)
+            mcp_result = format_hybrid_result(result, keyword)
+            self.context_files.extend(f["filepath"] for f in result["files"][:GENERAL_CONTEXT_MAX_FILES])
             formatted_result = format_mcp_result(mcp_result, 'search', prompt)
             self.context_data['search_results'] = mcp_result
             self.context_data['search_keyword'] = keyword
@@ -92,14 +150,18 @@ class AgenticProcessor:
     def _execute_search_and_read(self, prompt: str, step: Dict[str, Any]) -> FunctionResult:
         """Thực hiện scan với xử lý lỗi"""
         try:
-            mcp_result = process_filesystem_query(step.get("required_data", "")[0], "search_exactly")
-            self.context_data['search_exactly'] = mcp_result
-            if mcp_result == "Không tìm thầy file":
+            filename = step.get("required_data", "")[0]
+            info = filesystem_manager.get_file_info(filename)
+            if not info["success"]:
                 return FunctionResult(
                     success=False,
-                    error=f"Không tìm thấy file {step.get('required_data', '')[0]}",
-                    missing_data=[f"file {step.get('required_data', '')[0]}"]
+                    error=f"Không tìm thấy file {filename}",
+                    missing_data=[f"file {filename}"]
                 )
+            mcp_result = info["file"]["content_preview"]
+            self.context_data['search_exactly'] = mcp_result
+            # Bước general sau đó (so sánh, tóm tắt) lấy ngữ cảnh từ toàn văn của file
+            self.context_files.append(info["file"]["filepath"])
             return FunctionResult(
                 success=True,
                 data=mcp_result,
@@ -220,7 +282,7 @@ class AgenticProcessor:
     def _execute_classify_by_topic(self, prompt: str, step: Dict[str, Any]) -> FunctionResult:
         """Thực hiện classify by topic với xử lý lỗi"""
         try:
-            topic = classify_by_topic_handler(prompt)
+            topic = (step.get('parameters') or {}).get('topic') or classify_by_topic_handler(prompt)
             
             if not topic:
                 return FunctionResult(
@@ -290,13 +352,37 @@ class AgenticProcessor:
         return False
 
 
+# Processor mặc định (dùng khi không có session, vd. gọi từ script)
+DEFAULT_SESSION = "default"
 processor = AgenticProcessor()
 
-def make_recommendation(prompt: str ) -> str:
-    """Tạo gợi ý hành động dựa trên prompt"""
+# Mỗi session (tab Gradio) có AgenticProcessor riêng để không lẫn execution_history
+_session_processors: "OrderedDict[str, AgenticProcessor]" = OrderedDict()
+_session_lock = threading.Lock()
 
+def get_session_processor(session_id: str) -> AgenticProcessor:
+    """Lấy (hoặc tạo) processor của session, bỏ các session lâu không dùng khi vượt SESSION_STATE_MAX"""
+    if session_id == DEFAULT_SESSION:
+        return processor
+    with _session_lock:
+        agent = _session_processors.pop(session_id, None) or AgenticProcessor()
+        _session_processors[session_id] = agent
+        while len(_session_processors) > SESSION_STATE_MAX:
+            _session_processors.popitem(last=False)
+        return agent
+
+def make_recommendation(prompt: str, agent: AgenticProcessor = None) -> str:
+    """Tạo gợi ý hành động dựa trên prompt"""
+    try:
+        # Sử dụng LLM để tạo gợi ý
+        recommendation = generate_simple_response(_recommendation_prompt(prompt, agent or processor))
+        return recommendation
+    except Exception as e:
+        print(f"Error generating recommendation: {e}")
+        return "Không thể tạo gợi ý, vui lòng thử lại sau."
 
-    context = "Ngữ cảnh hiện tại là: " + str(processor.execution_history[-1].get('error', ''))
+def _recommendation_prompt(prompt: str, agent: AgenticProcessor) -> str:
+    context = "Ngữ cảnh hiện tại là: " + str(agent.execution_history[-1].get('error', ''))
     system_prompt = f"""Bạn là một AI Assistant tạo kế hoạch hành động. Hãy gợi ý một hành động thay
     thế hoặc giải pháp cho người dùng dựa trên prompt sau: {prompt}
     Với ngữ cảnh hiện tại là: {context} 
@@ -304,76 +390,97 @@ def make_recommendation(prompt: str ) -> str:
     Hãy trả lời ngắn gọn bằng tiếng việt , ví dụ như
     "Tôi không tìm thấy file này, bạn hãy upload vào hoặc kiểm tra lại" hoặc "Thử phân loại lại theo chủ đề khác".
     """
-    try:
-        # Sử dụng LLM để tạo gợi ý
-        recommendation = generate_simple_response(f"{system_prompt} ")
-        return recommendation
-    except Exception as e:
-        print(f"Error generating recommendation: {e}")
-        return "Không thể tạo gợi ý, vui lòng thử lại sau."
+    return f"{system_prompt} "
 
-def process_prompt_agent(prompt: str) -> str:
+def process_prompt_agent(prompt: str, session_id: str = DEFAULT_SESSION) -> str:
     """
     Xử lý prompt như một agentic AI với khả năng xử lý lỗi và chuyển tiếp dữ liệu
     """
+    return "".join(submit_prompt(prompt, session_id)).strip()
+
+def submit_prompt(prompt: str, session_id: str = DEFAULT_SESSION) -> Iterator[str]:
+    """
+    Đưa prompt vào hàng đợi của LLM scheduler và stream kết quả.
+    Request đầu tiên chờ model/filesystem khởi động xong.
+    Raise SchedulerBusy nếu hàng đợi đầy.
+    """
+    def task():
+        wait_until_ready()
+        yield from process_prompt_agent_stream(prompt, get_session_processor(session_id))
+
+    return scheduler.submit(session_id, task)
+
+def process_prompt_agent_stream(prompt: str, agent: AgenticProcessor = None) -> Iterator[str]:
+    """
+    Bản stream của process_prompt_agent: yield kết quả từng bước ngay khi bước đó xong,
+    và yield từng đoạn token của LLM cho các bước general.
+    Gọi trực tiếp không qua scheduler thì phải tự đảm bảo không chạy song song với request khác.
+    """
+    agent = agent or processor
+    # Lịch sử của request trước (vd. dừng giữa chừng vì lỗi) không dùng cho request này
+    agent.execution_history.clear()
+    agent.context_files.clear()
     try:
         # Lấy action plan từ prompt
-        action_plan_data = get_json_response(prompt)
+        action_plan_data = get_action_plan(prompt)
         
         # Kiểm tra xem có cần sử dụng MCP không
         if not MCP_AVAILABLE:
             print("MCP không khả dụng, sử dụng chế độ đơn giản...")
-            return generate_simple_response(prompt)
+            yield from stream_simple_response(prompt)
+            return
         
         # Kiểm tra xem có steps nào cần xử lý không
         if not action_plan_data.steps or action_plan_data.steps[0].get('function') == 'general':
             print("Không có bước cụ thể, sử dụng chế độ đơn giản...")
-            return generate_simple_response(prompt)
-        
-        # Khởi tạo processor
-        final_result = ""
+            yield from stream_simple_response(prompt)
+            return
 
-        final_result += f"🎯 Đang xử lý: {action_plan_data.task_description}\n\n"
+        yield f"🎯 Đang xử lý: {action_plan_data.task_description}\n\n"
         
         # Thực hiện từng bước
         for i, step in enumerate(action_plan_data.steps):
-            step_result = processor.execute_step(step, i, prompt)
+            if step.get('function') == 'general':
+                yield f"✅ Bước {i+1}: {step.get('description', '')} \n "
+                step_result = yield from agent.stream_general_step(step, prompt)
+                yield "\n"
+            else:
+                step_result = agent.execute_step(step, i, prompt)
+                if step_result.success and len(step) > 1:
+                    yield f"✅ Bước {i+1}: {step_result.data}\n"
             
             if step_result.success:
-                if len(step) > 1 : 
-                    final_result += f"✅ Bước {i+1}: {step_result.data}\n"
-                processor.execution_history.append({
+                agent.execution_history.append({
                     'step': i+1,
                     'success': True,
                     'output': step_result.data
                 })
             else:
                 # Xử lý lỗi
-                error_handling = processor.handle_step_failure(
+                error_handling = agent.handle_step_failure(
                     step_result, i, action_plan_data.steps[i+1:], prompt
                 )
-                final_result += error_handling
+                yield error_handling
                 
-                processor.execution_history.append({
+                agent.execution_history.append({
                     'step': i+1,
                     'success': False,
                     'error': step_result.error
                 })
                 break
-                if "🛑" in error_handling:
-                    break
         
-        if processor.execution_history[-1].get('success', '') == True:
-            final_result += f"\n📋 Tóm tắt: Đã thực hiện {len(processor.execution_history)} bước"
-            success_count = sum(1 for h in processor.execution_history if h['success'])
-            final_result += f" ({success_count} thành công, {len(processor.execution_history) - success_count} thất bại)"
+        if agent.execution_history[-1].get('success', '') == True:
+            summary = f"\n📋 Tóm tắt: Đã thực hiện {len(agent.execution_history)} bước"
+            success_count = sum(1 for h in agent.execution_history if h['success'])
+            summary += f" ({success_count} thành công, {len(agent.execution_history) - success_count} thất bại)"
             if action_plan_data.recommendations != None  and action_plan_data.recommendations != "" and action_plan_data.recommendations != "[]": 
-                final_result += f"\n💡 Gợi ý: {action_plan_data.recommendations}"
-            processor.execution_history.clear()
-            return final_result.strip()
+                summary += f"\n💡 Gợi ý: {action_plan_data.recommendations}"
+            agent.execution_history.clear()
+            yield summary
         else : 
-            return make_recommendation(prompt)
+            yield "\n"
+            yield from stream_simple_response(_recommendation_prompt(prompt, agent))
         
     except Exception as e:
         print(f"Critical error in process_prompt_agent: {e}")
-        return f"❌ Lỗi nghiêm trọng: {str(e)}\n🔄 Chuyển sang chế độ đơn giản..."
\ No newline at end of file
+        yield f"❌ Lỗi nghiêm trọng: {str(e)}\n🔄 Chuyển sang chế độ đơn giản..."
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Đo số upload/giây của POST /upload-metadata khi nhiều client gửi cùng lúc,
+kèm độ trễ p50/p99 và số lần ghi (group commit) / fsync phía server.
+
+Không truyền URL: chạy server tạm (uvicorn, thư mục lưu tạm) lần lượt với durability window = 0
+(fsync mỗi lần ghi) và METADATA_DURABILITY_WINDOW_SECONDS. Có URL: đo server đang chạy.
+
+Chạy: python benchmark_metadata_upload.py [số client] [số upload mỗi client] [URL]
+"""
+
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import uvicorn
+
+import mcp_cloud_api
+from config import METADATA_DURABILITY_WINDOW_SECONDS
+from metadata_storage import GroupCommitWriter
+
+PORT = 8765
+
+
+def client(url: str, client_id: int, uploads: int) -> list:
+    latencies = []
+    with requests.Session() as session:
+        for i in range(uploads):
+            metadata = {"filename": f"bench-{client_id}-{i % 50}.txt", "label": "benchmark", "content": "x" * 200}
+            started = time.perf_counter()
+            session.post(f"{url}/upload-metadata", json=metadata, timeout=30).raise_for_status()
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def run(url: str, clients: int, uploads: int) -> dict:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda c: client(url, c, uploads), range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(l for r in results for l in r)
+    return {
+        "uploads": len(latencies),
+        "uploads_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def run_local(clients: int, uploads: int, durability_window: float) -> dict:
+    """Server uvicorn trên thread phụ, lưu vào thư mục tạm"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        service = mcp_cloud_api.MCPMetadataService(store_dir=store_dir)
+        service.writer = GroupCommitWriter(service.storage, durability_window)
+        mcp_cloud_api.mcp_service = service
+        server = uvicorn.Server(uvicorn.Config(mcp_cloud_api.app, port=PORT, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        try:
+            result = run(f"http://127.0.0.1:{PORT}", clients, uploads)
+        finally:
+            server.should_exit = True
+            thread.join()
+            service.storage.close()
+        result.update(service.writer.stats)
+        return result
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    uploads = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"{clients} client x {uploads} upload")
+    if len(sys.argv) > 3:
+        print(f"  {sys.argv[3]}: {run(sys.argv[3].rstrip('/'), clients, uploads)}")
+        return
+    for window in (0.0, METADATA_DURABILITY_WINDOW_SECONDS):
+        print(f"  durability window {window}s: {run_local(clients, uploads, window)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Đo tổng tokens/giây khi gửi nhiều request độc lập: chạy tuần tự trên một context
+so với gửi cả lô lên model pool (LLM_POOL_SIZE context).
+
+Chạy: python benchmark_model_pool.py [số request]
+"""
+
+import sys
+import time
+
+from config import LLM_POOL_SIZE, LLM_THREADS_PER_CONTEXT
+from llm_processor import llm
+
+PROMPTS = [
+    "Tóm tắt lợi ích của việc phân loại tài liệu theo chủ đề.",
+    "Viết ba gợi ý đặt tên file báo cáo marketing.",
+    "Giải thích ngắn gọn BM25 là gì.",
+    "Liệt kê các bước lập kế hoạch kinh doanh năm mới.",
+]
+
+
+def completion_tokens(response) -> int:
+    return (response.get("usage") or {}).get("completion_tokens", 0)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2 * LLM_POOL_SIZE
+    requests = [
+        {"messages": [{"role": "user", "content": PROMPTS[i % len(PROMPTS)]}], "max_tokens": 64, "temperature": 0.0}
+        for i in range(count)
+    ]
+    llm.wait()
+    print(f"Pool: {LLM_POOL_SIZE} context x {LLM_THREADS_PER_CONTEXT} thread, {count} request")
+
+    started = time.perf_counter()
+    with llm.acquire() as model:
+        tokens = sum(completion_tokens(model.create_chat_completion(**kwargs)) for kwargs in requests)
+    serial = time.perf_counter() - started
+    print(f"  tuần tự (1 context): {tokens} token / {serial:.1f}s = {tokens / serial:.1f} tok/s")
+
+    started = time.perf_counter()
+    tokens = sum(completion_tokens(r) for r in llm.create_chat_completion_batch(requests))
+    pooled = time.perf_counter() - started
+    print(f"  theo lô (pool)     : {tokens} token / {pooled:.1f}s = {tokens / pooled:.1f} tok/s (x{serial / pooled:.2f})")
+
+
+if __name__ == "__main__":
+    main()
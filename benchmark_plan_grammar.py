@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+So sánh sinh ActionPlan có và không có grammar (JSON schema):
+số lần phải thử lại, số plan hỏng và thời gian trung bình mỗi plan.
+
+Chạy: python benchmark_plan_grammar.py
+"""
+
+import time
+
+from action_plan import get_json_response, plan_stats
+
+SAMPLE_PROMPTS = [
+    "Tìm file về marketing",
+    "So sánh file marketing-2024.docx và marketing-2025.docx",
+    "Quét thư mục rồi phân loại tất cả file",
+    "Phân loại các file liên quan đến tài chính và xuất metadata",
+    "Lần sau không cần đưa ra gợi ý",
+]
+
+
+def run(constrained: bool) -> dict:
+    for key in plan_stats:
+        plan_stats[key] = 0
+    started = time.perf_counter()
+    for prompt in SAMPLE_PROMPTS:
+        get_json_response(prompt, constrained=constrained)
+    result = dict(plan_stats)
+    result["seconds_per_plan"] = round((time.perf_counter() - started) / len(SAMPLE_PROMPTS), 2)
+    return result
+
+
+def main():
+    free = run(constrained=False)
+    grammar = run(constrained=True)
+    print(f"Không grammar: {free}")
+    print(f"Có grammar   : {grammar}")
+    print(f"Số lần retry tránh được: {free['attempts'] - grammar['attempts']} "
+          f"(plan hỏng: {free['failed']} -> {grammar['failed']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+So sánh thời gian evaluate prompt (time-to-first-token) của planner và detect_intent
+khi evaluate toàn bộ prompt và khi nạp lại KV-cache của phần prefix tĩnh.
+
+Chạy: python benchmark_prefix_cache.py [số lần lặp]
+"""
+
+import statistics
+import sys
+import time
+
+from llm_processor import llm, prefix_cache, INTENT_PROMPT_PREFIX
+from action_plan import PLANNER_PROMPT_PREFIX, get_prompt_english
+
+SAMPLE_PROMPTS = [
+    "Tìm file về marketing",
+    "So sánh file marketing 2024 và 2025",
+    "Phân loại các file theo chủ đề kế hoạch kinh doanh",
+    "Quét thư mục rồi xuất metadata",
+]
+
+
+def time_to_first_token(call) -> float:
+    """Thời gian đến token đầu tiên (gần bằng thời gian evaluate prompt)"""
+    started = time.perf_counter()
+    for _ in call():
+        break
+    return time.perf_counter() - started
+
+
+def run(name: str, prefix: str, build_prompt, rounds: int):
+    messages = [[{"role": "user", "content": build_prompt(p)}] for p in SAMPLE_PROMPTS]
+    prompt_tokens = statistics.mean(
+        len(llm.tokenize(m[0]["content"].encode("utf-8"))) for m in messages
+    )
+    prefix_tokens = len(llm.tokenize(prefix.encode("utf-8")))
+
+    full, reused = [], []
+    # Đo trên cùng một context của pool
+    with llm.acquire() as model:
+        # Lưu state của prefix trước, không tính vào thời gian đo
+        prefix_cache.warm(model, name, prefix)
+
+        for _ in range(rounds):
+            for m in messages:
+                # Không dùng cache: xóa KV, evaluate cả prompt
+                model.reset()
+                full.append(time_to_first_token(
+                    lambda: model.create_chat_completion(messages=m, max_tokens=1, temperature=0.0, stream=True)
+                ))
+                # Dùng cache: nạp state của prefix, chỉ evaluate phần đuôi
+                reused.append(time_to_first_token(
+                    lambda: prefix_cache.create_chat_completion(
+                        name, prefix, model=model, messages=m, max_tokens=1, temperature=0.0, stream=True)
+                ))
+
+    full_ms = statistics.mean(full) * 1000
+    reused_ms = statistics.mean(reused) * 1000
+    print(f"[{name}] prompt ~{prompt_tokens:.0f} token (prefix {prefix_tokens} token)")
+    print(f"  evaluate toàn bộ : {full_ms:8.1f} ms")
+    print(f"  dùng prefix cache: {reused_ms:8.1f} ms  (x{full_ms / reused_ms:.1f})")
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    prefix_cache.enabled = True
+    run("intent", INTENT_PROMPT_PREFIX, lambda p: INTENT_PROMPT_PREFIX + f"Người dùng: {p}\nOutput:", rounds)
+    run("planner", PLANNER_PROMPT_PREFIX, get_prompt_english, rounds)
+    print(f"Thống kê prefix cache: {prefix_cache.stats}")
+
+
+if __name__ == "__main__":
+    main()
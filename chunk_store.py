@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Chunk Store
+Chia văn bản (nội dung file, output các bước trước) thành chunk và xếp hạng chunk theo BM25
+với câu hỏi. build_context chỉ lấy các chunk liên quan nhất vừa đủ ngân sách token,
+nên prompt của bước general không phình theo số file các bước trước đã đụng tới.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import CHUNK_STORE_MAX_SOURCES
+from search_index import InvertedIndex
+from vector_index import chunk_text
+from verdict_cache import content_hash
+
+logger = logging.getLogger(__name__)
+
+# Dừng chọn chunk khi ngân sách còn lại ít hơn số token này
+MIN_REMAINING_TOKENS = 32
+
+
+class ChunkStore:
+    """source -> chunk của văn bản; chỉ chia lại khi nội dung đổi; giới hạn số source (LRU)"""
+
+    def __init__(self, max_sources: int = CHUNK_STORE_MAX_SOURCES):
+        self.max_sources = max_sources
+        self._sources: "OrderedDict[str, Tuple[str, List[str]]]" = OrderedDict()
+        self._chunk_ids: Dict[str, Tuple[str, int]] = {}
+        self.index = InvertedIndex()
+        self._lock = threading.Lock()
+
+    def __contains__(self, source: str) -> bool:
+        return source in self._sources
+
+    @staticmethod
+    def _chunk_id(source: str, number: int) -> str:
+        return f"{source}\x00{number}"
+
+    def add(self, source: str, text: str) -> int:
+        """Thêm/cập nhật văn bản của source, trả về số chunk"""
+        digest = content_hash(text)
+        with self._lock:
+            existing = self._sources.get(source)
+            if existing is not None and existing[0] == digest:
+                self._sources.move_to_end(source)
+                return len(existing[1])
+            self._remove(source)
+            chunks = chunk_text(text)
+            for number, chunk in enumerate(chunks):
+                chunk_id = self._chunk_id(source, number)
+                self.index.add_document(chunk_id, chunk)
+                self._chunk_ids[chunk_id] = (source, number)
+            self._sources[source] = (digest, chunks)
+            while len(self._sources) > self.max_sources:
+                self._remove(next(iter(self._sources)))
+            return len(chunks)
+
+    def _remove(self, source: str):
+        existing = self._sources.pop(source, None)
+        if existing is None:
+            return
+        for number in range(len(existing[1])):
+            chunk_id = self._chunk_id(source, number)
+            self.index.remove_document(chunk_id)
+            self._chunk_ids.pop(chunk_id, None)
+
+    def remove(self, sources: Iterable[str]):
+        with self._lock:
+            for source in sources:
+                self._remove(source)
+
+    def rank(self, query: str, sources: Optional[List[str]] = None) -> List[Tuple[str, int, str, float]]:
+        """
+        [(source, số thứ tự chunk, text, điểm BM25)]: chunk khớp câu hỏi trước (điểm giảm dần),
+        sau đó các chunk còn lại theo thứ tự trong văn bản (điểm 0)
+        """
+        with self._lock:
+            wanted = set(sources) if sources is not None else set(self._sources)
+            ranked, seen = [], set()
+            for chunk_id, score in self.index.search(query):
+                source, number = self._chunk_ids[chunk_id]
+                if source in wanted:
+                    ranked.append((source, number, self._sources[source][1][number], score))
+                    seen.add(chunk_id)
+            order = sources if sources is not None else list(self._sources)
+            for source in order:
+                if source not in self._sources:
+                    continue
+                for number, chunk in enumerate(self._sources[source][1]):
+                    if self._chunk_id(source, number) not in seen:
+                        ranked.append((source, number, chunk, 0.0))
+            return ranked
+
+
+def build_context(store: ChunkStore, query: str, token_budget: int, count_tokens: Callable[[str], int],
+                  sources: Optional[List[str]] = None) -> str:
+    """
+    Chọn các chunk điểm cao nhất sao cho tổng số token (đếm bằng tokenizer của model)
+    không vượt token_budget, rồi sắp lại theo thứ tự source / vị trí trong văn bản.
+    """
+    selected, used = [], 0
+    for source, number, chunk, _ in store.rank(query, sources):
+        block = f"[{source} - đoạn {number + 1}]\n{chunk}"
+        cost = count_tokens(block)
+        if used + cost > token_budget:
+            # Còn quá ít chỗ thì không cần đếm token các chunk còn lại
+            if token_budget - used < MIN_REMAINING_TOKENS:
+                break
+            continue
+        selected.append((source, number, block))
+        used += cost
+    order = {source: i for i, source in enumerate(sources or [])}
+    selected.sort(key=lambda item: (order.get(item[0], len(order)), item[0], item[1]))
+    logger.info(f"Context: {len(selected)} chunk, {used}/{token_budget} token")
+    return "\n\n".join(block for _, _, block in selected)
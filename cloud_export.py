@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Cloud Export
+Gửi metadata lên MCP Cloud theo lô NDJSON (POST /upload-metadata/bulk).
+Các lô được gửi song song qua một requests.Session dùng chung (giữ kết nối keep-alive),
+có timeout, tự thử lại khi lỗi mạng / 429 / 5xx và báo lỗi riêng cho từng lô.
+"""
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (MCP_CLOUD_API_URL, EXPORT_BATCH_SIZE, EXPORT_CONCURRENCY, EXPORT_CONTENT_CHARS,
+                    EXPORT_MAX_RETRIES, EXPORT_TIMEOUT_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+BULK_PATH = "/upload-metadata/bulk"
+
+
+def metadata_record(metadata) -> Dict[str, Any]:
+    """Bản ghi gửi lên cloud từ FileMetadata"""
+    return {
+        "filename": metadata.filename,
+        "label": metadata.label,
+        "content": metadata.content_preview[:EXPORT_CONTENT_CHARS],
+        "timestamp": None,
+    }
+
+
+def to_ndjson(records: Iterable[Dict[str, Any]]) -> bytes:
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+
+
+def make_session(pool_size: int = EXPORT_CONCURRENCY, max_retries: int = EXPORT_MAX_RETRIES) -> requests.Session:
+    """Session có connection pool đủ cho pool_size request song song và retry có backoff"""
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"POST"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _send_batch(session: requests.Session, url: str, index: int, batch: List[Dict[str, Any]],
+                timeout: float) -> Dict[str, Any]:
+    report = {"batch": index, "count": len(batch), "accepted": 0, "rejected": [], "error": None}
+    try:
+        response = session.post(url, data=to_ndjson(batch), timeout=timeout,
+                                headers={"Content-Type": "application/x-ndjson"})
+        response.raise_for_status()
+        body = response.json()
+        report["accepted"] = body.get("accepted", 0)
+        # Dòng lỗi do server báo theo số thứ tự trong lô -> đổi sang tên file
+        report["rejected"] = [
+            {"filename": batch[r["line"]]["filename"], "error": r.get("error")}
+            for r in body.get("rejected", []) if 0 <= r.get("line", -1) < len(batch)
+        ]
+    except (requests.exceptions.RequestException, ValueError) as e:
+        report["error"] = str(e)
+        logger.error(f"Lô {index} ({len(batch)} bản ghi) gửi thất bại: {e}")
+    return report
+
+
+def export_metadata_bulk(records: List[Dict[str, Any]], base_url: str = MCP_CLOUD_API_URL,
+                         batch_size: int = EXPORT_BATCH_SIZE, concurrency: int = EXPORT_CONCURRENCY,
+                         timeout: float = EXPORT_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """
+    Chia records thành lô batch_size bản ghi, gửi tối đa `concurrency` lô cùng lúc.
+    Trả về {"success", "total_files", "sent", "failed", "error", "batches": [báo cáo từng lô]}.
+    """
+    url = base_url.rstrip("/") + BULK_PATH
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    with make_session(concurrency) as session, ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        reports = list(pool.map(lambda item: _send_batch(session, url, item[0], item[1], timeout),
+                                enumerate(batches)))
+
+    sent = sum(r["accepted"] for r in reports)
+    failed = len(records) - sent
+    logger.info(f"Xuất metadata: {sent}/{len(records)} bản ghi, {len(batches)} lô, {failed} lỗi")
+    return {
+        "success": failed == 0,
+        "total_files": len(records),
+        "sent": sent,
+        "failed": failed,
+        "error": f"{failed}/{len(records)} bản ghi gửi thất bại" if failed else None,
+        "batches": reports,
+    }
@@ -11,6 +11,22 @@ MODEL_REPO_ID = "QuantFactory/Meta-Llama-3-8B-Instruct-GGUF"
 MODEL_FILENAME = "Meta-Llama-3-8B-Instruct.Q4_K_M.gguf"
 MODEL_DIR = "../models"
 
+# Lưu KV-cache của phần prompt tĩnh (planner, detect_intent) để chỉ evaluate phần đuôi
+PREFIX_CACHE_ENABLED = True
+
+# Sinh ActionPlan dưới grammar sinh từ JSON schema (luôn parse được, không cần retry)
+PLAN_GRAMMAR_ENABLED = True
+
+# Số context llama.cpp chạy song song (dùng chung weights mmap, mỗi context có KV-cache ~1GB với n_ctx=8192)
+LLM_POOL_SIZE = 1
+# Số thread CPU của mỗi context (tổng ~ LLM_POOL_SIZE * LLM_THREADS_PER_CONTEXT <= số core)
+LLM_THREADS_PER_CONTEXT = 8
+
+# Model embedding GGUF (đa ngôn ngữ, chạy CPU) cho tìm kiếm ngữ nghĩa, đặt trong MODEL_DIR
+EMBEDDING_MODEL_FILENAME = "bge-m3-Q4_K_M.gguf"
+EMBEDDING_N_CTX = 512        # số token tối đa của một chunk khi embedding
+EMBEDDING_BATCH_SIZE = 16
+
 def get_model_path():
     """Lấy đường dẫn model"""
     return os.path.join(MODEL_DIR, MODEL_FILENAME)
@@ -22,6 +38,83 @@ def get_model_path():
 SUPPORTED_EXTENSIONS = ['.pdf', '.docx', '.doc', '.pptx', '.ppt', '.txt' , 'xlsx' , 'xls']
 CONTENT_PREVIEW_LIMIT = 1000
 
+# Thư mục cache cục bộ (index, nội dung đã trích xuất, ...)
+CACHE_DIR = ".cache"
+
+# Index lưu trên đĩa: khởi động lại chỉ trích xuất file có (size, mtime) thay đổi
+INDEX_DB_PATH = os.path.join(CACHE_DIR, "file_index.db")
+
+# Số process trích xuất nội dung song song khi quét (1 = tuần tự)
+SCAN_WORKERS = os.cpu_count() or 1
+# Chỉ dùng process pool khi số file cần trích xuất đủ lớn để bù chi phí khởi tạo
+PARALLEL_SCAN_MIN_FILES = 8
+
+# Tìm kiếm toàn văn (BM25): số kết quả tối đa và ngưỡng điểm so với kết quả tốt nhất
+SEARCH_TOP_K = 20
+SEARCH_MIN_SCORE_RATIO = 0.3
+
+# Watcher: cập nhật index theo thay đổi filesystem thay vì quét lại
+WATCH_ENABLED = False
+WATCH_DEBOUNCE_SECONDS = 2.0    # chờ hết đợt thay đổi (vd. copy hàng loạt) rồi mới cập nhật
+WATCH_MAX_DELAY_SECONDS = 30.0  # đợt thay đổi kéo dài quá lâu thì vẫn cập nhật
+WATCH_POLL_INTERVAL = 5.0       # chu kỳ polling khi không có watchdog
+
+# Cache toàn văn đã trích xuất (LRU trong bộ nhớ + blob nén trên đĩa)
+CONTENT_CACHE_DIR = os.path.join(CACHE_DIR, "content")
+CONTENT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Phân loại theo chủ đề: gom nhiều tài liệu vào một prompt
+CLASSIFY_EXCERPT_CHARS = 2000        # số ký tự lấy từ mỗi tài liệu (đầu + cuối)
+CLASSIFY_BATCH_TOKEN_BUDGET = 4096   # số token tối đa của prompt mỗi lô (n_ctx = 8192)
+CLASSIFY_BATCH_MAX_DOCS = 8
+# Tăng khi sửa prompt phân loại trong llm_utils để bỏ các verdict đã cache
+CLASSIFY_PROMPT_VERSION = 1
+
+# Cache verdict phân loại theo (hash nội dung, chủ đề, model, phiên bản prompt)
+VERDICT_CACHE_DB_PATH = os.path.join(CACHE_DIR, "verdicts.db")
+VERDICT_CACHE_MAX_ENTRIES = 100000
+
+# Router nhanh trước planner: yêu cầu rõ ràng (trigger word, tên file) không cần gọi LLM
+ROUTER_ENABLED = True
+# Model từ khóa học từ các plan của LLM (naive Bayes, lưu JSON)
+ROUTER_MODEL_PATH = os.path.join(CACHE_DIR, "router_model.json")
+ROUTER_MODEL_MIN_CONFIDENCE = 0.8   # xác suất tối thiểu để model phủ quyết rule / tự định tuyến
+ROUTER_MODEL_MIN_SAMPLES = 20       # số plan đã học tối thiểu trước khi tin model
+
+# Cache ActionPlan của planner LLM theo prompt chuẩn hóa + hash user_feedback.txt
+PLAN_CACHE_ENABLED = True
+PLAN_CACHE_MAX_ENTRIES = 256
+PLAN_CACHE_TTL_SECONDS = 24 * 3600
+PLAN_CACHE_SIMILARITY = 0.9   # độ tương đồng trigram tối thiểu để dùng plan của prompt gần giống
+
+# Vector index (tìm kiếm ngữ nghĩa trên chunk toàn văn)
+VECTOR_INDEX_DIR = os.path.join(CACHE_DIR, "vectors")
+VECTOR_DTYPE = "float16"      # "float16" hoặc "int8" (nhỏ bằng một nửa, sai số điểm ~1%)
+VECTOR_MMAP = True            # mmap ma trận vector khi nạp thay vì đọc hết vào RAM
+VECTOR_CHUNK_CHARS = 1200
+VECTOR_CHUNK_OVERLAP = 200
+VECTOR_ANN_MIN_ROWS = 20000   # từ số chunk này trở lên dùng IVF thay vì so toàn bộ ma trận
+VECTOR_ANN_PROBES = 8         # số cụm IVF duyệt mỗi truy vấn
+VECTOR_SAVE_DELAY_SECONDS = 30  # watcher: gom các thay đổi vector trong khoảng này rồi mới ghi lại ma trận
+SEMANTIC_TOP_K = 10
+SEMANTIC_MIN_SCORE = 0.35     # điểm cosine tối thiểu
+# Tóm tắt map-reduce: tóm tắt từng chunk lớn rồi gộp dần các tóm tắt đến khi còn một
+SUMMARY_CHUNK_CHARS = 6000            # độ dài mỗi chunk ở bước map
+SUMMARY_CHUNK_MAX_TOKENS = 256        # độ dài tối đa tóm tắt của một chunk
+SUMMARY_REDUCE_TOKEN_BUDGET = 3000    # số token tối đa của các tóm tắt gộp trong một lần reduce
+SUMMARY_FINAL_MAX_TOKENS = 512
+# Tăng khi sửa prompt tóm tắt trong summarizer để bỏ các tóm tắt đã cache
+SUMMARY_PROMPT_VERSION = 1
+SUMMARY_CACHE_DB_PATH = os.path.join(CACHE_DIR, "summaries.db")
+SUMMARY_CACHE_MAX_ENTRIES = 50000
+
+# Ngữ cảnh cho bước general: chỉ lấy chunk liên quan nhất trong giới hạn token (n_ctx = 8192)
+GENERAL_CONTEXT_TOKEN_BUDGET = 3000
+GENERAL_CONTEXT_MAX_FILES = 5     # số file kết quả tìm kiếm tối đa được đưa vào ngữ cảnh
+CHUNK_STORE_MAX_SOURCES = 64      # số văn bản giữ chunk trong bộ nhớ (LRU)
+# Tìm kiếm kết hợp BM25 + vector: hằng số k của reciprocal rank fusion
+HYBRID_RRF_K = 60
+
 # Từ khóa phân loại
 CATEGORY_KEYWORDS = {
     "A": ["kế hoạch", "plan", "chiến lược", "strategy"],
@@ -31,6 +124,42 @@ CATEGORY_KEYWORDS = {
     "E": ["khác", "other", "miscellaneous", "miscellany"]
 }
 
+# =============================================================================
+# CẤU HÌNH MCP CLOUD
+# =============================================================================
+
+MCP_CLOUD_API_URL = "http://localhost:8000"
+# Xuất metadata theo lô NDJSON lên /upload-metadata/bulk
+EXPORT_BATCH_SIZE = 500          # số bản ghi mỗi lô
+EXPORT_CONCURRENCY = 4           # số lô gửi song song (cũng là kích thước connection pool)
+EXPORT_MAX_RETRIES = 3           # số lần thử lại khi lỗi mạng / 429 / 5xx
+EXPORT_TIMEOUT_SECONDS = 30
+EXPORT_CONTENT_CHARS = 500       # số ký tự nội dung gửi kèm mỗi file
+# Backend lưu metadata phía cloud: "jsonl" (file append-only + index offset trong bộ nhớ) hoặc "sqlite" (WAL)
+METADATA_STORAGE_BACKEND = "jsonl"
+METADATA_STORE_DIR = "metadata_store"
+# Compact log metadata: mỗi filename giữ bản mới nhất + METADATA_KEEP_VERSIONS bản cũ khác nội dung
+METADATA_KEEP_VERSIONS = 0
+METADATA_COMPACT_INTERVAL_SECONDS = 600
+METADATA_COMPACT_MIN_RATIO = 2.0  # chỉ compact khi số bản ghi >= tỉ lệ này x số bản cần giữ
+# Phân trang GET /metadata
+METADATA_PAGE_SIZE = 100         # số bản ghi mặc định mỗi trang
+METADATA_PAGE_MAX = 1000         # số bản ghi tối đa mỗi trang
+# Ghi metadata qua một hàng đợi duy nhất, gom các request đang chờ thành một lần ghi (group commit)
+METADATA_DURABILITY_WINDOW_SECONDS = 0.05  # fsync tối đa mỗi khoảng này; 0 = fsync trước khi trả lời mỗi lần ghi
+METADATA_COMMIT_MAX_BATCH = 1000           # số bản ghi tối đa mỗi lần ghi
+
+# =============================================================================
+# CẤU HÌNH HÀNG ĐỢI LLM
+# =============================================================================
+
+# Số request tối đa đang chờ model; vượt quá thì báo bận thay vì xếp hàng vô hạn
+LLM_QUEUE_MAX_PENDING = 8
+# Số request tối đa của một session (đang chờ + đang chạy)
+LLM_QUEUE_MAX_PER_SESSION = 2
+# Số session giữ trạng thái AgenticProcessor trong bộ nhớ
+SESSION_STATE_MAX = 100
+
 # =============================================================================
 # CẤU HÌNH UI - Cơ bản
 # =============================================================================
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Content Cache
+Cache nội dung đã trích xuất của tài liệu: LRU trong bộ nhớ (giới hạn theo byte)
+và blob nén zlib trên đĩa. Mỗi file chỉ phải parse lại khi (mtime, size) thay đổi.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from config import CONTENT_CACHE_DIR, CONTENT_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_LEVEL = 6
+
+
+class ContentCache:
+    """Cache toàn văn theo đường dẫn + fingerprint (mtime, size)"""
+
+    def __init__(self, cache_dir: str = CONTENT_CACHE_DIR, max_memory_bytes: int = CONTENT_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_memory_bytes = max_memory_bytes
+        self._memory: "OrderedDict[str, Tuple[Tuple[int, int], str, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _fingerprint(stat: os.stat_result) -> Tuple[int, int]:
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _blob_path(self, key: str) -> Path:
+        # Một blob cho mỗi đường dẫn: bản cũ bị ghi đè khi file thay đổi
+        return self.cache_dir / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".z")
+
+    def _remember(self, key: str, fingerprint: Tuple[int, int], text: str):
+        """Đưa vào LRU bộ nhớ, đẩy các mục cũ nhất ra khi vượt giới hạn"""
+        size = sys.getsizeof(text)
+        if size > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[2]
+        self._memory[key] = (fingerprint, text, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, _, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def _read_blob(self, key: str, fingerprint: Tuple[int, int]) -> Optional[str]:
+        blob_path = self._blob_path(key)
+        try:
+            raw = zlib.decompress(blob_path.read_bytes()).decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Blob cache hỏng {blob_path}: {e}")
+            return None
+        header, _, text = raw.partition("\n")
+        try:
+            if tuple(json.loads(header)) != fingerprint:
+                return None
+        except (json.JSONDecodeError, TypeError):
+            return None
+        return text
+
+    def _write_blob(self, key: str, fingerprint: Tuple[int, int], text: str):
+        blob_path = self._blob_path(key)
+        tmp_path = blob_path.with_suffix(".tmp")
+        try:
+            payload = json.dumps(list(fingerprint)) + "\n" + text
+            tmp_path.write_bytes(zlib.compress(payload.encode("utf-8"), COMPRESS_LEVEL))
+            os.replace(tmp_path, blob_path)
+        except Exception as e:
+            logger.warning(f"Không ghi được blob cache {blob_path}: {e}")
+
+    def lookup(self, filepath: Path, fingerprint: Optional[Tuple[int, int]] = None) -> Optional[str]:
+        """Tìm nội dung trong bộ nhớ rồi trên đĩa; None nếu chưa có hoặc file đã thay đổi"""
+        key = str(Path(filepath).absolute())
+        if fingerprint is None:
+            try:
+                fingerprint = self._fingerprint(os.stat(key))
+            except OSError:
+                return None
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return entry[1]
+
+        text = self._read_blob(key, fingerprint)
+        with self._lock:
+            if text is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._remember(key, fingerprint, text)
+        return text
+
+    def get(self, filepath: Path, loader: Callable[[Path], str]) -> str:
+        """Lấy nội dung từ cache, nếu không có thì gọi loader (parse file) rồi lưu lại"""
+        try:
+            fingerprint = self._fingerprint(os.stat(Path(filepath).absolute()))
+        except OSError:
+            return loader(filepath)
+
+        text = self.lookup(filepath, fingerprint)
+        if text is None:
+            text = loader(filepath)
+            self.put(filepath, text, fingerprint)
+        return text
+
+    def put(self, filepath: Path, text: str, fingerprint: Optional[Tuple[int, int]] = None):
+        """Lưu nội dung vừa trích xuất (vd. kết quả từ process pool khi quét)"""
+        key = str(Path(filepath).absolute())
+        if fingerprint is None:
+            try:
+                fingerprint = self._fingerprint(os.stat(key))
+            except OSError:
+                return
+        with self._lock:
+            self._remember(key, fingerprint, text)
+        self._write_blob(key, fingerprint, text)
+
+    def invalidate(self, filepath: str):
+        """Xóa nội dung của file đã bị xóa"""
+        key = str(Path(filepath).absolute())
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_bytes -= entry[2]
+        try:
+            self._blob_path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, float]:
+        """Thống kê hit rate và dung lượng bộ nhớ"""
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._memory)
+            memory_bytes = self._memory_bytes
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        return {
+            **counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": entries,
+            "memory_bytes": memory_bytes,
+            "memory_limit_bytes": self.max_memory_bytes,
+        }
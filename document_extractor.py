@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Document Extractor
+Trích xuất text từ file PDF, Word, PowerPoint, TXT.
+Module chỉ phụ thuộc thư viện đọc file để chạy được trong process worker
+(không import MCP hay model LLM).
+"""
+
+import logging
+from pathlib import Path
+from typing import Optional, Tuple
+
+from config import CONTENT_PREVIEW_LIMIT
+
+# Import thư viện xử lý file
+try:
+    import PyPDF2
+    import docx
+    from pptx import Presentation
+except ImportError:
+    print("Cài đặt thêm: pip install PyPDF2 python-docx python-pptx")
+
+logger = logging.getLogger(__name__)
+
+
+def _truncate(text: str, limit: Optional[int]) -> str:
+    return text if limit is None else text[:limit]
+
+
+def extract_text_from_pdf(filepath: Path, limit: Optional[int] = CONTENT_PREVIEW_LIMIT) -> str:
+    """Trích xuất text từ file PDF"""
+    try:
+        with open(filepath, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            text = ""
+            for page in reader.pages:
+                text += (page.extract_text() or "") + "\n"
+            return _truncate(text, limit)
+    except Exception as e:
+        logger.error(f"Lỗi đọc PDF {filepath}: {e}")
+        return ""
+
+
+def extract_text_from_docx(filepath: Path, limit: Optional[int] = CONTENT_PREVIEW_LIMIT) -> str:
+    """Trích xuất text từ file Word"""
+    try:
+        doc = docx.Document(filepath)
+        text = ""
+        for paragraph in doc.paragraphs:
+            text += paragraph.text + "\n"
+        return _truncate(text, limit)
+    except Exception as e:
+        logger.error(f"Lỗi đọc DOCX {filepath}: {e}")
+        return ""
+
+
+def extract_text_from_pptx(filepath: Path, limit: Optional[int] = CONTENT_PREVIEW_LIMIT) -> str:
+    """Trích xuất text từ file PowerPoint"""
+    try:
+        prs = Presentation(filepath)
+        text = ""
+        for slide in prs.slides:
+            for shape in slide.shapes:
+                if hasattr(shape, "text"):
+                    text += shape.text + "\n"
+        return _truncate(text, limit)
+    except Exception as e:
+        logger.error(f"Lỗi đọc PPTX {filepath}: {e}")
+        return ""
+
+
+def extract_text_from_txt(filepath: Path, limit: Optional[int] = CONTENT_PREVIEW_LIMIT) -> str:
+    """Trích xuất text từ file TXT"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as file:
+            text = file.read()
+            return _truncate(text, limit)
+    except Exception as e:
+        logger.error(f"Lỗi đọc TXT {filepath}: {e}")
+        return ""
+
+
+def extract_content(filepath: Path, limit: Optional[int] = CONTENT_PREVIEW_LIMIT) -> str:
+    """Trích xuất nội dung từ file dựa trên extension (limit=None: toàn bộ nội dung)"""
+    extension = filepath.suffix.lower()
+
+    if extension == '.pdf':
+        return extract_text_from_pdf(filepath, limit)
+    elif extension in ['.docx', '.doc']:
+        return extract_text_from_docx(filepath, limit)
+    elif extension in ['.pptx', '.ppt']:
+        return extract_text_from_pptx(filepath, limit)
+    elif extension == '.txt':
+        return extract_text_from_txt(filepath, limit)
+    else:
+        return ""
+
+
+def extract_worker(filepath: str) -> Tuple[str, str]:
+    """Hàm chạy trong process pool: trả về (filepath, toàn bộ nội dung)"""
+    return filepath, extract_content(Path(filepath), limit=None)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Filesystem Watcher
+Theo dõi thư mục và cập nhật index của FileIndexer theo từng thay đổi (tạo/sửa/xóa/đổi tên),
+không cần quét lại toàn bộ. Dùng watchdog (inotify trên Linux) nếu có, nếu không thì polling.
+"""
+
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from config import SUPPORTED_EXTENSIONS, WATCH_DEBOUNCE_SECONDS, WATCH_MAX_DELAY_SECONDS, WATCH_POLL_INTERVAL
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    FileSystemEventHandler = object
+    WATCHDOG_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Chuyển event của watchdog thành thay đổi chờ xử lý"""
+
+    def __init__(self, watcher: "IndexWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        self.watcher.record(event.src_path, UPSERT, event.is_directory)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.record(event.src_path, UPSERT)
+
+    def on_deleted(self, event):
+        self.watcher.record(event.src_path, DELETE, event.is_directory)
+
+    def on_moved(self, event):
+        self.watcher.record(event.src_path, DELETE, event.is_directory)
+        self.watcher.record(event.dest_path, UPSERT, event.is_directory)
+
+
+class IndexWatcher:
+    """Gom các thay đổi filesystem (debounce) rồi áp dụng vào FileIndexer theo lô"""
+
+    def __init__(self, indexer, directory: str = ".", debounce: float = WATCH_DEBOUNCE_SECONDS,
+                 max_delay: float = WATCH_MAX_DELAY_SECONDS, poll_interval: float = WATCH_POLL_INTERVAL,
+                 use_polling: bool = False):
+        self.indexer = indexer
+        self.directory = Path(directory).absolute()
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.use_polling = use_polling or not WATCHDOG_AVAILABLE
+        self.supported_extensions = set(SUPPORTED_EXTENSIONS)
+
+        self._pending: Dict[str, str] = {}
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._observer = None
+        self._threads = []
+        self.stats = {"events": 0, "batches": 0, "updated": 0, "removed": 0}
+
+    @property
+    def mode(self) -> str:
+        return "polling" if self.use_polling else "watchdog"
+
+    def record(self, path: str, action: str, is_directory: bool = False):
+        """Ghi nhận một thay đổi; thay đổi sau cùng của cùng đường dẫn được giữ lại"""
+        path = os.path.abspath(path)
+        if not is_directory and Path(path).suffix.lower() not in self.supported_extensions:
+            return
+        with self._cond:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_event = now
+            self._last_event = now
+            self._pending[path] = action
+            self.stats["events"] += 1
+            self._cond.notify()
+
+    def _take_batch(self) -> Optional[Dict[str, str]]:
+        """Chờ đến khi hết đợt thay đổi (debounce) hoặc quá max_delay rồi lấy cả lô"""
+        with self._cond:
+            while not self._stop.is_set():
+                if not self._pending:
+                    self._cond.wait(timeout=1.0)
+                    continue
+                now = time.monotonic()
+                quiet_for = now - self._last_event
+                waited = now - self._first_event
+                if quiet_for >= self.debounce or waited >= self.max_delay:
+                    batch, self._pending = self._pending, {}
+                    return batch
+                self._cond.wait(timeout=min(self.debounce - quiet_for, self.max_delay - waited))
+        return None
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if not batch:
+                continue
+            upserts = [path for path, action in batch.items() if action == UPSERT]
+            deletes = [path for path, action in batch.items() if action == DELETE]
+            try:
+                result = self.indexer.apply_changes(upserts, deletes)
+                self.stats["batches"] += 1
+                self.stats["updated"] += result["updated"]
+                self.stats["removed"] += result["removed"]
+            except Exception as e:
+                logger.error(f"Lỗi cập nhật index từ watcher: {e}")
+
+    def _snapshot(self) -> Dict[str, Tuple[int, float]]:
+        """Fingerprint (size, mtime) của các file được hỗ trợ trong thư mục"""
+        snapshot = {}
+        for filepath in self.directory.rglob("*"):
+            if filepath.suffix.lower() not in self.supported_extensions:
+                continue
+            try:
+                stat = filepath.stat()
+                if filepath.is_file():
+                    snapshot[str(filepath)] = (stat.st_size, stat.st_mtime)
+            except OSError:
+                continue
+        return snapshot
+
+    def _poll_loop(self):
+        """Fallback khi không có watchdog: so sánh snapshot định kỳ"""
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            for path, fingerprint in current.items():
+                if previous.get(path) != fingerprint:
+                    self.record(path, UPSERT)
+            for path in previous.keys() - current.keys():
+                self.record(path, DELETE)
+            previous = current
+
+    def start(self):
+        """Bắt đầu theo dõi thư mục"""
+        self._stop.clear()
+        flusher = threading.Thread(target=self._flush_loop, name="index-watcher-flush", daemon=True)
+        flusher.start()
+        self._threads = [flusher]
+
+        if self.use_polling:
+            poller = threading.Thread(target=self._poll_loop, name="index-watcher-poll", daemon=True)
+            poller.start()
+            self._threads.append(poller)
+        else:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), str(self.directory), recursive=True)
+            self._observer.start()
+
+        logger.info(f"Watcher ({self.mode}) đang theo dõi {self.directory}")
+
+    def stop(self):
+        """Dừng theo dõi"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        logger.info("Watcher đã dừng")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Index Store
+Lưu index file xuống SQLite để lần khởi động sau không phải trích xuất lại toàn bộ tài liệu
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+from config import INDEX_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class IndexStore:
+    """Lưu metadata file theo đường dẫn tuyệt đối, kèm fingerprint (size, mtime)"""
+
+    def __init__(self, db_path: str = INDEX_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                metadata TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS doc_terms (
+                path TEXT PRIMARY KEY,
+                counts TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def load_all(self) -> Dict[str, dict]:
+        """Đọc toàn bộ metadata đã lưu: {path: metadata_dict}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, metadata FROM files").fetchall()
+        result = {}
+        for path, raw in rows:
+            try:
+                result[path] = json.loads(raw)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Bỏ qua bản ghi index hỏng {path}: {e}")
+        return result
+
+    def put(self, path: str, size: int, mtime: float, metadata: dict):
+        """Ghi (hoặc cập nhật) metadata của một file"""
+        self.put_many([(path, size, mtime, metadata)])
+
+    def put_many(self, records: Iterable[Tuple[str, int, float, dict]]):
+        """Ghi nhiều bản ghi (path, size, mtime, metadata) trong một transaction"""
+        rows = [
+            (path, size, mtime, json.dumps(metadata, ensure_ascii=False))
+            for path, size, mtime, metadata in records
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime, metadata) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def load_term_counts(self) -> Dict[str, Dict[str, int]]:
+        """Đọc term counts của inverted index: {path: {term: tf}}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, counts FROM doc_terms").fetchall()
+        result = {}
+        for path, raw in rows:
+            try:
+                result[path] = json.loads(raw)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Bỏ qua term counts hỏng {path}: {e}")
+        return result
+
+    def put_term_counts(self, records: Iterable[Tuple[str, Dict[str, int]]]):
+        """Ghi term counts (path, counts) của các file vừa trích xuất"""
+        rows = [(path, json.dumps(counts, ensure_ascii=False)) for path, counts in records]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO doc_terms (path, counts) VALUES (?, ?)", rows
+            )
+            self._conn.commit()
+
+    def delete_many(self, paths: Iterable[str]):
+        """Xóa các file không còn tồn tại khỏi index"""
+        paths = [(p,) for p in paths]
+        if not paths:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", paths)
+            self._conn.executemany("DELETE FROM doc_terms WHERE path = ?", paths)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+LLM Cache
+Cache kết quả LLM trên SQLite theo khóa (hash nội dung, khóa phụ, model, phiên bản prompt),
+đẩy các mục lâu không dùng ra khi vượt max_entries. Dùng chung cho VerdictCache và SummaryCache.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResultCache:
+    """
+    Bảng `table` gồm (content_hash, key_column, model_id, prompt_version, value_column, last_used).
+    Lớp con đổi _encode/_decode (kiểu giá trị) và _normalize_key (khóa phụ) nếu cần.
+    """
+
+    def __init__(self, db_path: str, table: str, key_column: str, value_column: str, value_type: str,
+                 model_id: str, prompt_version: str, max_entries: int):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.key_column = key_column
+        self.value_column = value_column
+        self.model_id = model_id
+        self.prompt_version = str(prompt_version)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evicted": 0}
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                content_hash TEXT NOT NULL,
+                {key_column} TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                {value_column} {value_type} NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (content_hash, {key_column}, model_id, prompt_version)
+            )
+            """
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table} (last_used)")
+        self._conn.commit()
+        self.invalidate_stale()
+
+    def _normalize_key(self, key: str) -> str:
+        return key
+
+    def _encode(self, value: Any) -> Any:
+        return value
+
+    def _decode(self, raw: Any) -> Any:
+        return raw
+
+    def invalidate_stale(self) -> int:
+        """Xóa kết quả của model/prompt cũ (đổi MODEL_FILENAME hoặc tăng phiên bản prompt)"""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE model_id != ? OR prompt_version != ?",
+                (self.model_id, self.prompt_version),
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Đã xóa {cursor.rowcount} mục {self.table} của model/prompt cũ")
+        return cursor.rowcount
+
+    def get_many(self, hashes: Iterable[str], key: str) -> Dict[str, Any]:
+        """Lấy kết quả đã lưu: {content_hash: giá trị}"""
+        hashes = list(dict.fromkeys(hashes))
+        key = self._normalize_key(key)
+        found: Dict[str, Any] = {}
+        with self._lock:
+            # Chia nhỏ để không vượt giới hạn số tham số của SQLite
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, {self.value_column} FROM {self.table} WHERE {self.key_column} = ? "
+                    f"AND model_id = ? AND prompt_version = ? AND content_hash IN ({placeholders})",
+                    (key, self.model_id, self.prompt_version, *chunk),
+                ).fetchall()
+                found.update((h, self._decode(v)) for h, v in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    f"UPDATE {self.table} SET last_used = ? WHERE content_hash = ? AND {self.key_column} = ? "
+                    "AND model_id = ? AND prompt_version = ?",
+                    [(now, h, key, self.model_id, self.prompt_version) for h in found],
+                )
+                self._conn.commit()
+            self._counters["hits"] += len(found)
+            self._counters["misses"] += len(hashes) - len(found)
+        return found
+
+    def put_many(self, values: Dict[str, Any], key: str):
+        """Lưu kết quả mới rồi dọn bớt nếu vượt max_entries"""
+        if not values:
+            return
+        key = self._normalize_key(key)
+        now = time.time()
+        rows = [(h, key, self.model_id, self.prompt_version, self._encode(v), now) for h, v in values.items()]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} "
+                f"(content_hash, {self.key_column}, model_id, prompt_version, {self.value_column}, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Xóa các mục lâu không dùng nhất (gọi khi đang giữ lock)"""
+        total = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        excess = total - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE rowid IN (SELECT rowid FROM {self.table} ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._counters["evicted"] += excess
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counters = dict(self._counters)
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,12 +1,17 @@
 import json
 import os
 import re
+from typing import Iterator
 from llama_cpp import Llama
 import logging
 
 # Import cấu hình đơn giản
-from config import MODEL_DIR, MODEL_FILENAME, get_model_path
+from config import (MODEL_DIR, MODEL_FILENAME, PREFIX_CACHE_ENABLED, LLM_POOL_SIZE,
+                    LLM_THREADS_PER_CONTEXT, get_model_path)
 from helper import extract_json_from_text
+from prompt_cache import PromptPrefixCache
+from model_loader import LazyModel, run_in_background
+from model_pool import ModelPool
 
 # Import MCP filesystem client
 try:
@@ -22,104 +27,186 @@ logger = logging.getLogger(__name__)
 # Đường dẫn model từ config
 MODEL_PATH = get_model_path()
 
-# Kiểm tra file mô hình
-if not os.path.exists(MODEL_PATH):
-    raise FileNotFoundError(f"Model file not found at: {MODEL_PATH}")
+def load_model() -> Llama:
+    """Tạo một context từ file GGUF (weights được mmap, các context trong pool dùng chung)"""
+    # Kiểm tra file mô hình
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"Model file not found at: {MODEL_PATH}")
 
-# Khởi tạo mô hình
-try:
-    llm = Llama(
-        model_path=MODEL_PATH,
-        n_ctx=8192,
-        n_threads=8,
-        n_batch=128,
-        use_mlock=True,
-        verbose=False,
-        chat_format="llama-3"
-    )
-    logger.info(f"Model loaded: {MODEL_FILENAME}")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    raise
-
-# Khởi tạo MCP Filesystem
-if MCP_AVAILABLE:
     try:
-        initialize_filesystem()
-        logger.info("MCP Filesystem initialized")
+        model = Llama(
+            model_path=MODEL_PATH,
+            n_ctx=8192,
+            n_threads=LLM_THREADS_PER_CONTEXT,
+            n_batch=128,
+            use_mlock=True,
+            verbose=False,
+            chat_format="llama-3"
+        )
+        logger.info(f"Model loaded: {MODEL_FILENAME}")
+        return model
     except Exception as e:
-        logger.warning(f"MCP Filesystem initialization failed: {e}")
-        MCP_AVAILABLE = False
+        print(f"Error loading model: {e}")
+        raise
 
+# Pool context được tải ở background, lần dùng đầu tiên sẽ chờ đến khi tải xong
+llm = LazyModel(lambda: ModelPool(load_model, LLM_POOL_SIZE), name=MODEL_FILENAME)
+llm.warm()
 
-#===================== detect_intent =====================
+# KV-cache của các prompt tĩnh (planner, detect_intent)
+prefix_cache = PromptPrefixCache(llm, enabled=PREFIX_CACHE_ENABLED)
 
-def detect_intent(prompt: str) -> tuple:
-    """Detect user intent from prompt and return a list of actions"""
+def _initialize_filesystem() -> bool:
+    ok = initialize_filesystem()
+    if ok:
+        logger.info("MCP Filesystem initialized")
+    else:
+        logger.warning("MCP Filesystem initialization failed")
+    return ok
+
+# Quét file ban đầu ở background (index đã lưu trên đĩa vẫn dùng được trong lúc quét)
+filesystem_ready = run_in_background("filesystem-init", _initialize_filesystem) if MCP_AVAILABLE else None
+
+def readiness_status() -> dict:
+    """Trạng thái khởi động của model và filesystem index"""
+    if filesystem_ready is None:
+        filesystem = {"state": "disabled"}
+    elif not filesystem_ready.done():
+        filesystem = {"state": "scanning"}
+    elif filesystem_ready.exception() is None and filesystem_ready.result():
+        filesystem = {"state": "ready"}
+    else:
+        filesystem = {"state": "failed"}
+    return {"model": llm.status(), "filesystem": filesystem}
+
+def is_ready() -> bool:
+    return llm.is_ready() and (filesystem_ready is None or filesystem_ready.done())
+
+def wait_until_ready(timeout: float = None):
+    """Chờ model tải xong và lần quét đầu tiên kết thúc (raise nếu model lỗi)"""
+    llm.wait(timeout)
+    if filesystem_ready is not None:
+        try:
+            filesystem_ready.result(timeout)
+        except Exception as e:
+            logger.warning(f"Filesystem chưa sẵn sàng: {e}")
+
+
+#===================== extract_intents =====================
+
+# Các hành động được hỗ trợ
+INTENT_ACTIONS = ["search", "classify", "classify_by_topic", "scan", "export", "general"]
+
+# Mỗi intent kèm tham số của nó, sinh trong một lần gọi LLM (JSON bị ràng buộc theo schema)
+INTENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intents": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "action": {"type": "string", "enum": INTENT_ACTIONS},
+                    "keyword": {"type": "string"},
+                    "topic": {"type": "string"},
+                    "directory": {"type": "string"},
+                    "classification_targets": {"type": "object", "additionalProperties": {"type": "string"}},
+                },
+                "required": ["action", "keyword", "topic", "directory", "classification_targets"],
+            },
+        }
+    },
+    "required": ["intents"],
+}
 
-    import json
-    import logging
-    logger = logging.getLogger(__name__)
+# Prompt tĩnh của extract_intents: giữ nguyên giữa các lần gọi để dùng lại KV-cache (prompt_cache),
+# câu của người dùng luôn nằm ở cuối
+INTENT_PROMPT_PREFIX = """Bạn là một AI chuyên xác định hành động và tham số của hành động từ câu yêu cầu của người dùng.
+
+Dưới đây là các hành động được hỗ trợ:
 
-    # Các hành động được hỗ trợ
-    intents_text = """
 - "search": Tìm kiếm file dựa trên nội dung hoặc tên
 - "classify": Phân loại file theo nhóm
 - "classify_by_topic": Phân loại file theo 1 chủ đề cụ thể
 - "scan": Quét thư mục và liệt kê các file
 - "export": Xuất metadata của các file
 - "general": Các yêu cầu khác không thuộc các loại trên
-"""
-
-    # Prompt tối ưu dành cho LLM
-    system_prompt = f"""
-Bạn là một AI chuyên xác định hành động từ câu yêu cầu của người dùng.
-
-Dưới đây là các hành động được hỗ trợ:
-{intents_text}
 
 Nhiệm vụ của bạn:
 - Phân tích yêu cầu người dùng và trích xuất các hành động (intent) theo đúng thứ tự xuất hiện.
-- Chỉ sử dụng các hành động sau: "search", "classify", "classify_by_topic", "scan", "export", "general"
-- Trả về duy nhất một mảng JSON hợp lệ như: ["search", "classify"]
-- Không được viết thêm giải thích, tiêu đề hoặc chữ nào khác.
+- Với mỗi hành động, điền tham số tương ứng (để "" hoặc {} nếu không áp dụng):
+  - keyword: với "search", chính xác 1 từ khóa cần tìm trong tên hoặc nội dung file
+  - topic: với "classify_by_topic", duy nhất một từ khóa chủ đề chính (vd. finance, sales strategy, programming)
+  - directory: với "scan", đường dẫn thư mục cần quét, "" nếu người dùng không nêu
+  - classification_targets: với "classify", các nhóm phân loại người dùng nêu {"Tên nhóm": "Mô tả nhóm"}, {} nếu không nêu
+- Trả về duy nhất một JSON object, không viết thêm giải thích.
 
 Ví dụ:
-Người dùng: Tôi muốn search và classify tiếp theo lại search
-Output: ["search", "classify", "search"]
+Người dùng: Tìm file về marketing rồi phân loại theo chủ đề tài chính
+Output: {"intents": [{"action": "search", "keyword": "marketing", "topic": "", "directory": "", "classification_targets": {}}, {"action": "classify_by_topic", "keyword": "", "topic": "finance", "directory": "", "classification_targets": {}}]}
 
-Người dùng: Hãy quét thư mục, sau đó phân loại theo chủ đề
-Output: ["scan", "classify_by_topic"]
+Người dùng: Hãy quét thư mục ./docs, sau đó xuất metadata
+Output: {"intents": [{"action": "scan", "keyword": "", "topic": "", "directory": "./docs", "classification_targets": {}}, {"action": "export", "keyword": "", "topic": "", "directory": "", "classification_targets": {}}]}
 
-Người dùng: Xuất thông tin file
-Output: ["export"]
+Người dùng: Phân loại file thành nhóm hợp đồng và hóa đơn
+Output: {"intents": [{"action": "classify", "keyword": "", "topic": "", "directory": "", "classification_targets": {"hợp đồng": "Các văn bản hợp đồng", "hóa đơn": "Các hóa đơn, chứng từ thanh toán"}}]}
 
 Người dùng: Tôi muốn thực hiện một tác vụ khác
-Output: ["general"]
+Output: {"intents": [{"action": "general", "keyword": "", "topic": "", "directory": "", "classification_targets": {}}]}
 
 Lưu ý : Nếu có ít nhất một hành động là "search", "classify", "classify_by_topic", "scan", "export" thì không được trả về "general" nữa.
-Người dùng: {prompt}
-Output:
-""".strip()
+"""
 
-    # Gọi LLM (giả định bạn đang dùng self.llm hoặc global llm đã có)
-    response = llm.create_chat_completion(
-        messages=[{"role": "user", "content": system_prompt}],
-        temperature=0.1,
-        max_tokens=150
-    )
+def _general_intent() -> dict:
+    return {"action": "general", "keyword": "", "topic": "", "directory": "", "classification_targets": {}}
 
-    # Trích xuất và kiểm tra kết quả
-    content = response["choices"][0]["message"]["content"].strip()
-    logger.info(f"Intent raw LLM output: {content}")
+def extract_intents(prompt: str) -> list:
+    """
+    Xác định các hành động và tham số của chúng (keyword, topic, directory, classification_targets)
+    trong một lần gọi LLM, thay cho detect_intent + từng handler riêng.
+    """
+    system_prompt = INTENT_PROMPT_PREFIX + f"""Người dùng: {prompt}
+Output:"""
 
     try:
-        actions = json.loads(content)
-        if not isinstance(actions, list):
-            raise ValueError("Expected a list of actions")
+        response = prefix_cache.create_chat_completion(
+            "intent", INTENT_PROMPT_PREFIX,
+            messages=[{"role": "user", "content": system_prompt}],
+            response_format={"type": "json_object", "schema": INTENT_SCHEMA},
+            temperature=0.1,
+            max_tokens=256
+        )
+        content = response["choices"][0]["message"]["content"].strip()
+        logger.info(f"Intent raw LLM output: {content}")
+        json_text = extract_json_from_text(content)
+        if not json_text:
+            raise ValueError("Không tìm thấy JSON")
+        raw_intents = json.loads(json_text).get("intents", [])
     except Exception as e:
-        logger.warning(f"Failed to parse actions: {e}")
-        actions = []
+        logger.warning(f"Failed to parse intents: {e}")
+        return [_general_intent()]
+
+    intents = []
+    for item in raw_intents:
+        if not isinstance(item, dict) or item.get("action") not in INTENT_ACTIONS:
+            continue
+        targets = item.get("classification_targets")
+        intents.append({
+            "action": item["action"],
+            "keyword": clean_extracted_query(str(item.get("keyword") or "")),
+            "topic": str(item.get("topic") or "").strip(),
+            "directory": str(item.get("directory") or "").strip(),
+            "classification_targets": targets if isinstance(targets, dict) else {},
+        })
+    # Bỏ "general" nếu đã có hành động filesystem
+    if any(i["action"] != "general" for i in intents):
+        intents = [i for i in intents if i["action"] != "general"]
+    return intents or [_general_intent()]
+
+def detect_intent(prompt: str) -> tuple:
+    """Detect user intent from prompt and return a list of actions"""
+    actions = [intent["action"] for intent in extract_intents(prompt)]
     return actions, prompt
 
 
@@ -154,67 +241,88 @@ def clean_extracted_query(query: str) -> str:
 def process_prompt(prompt: str) -> str:
 
     """Main prompt processing - preserve original context"""
-    intent, original_prompt = detect_intent(prompt)
+    intents = extract_intents(prompt)
 
-    if MCP_AVAILABLE and intent[0] != 'general':
+    if not MCP_AVAILABLE or intents[0]["action"] == "general":
+        # Only use LLM for general chat - use original prompt
+        return generate_simple_response(prompt)
+
+    results = []
+    for intent in intents:
+        action = intent["action"]
         try:
-            if intent == 'search':
-                keyword = search_handler(original_prompt)
+            if action == 'search':
+                keyword = intent["keyword"] or search_handler(prompt)
                 mcp_result = process_filesystem_query(keyword, "search")
                 logger.info(f"Search '{keyword}' returned: {mcp_result[:200]}...")
-            elif intent == 'scan':
+                formatted_result = format_mcp_result(mcp_result, action, keyword)
+            elif action == 'scan':
                 #######activate this when upgrate to external path implementation
-                # directory = scan_handler(original_prompt)
+                # directory = intent["directory"]
                 directory = ""
                 mcp_result = process_filesystem_query(directory, "scan")
                 logger.info(f"Scan returned: {mcp_result[:200]}...")
-            elif intent == 'classify':
-                targets = classify_handler(original_prompt)
+                formatted_result = format_mcp_result(mcp_result, action, prompt)
+            elif action == 'classify':
                 mcp_files = process_filesystem_query("", "scan_all")
-                mcp_result = generate_classify_result(mcp_files,targets)
-                logger.info(f"Classify returned: {mcp_result[:200]}...")
-            elif intent == 'export':
+                mcp_result = generate_classify_result(mcp_files, intent["classification_targets"])
+                logger.info(f"Classify returned {len(mcp_result)} files")
+                formatted_result = format_mcp_result(mcp_result, action, prompt)
+            elif action == 'export':
                 mcp_result = process_filesystem_query("", "export")
                 logger.info(f"Export returned: {mcp_result[:200]}...")
-            elif intent == 'classify_by_topic':
-                topic = classify_by_topic_handler(original_prompt)
+                formatted_result = format_mcp_result(mcp_result, action, prompt)
+            elif action == 'classify_by_topic':
+                topic = intent["topic"] or classify_by_topic_handler(prompt)
                 mcp_result = process_filesystem_query(topic, "classify_by_topic")
                 logger.info(f"Classify by topic '{topic}' returned: {mcp_result[:200]}...")
+                formatted_result = format_mcp_result(mcp_result, action, prompt)
             else:
-                return generate_simple_response(original_prompt)
-            
+                continue
+
             # Format result using patterns (no LLM) - pass original prompt
-            formatted_result = format_mcp_result(mcp_result, intent, original_prompt)
             logger.info(f"Formatted result: {formatted_result[:100]}...")
-            return formatted_result
-                
+            results.append(formatted_result)
+
         except Exception as e:
             logger.error(f"MCP error: {e}")
             # Handle error with patterns (no LLM) - preserve context
-            return handle_error_with_pattern(str(e), intent, original_prompt)
-    else:    
-        # Only use LLM for general chat - use original prompt
-        return generate_simple_response(original_prompt)
+            results.append(handle_error_with_pattern(str(e), action, prompt))
+
+    return "\n\n".join(results)
 
 def generate_simple_response(prompt: str) -> str:
     """Generate simple LLM response - only for general chat"""
+    return "".join(stream_simple_response(prompt)).strip()
+
+def stream_simple_response(prompt: str) -> Iterator[str]:
+    """Giống generate_simple_response nhưng trả về từng đoạn text ngay khi LLM sinh ra token"""
     try:
-        response = llm.create_chat_completion(
+        stream = llm.create_chat_completion(
             messages=[
                 {"role": "system", "content": "Bạn là trợ lý AI. Phản hồi tin nhắn của user. Hãy trả lời bằng tiếng Việt."},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=300,
             temperature=0.7,
+            stream=True,
             # stop=["\n\n"]
         )
-        
-        content = response["choices"][0]["message"]["content"].strip()
-        return content if content else "Xin lỗi, tôi không hiểu."
-        
+
+        started = False
+        for chunk in stream:
+            piece = chunk["choices"][0]["delta"].get("content")
+            if not started and piece:
+                piece = piece.lstrip()
+            if piece:
+                started = True
+                yield piece
+        if not started:
+            yield "Xin lỗi, tôi không hiểu."
+
     except Exception as e:
         logger.error(f"LLM error: {e}")
-        return f"Lỗi LLM: {str(e)}"
+        yield f"Lỗi LLM: {str(e)}"
 
 def handle_error_with_pattern(error: str, intent: str, original_prompt: str = '') -> str:
     """Handle errors using patterns - preserve context"""
@@ -490,8 +598,8 @@ def classify_handler(prompt: str) -> str:
     print(f"Classification targets: {targets}")
     return targets
 
-def generate_classify_result(mcp_files: list) -> dict:
-    """Generate classify result using LLM"""
+def generate_classify_result(mcp_files: list, targets: dict = None) -> dict:
+    """Generate classify result using LLM (targets: các nhóm người dùng yêu cầu {tên nhóm: mô tả})"""
     print(f"File info for classification: {len(mcp_files)} files")
     print(f"file_info: {mcp_files[1]}")
     file_info = [
@@ -502,6 +610,10 @@ def generate_classify_result(mcp_files: list) -> dict:
         for f in mcp_files
     ]
     print(f"File info for classification: {len(file_info)} files")
+    if targets:
+        group_rule = "Tên nhóm phải là một trong các nhóm sau: " + json.dumps(targets, ensure_ascii=False)
+    else:
+        group_rule = "Tên nhóm phải thuộc các chủ đề phổ biến như: finance, environment, programming, sales strategy, education, technology, health, v.v."
     # Bước 2: Tạo prompt lấy kết quả
     fragment_prompt = f"""
         [INST]
@@ -517,7 +629,7 @@ def generate_classify_result(mcp_files: list) -> dict:
         }}
         Với classification_result sẽ có đúng {len(mcp_files)} , không được nhiều hơn hoặc ít hơn.
         Chỉ trả về JSON, không thêm lời giải thích.
-        Tên nhóm phải thuộc các chủ đề phổ biến như: finance, environment, programming, sales strategy, education, technology, health, v.v.
+        {group_rule}
         [/INST]
         """
 
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+LLM Scheduler
+Hàng đợi có giới hạn đặt trước model: số request chạy cùng lúc bằng số context
+trong model pool (mỗi context llama.cpp không thread-safe), các session được phục vụ
+lần lượt (round-robin) và khi hàng đợi đầy thì trả về "bận" ngay thay vì dồn việc vô hạn.
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+from config import LLM_QUEUE_MAX_PENDING, LLM_QUEUE_MAX_PER_SESSION, LLM_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class SchedulerBusy(Exception):
+    """Hàng đợi đã đầy (toàn hệ thống hoặc của session)"""
+
+
+class _Job:
+    def __init__(self, job_id: int, session_id: str, task: Callable[[], Iterator[str]]):
+        self.job_id = job_id
+        self.session_id = session_id
+        self.task = task
+        self.output: "queue.Queue" = queue.Queue()
+        self.cancelled = threading.Event()
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+
+class LLMScheduler:
+    """
+    Chạy các task (generator trả về text) trên `workers` worker thread.
+    Mỗi session có hàng đợi riêng, worker lấy job theo vòng giữa các session để
+    một người dùng gửi nhiều request không chặn người khác; các request của cùng
+    một session luôn chạy tuần tự (dùng chung trạng thái AgenticProcessor).
+    """
+
+    def __init__(self, max_pending: int = LLM_QUEUE_MAX_PENDING,
+                 max_per_session: int = LLM_QUEUE_MAX_PER_SESSION, workers: int = LLM_POOL_SIZE):
+        self.max_pending = max_pending
+        self.max_per_session = max_per_session
+        self.workers = max(1, workers)
+        self._sessions: "OrderedDict[str, Deque[_Job]]" = OrderedDict()
+        self._pending = 0
+        self._running: Dict[int, _Job] = {}
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._threads = []
+        self._metrics = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0,
+                         "total_wait_seconds": 0.0, "max_wait_seconds": 0.0, "total_run_seconds": 0.0}
+
+    def _ensure_workers(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f"llm-scheduler-{len(self._threads) + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _running_sessions(self) -> set:
+        return {job.session_id for job in self._running.values()}
+
+    def submit(self, session_id: str, task: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        Đưa task vào hàng đợi, trả về iterator các đoạn text của task.
+        Raise SchedulerBusy nếu hàng đợi đã đầy.
+        """
+        with self._cond:
+            session_jobs = self._sessions.get(session_id)
+            session_pending = len(session_jobs) if session_jobs else 0
+            session_pending += sum(1 for job in self._running.values() if job.session_id == session_id)
+            if self._pending >= self.max_pending:
+                self._metrics["rejected"] += 1
+                raise SchedulerBusy(f"Hàng đợi đầy ({self._pending}/{self.max_pending} request đang chờ)")
+            if session_pending >= self.max_per_session:
+                self._metrics["rejected"] += 1
+                raise SchedulerBusy(f"Session {session_id} đã có {session_pending} request chưa xong")
+
+            job = _Job(next(self._ids), session_id, task)
+            self._sessions.setdefault(session_id, deque()).append(job)
+            self._pending += 1
+            self._metrics["submitted"] += 1
+            self._ensure_workers()
+            self._cond.notify()
+        return self._stream(job)
+
+    def _stream(self, job: _Job) -> Iterator[str]:
+        """Đọc output của job; người dùng đóng kết nối thì hủy job"""
+        try:
+            while True:
+                item = job.output.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            job.cancelled.set()
+
+    def _next_job(self) -> _Job:
+        """Lấy job đầu tiên của session kế tiếp (round-robin) chưa có request đang chạy, chờ nếu không có"""
+        with self._cond:
+            while True:
+                busy = self._running_sessions()
+                session_id = next((sid for sid in self._sessions if sid not in busy), None)
+                if session_id is not None:
+                    break
+                self._cond.wait()
+            jobs = self._sessions[session_id]
+            job = jobs.popleft()
+            # Đưa session xuống cuối vòng, xóa nếu không còn job
+            del self._sessions[session_id]
+            if jobs:
+                self._sessions[session_id] = jobs
+            self._pending -= 1
+            self._running[job.job_id] = job
+            return job
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            job.started_at = time.monotonic()
+            wait = job.started_at - job.submitted_at
+            status = "completed"
+            try:
+                if job.cancelled.is_set():
+                    status = "cancelled"
+                else:
+                    stream = job.task()
+                    try:
+                        for piece in stream:
+                            if job.cancelled.is_set():
+                                status = "cancelled"
+                                break
+                            job.output.put(piece)
+                    finally:
+                        close = getattr(stream, "close", None)
+                        if close is not None:
+                            close()
+            except Exception as e:
+                status = "failed"
+                logger.error(f"Lỗi khi chạy request {job.job_id} (session {job.session_id}): {e}")
+                job.output.put(e)
+            finally:
+                job.output.put(_DONE)
+                run = time.monotonic() - job.started_at
+                with self._cond:
+                    self._running.pop(job.job_id, None)
+                    # Session vừa xong có thể còn job đang chờ worker khác
+                    self._cond.notify_all()
+                    self._metrics[status] += 1
+                    self._metrics["total_wait_seconds"] += wait
+                    self._metrics["max_wait_seconds"] = max(self._metrics["max_wait_seconds"], wait)
+                    self._metrics["total_run_seconds"] += run
+                logger.info(f"Request {job.job_id} ({status}): chờ {wait:.2f}s, chạy {run:.2f}s")
+
+    def stats(self) -> Dict[str, float]:
+        """Độ sâu hàng đợi, thời gian chờ/chạy trung bình, số request bị từ chối"""
+        with self._cond:
+            metrics = dict(self._metrics)
+            depth = self._pending
+            sessions = len(self._sessions)
+            running = len(self._running)
+        finished = metrics["completed"] + metrics["failed"] + metrics["cancelled"]
+        return {
+            **metrics,
+            "queue_depth": depth,
+            "waiting_sessions": sessions,
+            "running": running,
+            "avg_wait_seconds": round(metrics["total_wait_seconds"] / finished, 3) if finished else 0.0,
+            "avg_run_seconds": round(metrics["total_run_seconds"] / finished, 3) if finished else 0.0,
+            "max_pending": self.max_pending,
+            "workers": self.workers,
+        }
+
+
+# Scheduler dùng chung cho toàn bộ ứng dụng (một model)
+scheduler = LLMScheduler()
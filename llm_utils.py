@@ -1,4 +1,12 @@
+import json
+from typing import Dict, List, Tuple
+
 from llm_processor import llm, logger
+from helper import extract_json_from_text
+from config import CLASSIFY_BATCH_TOKEN_BUDGET, CLASSIFY_BATCH_MAX_DOCS, CLASSIFY_EXCERPT_CHARS
+
+# Thống kê phân loại theo lô (prompt-eval tokens, số lần phải hỏi lại từng file)
+classify_stats = {"batches": 0, "documents": 0, "prompt_tokens": 0, "fallback_calls": 0}
 
 def ask_llm_yesno(file_content: str, topic: str) -> bool:
     prompt = (
@@ -21,4 +29,118 @@ def ask_llm_yesno(file_content: str, topic: str) -> bool:
         return answer.startswith("có")
     except Exception as e:
         logger.error(f"Lỗi LLM khi phân loại file: {e}")
-        return False 
\ No newline at end of file
+        return False
+
+def count_tokens(text: str) -> int:
+    """Đếm token bằng tokenizer của model (ước lượng nếu tokenizer lỗi)"""
+    try:
+        return len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+    except Exception:
+        return len(text) // 3 + 1
+
+def make_excerpt(content: str, max_chars: int = CLASSIFY_EXCERPT_CHARS) -> str:
+    """Lấy phần đầu + phần cuối tài liệu (giống cách cắt khi hỏi từng file)"""
+    if len(content) <= max_chars:
+        return content
+    head = max_chars * 3 // 4
+    return content[:head] + '\n...\n' + content[-(max_chars - head):]
+
+def _batch_prompt(batch: List[Tuple[str, str]], topic: str) -> str:
+    parts = [f"[Tài liệu {i + 1}]\n{excerpt}" for i, (_, excerpt) in enumerate(batch)]
+    keys = ", ".join(f'"{i + 1}": "Có"|"Không"' for i in range(len(batch)))
+    return (
+        "\n\n".join(parts) + "\n\n"
+        f"Câu hỏi: Với từng tài liệu ở trên, tài liệu có liên quan đến chủ đề '{topic}' không?\n"
+        f"Trả về duy nhất một JSON object dạng {{{keys}}}."
+    )
+
+def pack_batches(documents: List[Tuple[str, str]], topic: str,
+                 token_budget: int = CLASSIFY_BATCH_TOKEN_BUDGET,
+                 max_docs: int = CLASSIFY_BATCH_MAX_DOCS) -> List[List[Tuple[str, str]]]:
+    """Gom các excerpt (doc_id, excerpt) thành lô sao cho prompt không vượt token_budget"""
+    overhead = count_tokens(_batch_prompt([], topic)) + 16
+    batches, current, used = [], [], overhead
+    for doc_id, excerpt in documents:
+        cost = count_tokens(excerpt) + 16  # + nhãn "[Tài liệu i]" và key JSON
+        if current and (used + cost > token_budget or len(current) >= max_docs):
+            batches.append(current)
+            current, used = [], overhead
+        current.append((doc_id, excerpt))
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def _parse_verdicts(raw_output: str, size: int) -> Dict[int, bool]:
+    """Parse {"1": "Có", "2": "Không", ...}; bỏ qua các mục không hợp lệ"""
+    json_text = extract_json_from_text(raw_output)
+    if not json_text:
+        return {}
+    verdicts = {}
+    for key, value in json.loads(json_text).items():
+        try:
+            index = int(key) - 1
+        except (TypeError, ValueError):
+            continue
+        answer = str(value).strip().lower()
+        if 0 <= index < size and (answer.startswith("có") or answer.startswith("không")):
+            verdicts[index] = answer.startswith("có")
+    return verdicts
+
+def ask_llm_yesno_batch(documents: List[Tuple[str, str]], topic: str) -> Dict[str, bool]:
+    """
+    Phân loại nhiều tài liệu trong một lần gọi LLM.
+    documents: [(doc_id, nội dung)] -> {doc_id: có liên quan hay không}.
+    Các lô được gửi cùng lúc lên model pool (chạy song song nếu pool có nhiều context).
+    Tài liệu không parse được kết quả sẽ được hỏi lại riêng bằng ask_llm_yesno.
+    """
+    excerpts = [(doc_id, make_excerpt(content)) for doc_id, content in documents]
+    results: Dict[str, bool] = {}
+
+    batches = pack_batches(excerpts, topic)
+    requests = []
+    for batch in batches:
+        schema = {
+            "type": "object",
+            "properties": {str(i + 1): {"type": "string", "enum": ["Có", "Không"]} for i in range(len(batch))},
+            "required": [str(i + 1) for i in range(len(batch))],
+        }
+        requests.append({
+            "messages": [
+                {"role": "system", "content": "Bạn là AI phân loại file."},
+                {"role": "user", "content": _batch_prompt(batch, topic)}
+            ],
+            "response_format": {"type": "json_object", "schema": schema},
+            "max_tokens": 12 * len(batch) + 16,
+            "temperature": 0.1,
+        })
+
+    responses = llm.create_chat_completion_batch(requests, return_exceptions=True) if requests else []
+    fallback = []
+    for batch, response in zip(batches, responses):
+        verdicts: Dict[int, bool] = {}
+        try:
+            if isinstance(response, Exception):
+                raise response
+            usage = response.get("usage") or {}
+            classify_stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            verdicts = _parse_verdicts(response["choices"][0]["message"]["content"], len(batch))
+        except Exception as e:
+            logger.error(f"Lỗi LLM khi phân loại theo lô: {e}")
+
+        classify_stats["batches"] += 1
+        classify_stats["documents"] += len(batch)
+        for i, (doc_id, excerpt) in enumerate(batch):
+            if i in verdicts:
+                results[doc_id] = verdicts[i]
+            else:
+                fallback.append((doc_id, excerpt))
+
+    # Hỏi lại từng tài liệu, cũng chạy song song trên pool
+    classify_stats["fallback_calls"] += len(fallback)
+    answers = llm.map(lambda item: ask_llm_yesno(item[1], topic), fallback) if fallback else []
+    for (doc_id, _), answer in zip(fallback, answers):
+        results[doc_id] = answer
+
+    logger.info(f"Phân loại theo lô: {classify_stats}")
+    return results
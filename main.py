@@ -70,8 +70,8 @@ def main():
     # System ready
     print("\nSYSTEM STATUS: READY")
     print("Components:")
-    print("  - LLM Model: Loaded")
-    print("  - MCP Filesystem: Active")
+    print("  - LLM Model: Loading in background")
+    print("  - MCP Filesystem: Initial scan in background")
     print("  - Web Interface: Starting...")
     print("\nAccess the system at: http://localhost:7860/?__theme=light")
     print("=" * 80)
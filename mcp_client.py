@@ -3,7 +3,6 @@
 MCP Client
 Kết nối với MCP Filesystem Server từ ứng dụng Chat AI
 """
-import requests
 import json
 import subprocess
 from pathlib import Path
@@ -11,7 +10,8 @@ from pathlib import Path
 import sys
 from typing import Dict, List, Any, Optional
 import logging
-from config import CONTENT_PREVIEW_LIMIT
+from config import CONTENT_PREVIEW_LIMIT, WATCH_ENABLED
+from cloud_export import export_metadata_bulk, metadata_record
 
 logger = logging.getLogger(__name__)
 
@@ -88,6 +88,7 @@ class FilesystemManager:
     
     def __init__(self):
         self.client = mcp_filesystem_client
+        self.watcher = None
     
     async def initialize(self):
         """Khởi tạo filesystem manager"""
@@ -97,6 +98,26 @@ class FilesystemManager:
         """Tắt filesystem manager"""
         await self.client.stop_server()
     
+    def start_watcher(self, directory: str = ".", use_polling: bool = False) -> bool:
+        """Theo dõi thư mục để index luôn cập nhật mà không cần quét lại"""
+        try:
+            from mcp_filesystem_server import file_indexer
+            from fs_watcher import IndexWatcher
+
+            if self.watcher is None:
+                self.watcher = IndexWatcher(file_indexer, directory, use_polling=use_polling)
+                self.watcher.start()
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khởi động watcher: {e}")
+            return False
+
+    def stop_watcher(self):
+        """Dừng theo dõi thư mục"""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
     def scan_files(self, directory: str = ".") -> Dict:
         """Quét và index file trong thư mục"""
         try:
@@ -104,9 +125,12 @@ class FilesystemManager:
             from mcp_filesystem_server import file_indexer
             from pathlib import Path
             files = file_indexer.scan_directory(Path(directory))
+            stats = file_indexer.last_scan_stats
             result = {
                 "success": True,
-                "message": f"Đã quét và index {len(files)} file",
+                "message": f"Đã quét và index {len(files)} file ({stats['hits']} từ cache, {stats['misses']} trích xuất mới)",
+                "cache_hits": stats["hits"],
+                "cache_misses": stats["misses"],
                 "files": [
                     {
                         "filename": f.filename,
@@ -120,7 +144,7 @@ class FilesystemManager:
             }
             
             
-            logger.info(f"Filesystem scan complete: {len(files)} files indexed")
+            logger.info(f"Filesystem scan complete: {len(files)} files indexed ({stats['hits']} hit, {stats['misses']} miss)")
             return result
             
         except Exception as e:
@@ -168,36 +192,63 @@ class FilesystemManager:
                 "files": []
             }
     
-    def export_metadata(self) -> Dict:
-        """Xuất metadata để gửi MCP Cloud"""
+    def vectors_enabled(self) -> bool:
+        """Có tìm kiếm ngữ nghĩa không (có model embedding)"""
         try:
             from mcp_filesystem_server import file_indexer
-            
-            files = list(file_indexer.file_index.values())
-            url = "http://localhost:8000/upload-metadata"
-
-            for f in files:
-                data = {
-                    "filename": f.filename,
-                    "label": f.label,
-                    "content": getattr(f, "content", ""),
-                    "timestamp": getattr(f, "timestamp", None),
-                }
+            return file_indexer.vectors_enabled()
+        except Exception as e:
+            logger.error(f"Lỗi kiểm tra vector index: {e}")
+            return False
 
-                try:
-                    print(f"Đang gửi metadata cho file: {f.filename}")
-                    response = requests.post(url, json=data)
-                    response.raise_for_status()
-                    print(f"✅ Gửi thành công metadata cho file: {f.filename}")
-                except requests.exceptions.RequestException as e:
-                    print(f"❌ Gửi metadata thất bại cho file: {f.filename} — {e}")
+    def hybrid_search(self, query: str, semantic_query: Optional[str] = None) -> Dict:
+        """Tìm kiếm kết hợp BM25 (query) + vector (semantic_query), kèm điểm của từng tín hiệu"""
+        try:
+            from mcp_filesystem_server import file_indexer
 
-            
-            result = {
+            results = file_indexer.hybrid_search(query, semantic_query=semantic_query)
+            logger.info(f"Hybrid search complete: {len(results)} files found for '{query}'")
+            return {
                 "success": True,
-                "total_files": len(files),
+                "query": query,
+                "found": len(results),
+                "files": [
+                    {
+                        "filename": f.filename,
+                        "filepath": f.filepath,
+                        "label": f.label,
+                        "type": f.file_type,
+                        "size": f.size,
+                        "scores": scores,
+                        "content_preview": f.content_preview[:CONTENT_PREVIEW_LIMIT] + "..." if len(f.content_preview) > CONTENT_PREVIEW_LIMIT else f.content_preview
+                    } for f, scores in results
+                ]
             }
+
+        except Exception as e:
+            logger.error(f"Lỗi tìm kiếm kết hợp: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "query": query,
+                "found": 0,
+                "files": []
+            }
+
+    def export_metadata(self) -> Dict:
+        """Xuất metadata để gửi MCP Cloud"""
+        try:
+            from mcp_filesystem_server import file_indexer
             
+            files = file_indexer.snapshot()
+            result = export_metadata_bulk([metadata_record(f) for f in files])
+            for report in result["batches"]:
+                if report["error"]:
+                    print(f"❌ Lô {report['batch']} ({report['count']} file) gửi thất bại — {report['error']}")
+                for rejected in report["rejected"]:
+                    print(f"❌ Metadata bị từ chối: {rejected['filename']} — {rejected['error']}")
+            print(f"✅ Đã gửi {result['sent']}/{result['total_files']} metadata")
+
             logger.info(f"Metadata export complete: {len(files)} files")
             return result
             
@@ -210,6 +261,15 @@ class FilesystemManager:
                 "total_files": 0
             }
     
+    def get_stats(self) -> Dict:
+        """Thống kê index và content cache (hit rate, bộ nhớ)"""
+        try:
+            from mcp_filesystem_server import file_indexer
+            return {"success": True, **file_indexer.get_stats()}
+        except Exception as e:
+            logger.error(f"Lỗi lấy thống kê index: {e}")
+            return {"success": False, "error": str(e)}
+
     def get_file_info(self, filepath: str) -> Dict:
         """Lấy thông tin chi tiết của file"""
         try:
@@ -280,14 +340,34 @@ class FilesystemManager:
                 "files": []
             }
 
-    def read_file_content(self, filepath: str) -> Dict:
-        """Đọc nội dung file"""
+    def summarize_file(self, filepath: str) -> Dict:
+        """Tóm tắt map-reduce toàn văn file"""
+        try:
+            from mcp_filesystem_server import file_indexer
+
+            metadata = file_indexer.file_index.get(filepath)
+            if not metadata:
+                return {"success": False, "error": f"Không tìm thấy file: {filepath}", "summary": None}
+            return {
+                "success": True,
+                "filepath": filepath,
+                "filename": metadata.filename,
+                "summary": file_indexer.summarize_file(filepath),
+            }
+
+        except Exception as e:
+            logger.error(f"Lỗi tóm tắt file: {e}")
+            return {"success": False, "error": str(e), "summary": None}
+
+    def read_file_content(self, filepath: str, limit: Optional[int] = CONTENT_PREVIEW_LIMIT) -> Dict:
+        """Đọc nội dung file (limit=None: toàn văn, qua content cache)"""
         try:
             from mcp_filesystem_server import file_indexer
             
             metadata = file_indexer.file_index.get(filepath)
-            if metadata and hasattr(metadata, 'content'):
-                content = metadata.content[:CONTENT_PREVIEW_LIMIT] + "..." if len(metadata.content) > CONTENT_PREVIEW_LIMIT else metadata.content
+            if metadata:
+                full_content = file_indexer.extract_full_content(Path(metadata.filepath))
+                content = full_content[:limit] + "..." if limit is not None and len(full_content) > limit else full_content
                 return {
                     "success": True,
                     "filepath": filepath,
@@ -313,6 +393,28 @@ class FilesystemManager:
 filesystem_manager = FilesystemManager()
 
 # Hàm tiện ích để gọi từ LLM processor
+def format_signal_scores(scores: Dict) -> str:
+    """'từ khóa #1 (3.21), ngữ nghĩa #2 (0.81)' từ điểm của hybrid_search"""
+    names = {"lexical": "từ khóa", "semantic": "ngữ nghĩa"}
+    parts = []
+    for signal, name in names.items():
+        if signal in scores:
+            score = scores[signal]["score"]
+            parts.append(f"{name} #{scores[signal]['rank']}" + (f" ({score:.2f})" if score is not None else ""))
+    return ", ".join(parts)
+
+def format_hybrid_result(result: Dict, query: str) -> str:
+    """Kết quả FilesystemManager.hybrid_search dạng text cho user"""
+    if not result["success"]:
+        return f"Lỗi tìm kiếm: {result['error']}"
+    if result["found"] == 0:
+        return f"Không tìm thấy file nào cho '{query}'"
+    files_text = "\n".join([
+        f"• {f['filename']} ({f['label']}) - {f['size']} bytes - {format_signal_scores(f['scores'])}"
+        for f in result["files"]
+    ])
+    return f"Tìm thấy {result['found']} file cho '{query}':\n\n{files_text}"
+
 def process_filesystem_query(query: str, query_type: str = "search") -> str:
     """
     Xử lý query liên quan đến filesystem
@@ -339,6 +441,9 @@ def process_filesystem_query(query: str, query_type: str = "search") -> str:
             else:
                 return f"Lỗi tìm kiếm: {result['error']}"
         
+        elif query_type == "hybrid_search":
+            return format_hybrid_result(filesystem_manager.hybrid_search(query), query)
+
         elif query_type == "scan":
             result = filesystem_manager.scan_files()
             if result["success"]:
@@ -407,6 +512,8 @@ def initialize_filesystem():
         result = filesystem_manager.scan_files()
         if result["success"]:
             logger.info(f"Filesystem initialized: {result['total']} files indexed")
+            if WATCH_ENABLED:
+                filesystem_manager.start_watcher()
             return True
         else:
             logger.error(f"Failed to initialize filesystem: {result['error']}")
@@ -1,9 +1,14 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
 import json
 from datetime import datetime
 from pathlib import Path
 
+from config import (METADATA_COMMIT_MAX_BATCH, METADATA_COMPACT_INTERVAL_SECONDS, METADATA_COMPACT_MIN_RATIO,
+                    METADATA_DURABILITY_WINDOW_SECONDS, METADATA_KEEP_VERSIONS, METADATA_PAGE_MAX,
+                    METADATA_PAGE_SIZE, METADATA_STORAGE_BACKEND, METADATA_STORE_DIR)
+from metadata_storage import GroupCommitWriter, MetadataCompactor, open_storage
+
 class Metadata(BaseModel):
     filename: str
     label: str
@@ -12,48 +17,121 @@ class Metadata(BaseModel):
 
 
 class MCPMetadataService:
-    def __init__(self, store_dir: str = "metadata_store", filename: str = "metadata.json"):
+    def __init__(self, store_dir: str = METADATA_STORE_DIR, filename: str = "metadata.json",
+                 backend: str = METADATA_STORAGE_BACKEND):
         self.store_dir = Path(store_dir)
         self.store_path = Path(store_dir) / filename
         self.store_dir.mkdir(parents=True, exist_ok=True)
-        self.store_path.touch(exist_ok=True)
+        # Backend có index theo filename (xem metadata_storage.py)
+        self.storage = open_storage(backend, store_dir, filename)
+        self.compactor = MetadataCompactor(self.storage, METADATA_COMPACT_INTERVAL_SECONDS,
+                                           METADATA_KEEP_VERSIONS, METADATA_COMPACT_MIN_RATIO)
+        # Endpoint async ghi qua một hàng đợi duy nhất (không ghi chen nhau, gom nhiều request một lần ghi)
+        self.writer = GroupCommitWriter(self.storage, METADATA_DURABILITY_WINDOW_SECONDS, METADATA_COMMIT_MAX_BATCH)
+
+
+    @staticmethod
+    def _stamp(records: list):
+        now = datetime.now().isoformat()
+        for metadata in records:
+            if not metadata.get("timestamp"):
+                metadata["timestamp"] = now
 
 
     def save_metadata(self, metadata: dict):
-        if not metadata.get("timestamp"):
-            metadata["timestamp"] = datetime.now().isoformat()
+        self._stamp([metadata])
 
         try:
-            with self.store_path.open("a", encoding="utf-8") as f:
-                f.write(json.dumps(metadata, ensure_ascii=False) + "\n")
+            self.storage.append(metadata)
             return {"status": "success", "filename": metadata["filename"]}
         except Exception as e:
             return {"status": "error", "detail": str(e)}
 
 
+    def save_many(self, records: list):
+        """Ghi nhiều metadata trong một lần ghi"""
+        self._stamp(records)
+        try:
+            self.storage.append_many(records)
+            return {"status": "success", "count": len(records)}
+        except Exception as e:
+            return {"status": "error", "detail": str(e)}
+
+
+    async def save_many_async(self, records: list):
+        """Như save_many nhưng qua hàng đợi group commit, không chặn event loop"""
+        self._stamp(records)
+        try:
+            await self.writer.submit(records)
+            return {"status": "success", "count": len(records)}
+        except Exception as e:
+            return {"status": "error", "detail": str(e)}
+
+
     def load_all(self):
         """Trả về danh sách tất cả metadata đã lưu"""
         try:
-            with self.store_path.open("r", encoding="utf-8") as f:
-                return [json.loads(line) for line in f if line.strip()]
+            return list(self.storage.iter_records())
         except Exception as e:
             return {"status": "error", "detail": str(e)}
 
-    
+
+    def iter_metadata(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+                      fields: Optional[List[str]] = None, label: Optional[str] = None,
+                      filename_prefix: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Duyệt (cursor, metadata) đọc thẳng từ storage, lọc theo label / tiền tố filename,
+        chỉ giữ các field trong fields, dừng sau limit bản ghi. Cursor sai -> ValueError ngay.
+        """
+        records = self.storage.iter_from(cursor)
+
+        def generate():
+            count = 0
+            for position, metadata in records:
+                if limit is not None and count >= limit:
+                    return
+                if label is not None and metadata.get("label") != label:
+                    continue
+                if filename_prefix and not str(metadata.get("filename", "")).startswith(filename_prefix):
+                    continue
+                if fields:
+                    metadata = {k: metadata[k] for k in fields if k in metadata}
+                count += 1
+                yield position, metadata
+
+        return generate()
+
+
+    def list_metadata(self, cursor: Optional[str] = None, limit: int = METADATA_PAGE_SIZE, **filters):
+        """Một trang metadata: {"items", "count", "next_cursor"} (next_cursor None khi đã hết)"""
+        items, next_cursor = [], None
+        for position, metadata in self.iter_metadata(cursor, limit, **filters):
+            items.append(metadata)
+            next_cursor = position
+        if len(items) < limit:
+            next_cursor = None
+        return {"items": items, "count": len(items), "next_cursor": next_cursor}
+
+
     def load_by_filename(self, filename: str):
-        """Trả về metadata theo filename"""
+        """Trả về metadata mới nhất theo filename (tra index, không quét file)"""
         try:
-            with self.store_path.open("r", encoding="utf-8") as f:
-                for line in f:
-                    if line.strip():
-                        metadata = json.loads(line)
-                        if metadata.get("filename") == filename:
-                            return metadata
+            metadata = self.storage.get(filename)
+            if metadata is not None:
+                return metadata
             return {"status": "error", "detail": "Metadata not found for the given filename"}
         except Exception as e:
             return {"status": "error", "detail": str(e)}
     
 
+    def compact(self, force: bool = False):
+        """Compact log metadata ngay (force: bỏ qua ngưỡng tỉ lệ bản ghi thừa)"""
+        try:
+            return self.compactor.run_once(force=force)
+        except Exception as e:
+            return {"status": "error", "detail": str(e)}
+
+
     def load_by_metadata_filename(self, metadata_filename: str):
         """Trả về metadata theo tên file metadata"""
         try:
@@ -69,24 +147,95 @@ class MCPMetadataService:
 
 
 # FastAPI application setup
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Hàng đợi ghi + compact log metadata trên thread nền trong suốt vòng đời server
+    await mcp_service.writer.start()
+    mcp_service.compactor.start()
+    yield
+    mcp_service.compactor.stop()
+    await mcp_service.writer.stop()
+
+
 # app = FastAPI(title="MCP Cloud JSON Store", version="1.0")
-app = FastAPI(title="MCP Cloud JSON Store", version="1.0", docs_url="/docs", redoc_url=None)
+app = FastAPI(title="MCP Cloud JSON Store", version="1.0", docs_url="/docs", redoc_url=None, lifespan=lifespan)
 
 mcp_service = MCPMetadataService()
 
 @app.post("/upload-metadata")
-def upload_metadata(data: Metadata):
-    result = mcp_service.save_metadata(data.dict())
+async def upload_metadata(data: Metadata):
+    metadata = data.dict()
+    result = await mcp_service.save_many_async([metadata])
     if result["status"] == "success":
-        return result
+        return {"status": "success", "filename": metadata["filename"]}
     else:
         raise HTTPException(status_code=500, detail=result["detail"])
 
 
+@app.post("/upload-metadata/bulk")
+async def upload_metadata_bulk(request: Request):
+    """
+    Nhận một lô metadata dạng NDJSON (mỗi dòng một object Metadata).
+    Dòng lỗi không làm hỏng cả lô: trả về số bản ghi đã nhận và danh sách dòng bị từ chối.
+    """
+    body = await request.body()
+    records, rejected = [], []
+    # Chỉ tách theo b"\n": str.splitlines() còn tách cả U+2028, U+0085, ... vốn nằm nguyên trong chuỗi JSON
+    for line_no, raw in enumerate(body.split(b"\n")):
+        if not raw.strip():
+            continue
+        try:
+            line = raw.decode("utf-8")
+            records.append(Metadata(**json.loads(line)).dict())
+        except (ValueError, TypeError, ValidationError) as e:
+            rejected.append({"line": line_no, "error": str(e)})
+
+    result = await mcp_service.save_many_async(records) if records else {"status": "success", "count": 0}
+    if result["status"] != "success":
+        raise HTTPException(status_code=500, detail=result["detail"])
+    return {"status": "success", "accepted": len(records), "rejected": rejected}
+
+
+@app.post("/compact")
+def compact_metadata(force: bool = False):
+    result = mcp_service.compact(force=force)
+    if result.get("status") == "error":
+        raise HTTPException(status_code=500, detail=result["detail"])
+    return result
+
+
 @app.get("/metadata")
-def get_all_metadata():
-    return mcp_service.load_all()
+def get_all_metadata(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    fields: Optional[str] = Query(None, description="Các field cần trả về, cách nhau bởi dấu phẩy"),
+    label: Optional[str] = None,
+    filename_prefix: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """
+    json: một trang {"items", "count", "next_cursor"}, gửi lại next_cursor để lấy trang sau.
+    ndjson: stream mỗi dòng một bản ghi từ cursor tới hết (hoặc tới limit), bộ nhớ không đổi.
+    """
+    filters = {
+        "fields": [f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        "label": label,
+        "filename_prefix": filename_prefix,
+    }
+    try:
+        if format == "ndjson":
+            records = mcp_service.iter_metadata(cursor, limit, **filters)
+            lines = (json.dumps(metadata, ensure_ascii=False) + "\n" for _, metadata in records)
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+        return mcp_service.list_metadata(cursor, min(limit or METADATA_PAGE_SIZE, METADATA_PAGE_MAX), **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/metadata/{filename}")
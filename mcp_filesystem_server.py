@@ -8,7 +8,12 @@ Chức năng: Tìm kiếm, index và phân loại file văn bản (PDF, Word, PP
 import asyncio
 import json
 import os
+import itertools
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from typing import Dict, List, Any, Optional
 from pathlib import Path
 import mcp.types as types
@@ -16,18 +21,22 @@ from mcp.server import Server
 from mcp.server.models import InitializationOptions
 import mcp.server.stdio
 from pydantic import BaseModel
-from llm_utils import ask_llm_yesno
+from llm_utils import ask_llm_yesno_batch
+from summarizer import summarize_text, summary_cache
+from cloud_export import export_metadata_bulk, metadata_record
+from index_store import IndexStore
+from content_cache import ContentCache
+from verdict_cache import VerdictCache, content_hash
+from search_index import InvertedIndex, document_text, reciprocal_rank_fusion
+from vector_index import VectorIndex
+from fs_watcher import IndexWatcher
+import document_extractor
 
 # Import cấu hình đơn giản
-from config import SUPPORTED_EXTENSIONS, CONTENT_PREVIEW_LIMIT, CATEGORY_KEYWORDS
-
-# Import thư viện xử lý file
-try:
-    import PyPDF2
-    import docx
-    from pptx import Presentation
-except ImportError:
-    print("Cài đặt thêm: pip install PyPDF2 python-docx python-pptx")
+from config import (SUPPORTED_EXTENSIONS, CONTENT_PREVIEW_LIMIT, CATEGORY_KEYWORDS,
+                    SCAN_WORKERS, PARALLEL_SCAN_MIN_FILES, SEARCH_TOP_K, SEARCH_MIN_SCORE_RATIO,
+                    WATCH_ENABLED, SEMANTIC_TOP_K, SEMANTIC_MIN_SCORE, HYBRID_RRF_K,
+                    VECTOR_SAVE_DELAY_SECONDS)
 
 # Cấu hình logging
 logging.basicConfig(level=logging.INFO)
@@ -46,169 +55,458 @@ class FileMetadata(BaseModel):
 
 class FileIndexer:
     """Class quản lý index file"""
-    MCP_CLOUD_API_URL = "http://localhost:8000/upload-metadata" 
     
-    def __init__(self, base_path: str = "."):
+    def __init__(self, base_path: str = ".", index_store: Optional[IndexStore] = None,
+                 scan_workers: int = SCAN_WORKERS, content_cache: Optional[ContentCache] = None,
+                 verdict_cache: Optional[VerdictCache] = None, vector_index: Optional[VectorIndex] = None):
         self.base_path = Path(base_path)
         self.file_index: Dict[str, FileMetadata] = {}
         self.supported_extensions = set(SUPPORTED_EXTENSIONS)
+        self.index_store = index_store
+        self.content_cache = content_cache
+        self.verdict_cache = verdict_cache
+        self.vector_index = vector_index
+        self.scan_workers = scan_workers
+        self.search_index = InvertedIndex()
+        self._lock = threading.RLock()
+        # BM25 và vector chạy song song khi tìm kiếm kết hợp
+        self._retrieval_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval")
+        self.last_scan_stats = {"hits": 0, "misses": 0, "removed": 0}
+        # Ghi ma trận vector là O(corpus): chỉ ghi cuối lần quét, hoặc trễ VECTOR_SAVE_DELAY_SECONDS với watcher
+        self._vector_save_timer: Optional[threading.Timer] = None
+        self._vector_save_lock = threading.Lock()
+        if self.index_store is not None:
+            self.load_from_store()
+
+    def load_from_store(self) -> int:
+        """Nạp index đã lưu trên đĩa, không trích xuất lại nội dung"""
+        loaded = 0
+        for path, data in self.index_store.load_all().items():
+            try:
+                self.file_index[path] = FileMetadata(**data)
+                loaded += 1
+            except Exception as e:
+                logger.warning(f"Bỏ qua metadata không hợp lệ {path}: {e}")
+        for path, counts in self.index_store.load_term_counts().items():
+            if path in self.file_index:
+                self.search_index.add_term_counts(path, counts)
+        logger.info(f"Đã nạp {loaded} file từ index store")
+        return loaded
+
+    def _persist(self, metadatas: List[FileMetadata], term_counts: Dict[str, Dict[str, int]] = None):
+        """Ghi metadata (và term counts của inverted index) xuống index store (nếu có)"""
+        if self.index_store is None or not metadatas:
+            return
+        try:
+            self.index_store.put_many(
+                (m.filepath, m.size, m.modified_time, m.dict()) for m in metadatas
+            )
+            if term_counts:
+                self.index_store.put_term_counts(term_counts.items())
+        except Exception as e:
+            logger.error(f"Lỗi ghi index store: {e}")
     
     def extract_text_from_pdf(self, filepath: Path) -> str:
         """Trích xuất text từ file PDF"""
-        try:
-            with open(filepath, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-                return text[:CONTENT_PREVIEW_LIMIT]
-        except Exception as e:
-            logger.error(f"Lỗi đọc PDF {filepath}: {e}")
-            return ""
+        return document_extractor.extract_text_from_pdf(filepath)
     
     def extract_text_from_docx(self, filepath: Path) -> str:
         """Trích xuất text từ file Word"""
-        try:
-            doc = docx.Document(filepath)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text[:CONTENT_PREVIEW_LIMIT]
-        except Exception as e:
-            logger.error(f"Lỗi đọc DOCX {filepath}: {e}")
-            return ""
+        return document_extractor.extract_text_from_docx(filepath)
     
     def extract_text_from_pptx(self, filepath: Path) -> str:
         """Trích xuất text từ file PowerPoint"""
-        try:
-            prs = Presentation(filepath)
-            text = ""
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        text += shape.text + "\n"
-            return text[:CONTENT_PREVIEW_LIMIT]
-        except Exception as e:
-            logger.error(f"Lỗi đọc PPTX {filepath}: {e}")
-            return ""
+        return document_extractor.extract_text_from_pptx(filepath)
     
     def extract_text_from_txt(self, filepath: Path) -> str:
         """Trích xuất text từ file TXT"""
-        try:
-            with open(filepath, 'r', encoding='utf-8') as file:
-                text = file.read()
-                return text[:CONTENT_PREVIEW_LIMIT]
-        except Exception as e:
-            logger.error(f"Lỗi đọc TXT {filepath}: {e}")
-            return ""
+        return document_extractor.extract_text_from_txt(filepath)
     
     def extract_content(self, filepath: Path) -> str:
-        """Trích xuất nội dung từ file dựa trên extension"""
-        extension = filepath.suffix.lower()
-        
-        if extension == '.pdf':
-            return self.extract_text_from_pdf(filepath)
-        elif extension in ['.docx', '.doc']:
-            return self.extract_text_from_docx(filepath)
-        elif extension in ['.pptx', '.ppt']:
-            return self.extract_text_from_pptx(filepath)
-        elif extension == '.txt':
-            return self.extract_text_from_txt(filepath)
-        else:
-            return ""
+        """Trích xuất nội dung preview (dùng chung cache với extract_full_content)"""
+        return self.extract_full_content(filepath)[:CONTENT_PREVIEW_LIMIT]
+
+    def _build_metadata(self, filepath: Path, stat: os.stat_result, full_content: str) -> FileMetadata:
+        """Tạo metadata cho file vừa trích xuất"""
+        return FileMetadata(
+            filename=filepath.name,
+            filepath=str(filepath.absolute()),
+            file_type=filepath.suffix.lower(),
+            size=stat.st_size,
+            content_preview=full_content[:CONTENT_PREVIEW_LIMIT],
+            label="Chưa phân loại",
+            created_time=stat.st_ctime,
+            modified_time=stat.st_mtime
+        )
+
+    def _extract_parallel(self, pending: Dict[str, tuple], workers: int):
+        """Trích xuất song song bằng process pool, trả kết quả (key, content) ngay khi xong"""
+        remaining = dict(pending)
+        try:
+            # spawn thay vì fork: tiến trình này có nhiều thread (watcher, scheduler, llama, sqlite),
+            # fork lúc đang giữ lock có thể deadlock và kế thừa trạng thái không an toàn
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {pool.submit(document_extractor.extract_worker, key): key for key in pending}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        _, content = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        # Lỗi của một file không ảnh hưởng các file khác
+                        logger.error(f"Lỗi index file {key}: {e}")
+                        remaining.pop(key, None)
+                        continue
+                    remaining.pop(key, None)
+                    self._cache_content(*pending[key], content)
+                    yield key, content
+        except BrokenProcessPool as e:
+            logger.error(f"Process pool bị lỗi ({e}), trích xuất tuần tự {len(remaining)} file còn lại")
+            for key in list(remaining):
+                yield key, self._parse_and_cache(*pending[key])
     
+    def _is_unchanged(self, key: str, stat: os.stat_result) -> bool:
+        """Fingerprint (size, mtime) không đổi và đã có trong inverted index (và vector index nếu có nội dung)"""
+        cached = self.file_index.get(key)
+        if cached is None or cached.size != stat.st_size or cached.modified_time != stat.st_mtime:
+            return False
+        if key not in self.search_index:
+            return False
+        # File không trích được chữ (.doc, .ppt, PDF chỉ có ảnh) không bao giờ có vector
+        needs_vectors = self.vectors_enabled() and cached.content_preview.strip()
+        return not needs_vectors or key in self.vector_index
+
+    def vectors_enabled(self) -> bool:
+        """Có vector index và model embedding"""
+        return self.vector_index is not None and self.vector_index.available
+
+    def _embed_document(self, key: str, full_content: str):
+        """Embedding các chunk của tài liệu (lỗi chỉ ảnh hưởng tìm kiếm ngữ nghĩa)"""
+        if not self.vectors_enabled():
+            return
+        try:
+            self.vector_index.add_document(key, full_content)
+        except Exception as e:
+            logger.error(f"Lỗi embedding {key}: {e}")
+
+    def _index_pending(self, pending: Dict[str, tuple], workers: int) -> List[FileMetadata]:
+        """Trích xuất các file {key: (filepath, stat)} và cập nhật index, trả về metadata mới"""
+        changed = []
+        changed_terms: Dict[str, Dict[str, int]] = {}
+
+        # Nội dung đã có trong content cache thì không cần parse lại
+        cached: Dict[str, str] = {}
+        if self.content_cache is not None:
+            for key, (filepath, stat) in pending.items():
+                text = self.content_cache.lookup(filepath, (stat.st_mtime_ns, stat.st_size))
+                if text is not None:
+                    cached[key] = text
+        to_parse = {key: value for key, value in pending.items() if key not in cached}
+
+        if workers > 1 and len(to_parse) >= PARALLEL_SCAN_MIN_FILES:
+            logger.info(f"Trích xuất song song {len(to_parse)} file với {workers} worker")
+            parsed = self._extract_parallel(to_parse, workers)
+        else:
+            parsed = ((key, self._parse_and_cache(filepath, stat)) for key, (filepath, stat) in to_parse.items())
+        extracted = itertools.chain(cached.items(), parsed)
+
+        # Đưa kết quả vào index ngay khi từng file trích xuất xong
+        for key, full_content in extracted:
+            filepath, stat = pending[key]
+            try:
+                metadata = self._build_metadata(filepath, stat, full_content)
+                with self._lock:
+                    self.file_index[key] = metadata
+                    # Inverted index trên tên file + toàn bộ nội dung (không chỉ preview)
+                    changed_terms[key] = self.search_index.add_document(key, document_text(filepath.name, full_content))
+                changed.append(metadata)
+                self._embed_document(key, full_content)
+                
+                logger.info(f"Indexed: {filepath.name} -> {metadata.label}")
+                
+            except Exception as e:
+                logger.error(f"Lỗi index file {filepath}: {e}")
+
+        self._persist(changed, changed_terms)
+        return changed
+
+    def remove_paths(self, paths: List[str]) -> int:
+        """Xóa file (hoặc mọi file trong thư mục) khỏi index và các cấu trúc tìm kiếm"""
+        removed = []
+        with self._lock:
+            for path in paths:
+                if path in self.file_index:
+                    targets = [path]
+                else:
+                    prefix = path.rstrip(os.sep) + os.sep
+                    targets = [p for p in self.file_index if p.startswith(prefix)]
+                for target in targets:
+                    del self.file_index[target]
+                    self.search_index.remove_document(target)
+                    removed.append(target)
+        if self.content_cache is not None:
+            for target in removed:
+                self.content_cache.invalidate(target)
+        if self.index_store is not None:
+            self.index_store.delete_many(removed)
+        if self.vector_index is not None and removed:
+            self.vector_index.remove_documents(removed)
+        return len(removed)
+
+    def save_vectors(self):
+        """Ghi vector index xuống đĩa ngay (không làm gì nếu không có thay đổi)"""
+        with self._vector_save_lock:
+            if self._vector_save_timer is not None:
+                self._vector_save_timer.cancel()
+                self._vector_save_timer = None
+        if self.vector_index is None:
+            return
+        try:
+            self.vector_index.save()
+        except Exception as e:
+            logger.error(f"Lỗi ghi vector index: {e}")
+
+    def _schedule_vector_save(self):
+        """Hẹn ghi vector index sau VECTOR_SAVE_DELAY_SECONDS; các batch watcher trong lúc chờ ghi chung một lần"""
+        if self.vector_index is None:
+            return
+        with self._vector_save_lock:
+            if self._vector_save_timer is not None:
+                return
+            timer = threading.Timer(VECTOR_SAVE_DELAY_SECONDS, self.save_vectors)
+            timer.daemon = True
+            timer.name = "vector-index-save"
+            self._vector_save_timer = timer
+            timer.start()
+
+    def apply_changes(self, upserts: List[str], deletes: List[str]) -> Dict[str, int]:
+        """Cập nhật index theo thay đổi của filesystem (dùng cho watcher), chi phí theo số file đổi"""
+        removed = self.remove_paths(deletes)
+        pending: Dict[str, tuple] = {}
+        for path in upserts:
+            filepath = Path(path)
+            try:
+                if filepath.is_dir():
+                    # Thư mục được tạo/đổi tên vào: index các file bên trong
+                    candidates = [p for p in filepath.rglob("*") if p.is_file()]
+                else:
+                    candidates = [filepath]
+                for candidate in candidates:
+                    if candidate.suffix.lower() not in self.supported_extensions:
+                        continue
+                    stat = candidate.stat()
+                    key = str(candidate.absolute())
+                    if not self._is_unchanged(key, stat):
+                        pending[key] = (candidate, stat)
+            except FileNotFoundError:
+                removed += self.remove_paths([str(filepath.absolute())])
+            except Exception as e:
+                logger.error(f"Lỗi cập nhật index {filepath}: {e}")
+
+        changed = self._index_pending(pending, self.scan_workers)
+        if changed or removed:
+            self._schedule_vector_save()
+        stats = {"updated": len(changed), "removed": removed}
+        logger.info(f"Watcher: {stats['updated']} file cập nhật, {stats['removed']} file xóa")
+        return stats
     
-    def scan_directory(self, directory: Path = None) -> List[FileMetadata]:
-        """Quét thư mục và tạo index file"""
+    def scan_directory(self, directory: Path = None, workers: Optional[int] = None) -> List[FileMetadata]:
+        """Quét thư mục và tạo index file (workers > 1: trích xuất song song)"""
         if directory is None:
             directory = self.base_path
+        if workers is None:
+            workers = self.scan_workers
         
         files_found = []
+        seen = set()
+        pending: Dict[str, tuple] = {}
+        hits = 0
         
         for filepath in directory.rglob("*"):
             if filepath.is_file() and filepath.suffix.lower() in self.supported_extensions:
                 try:
                     # Lấy thông tin file
                     stat = filepath.stat()
-                    content = self.extract_content(filepath)
-                    label = "Chưa phân loại"
-                    
-                    # Tạo metadata
-                    metadata = FileMetadata(
-                        filename=filepath.name,
-                        filepath=str(filepath.absolute()),
-                        file_type=filepath.suffix.lower(),
-                        size=stat.st_size,
-                        content_preview=content,
-                        label=label,
-                        created_time=stat.st_ctime,
-                        modified_time=stat.st_mtime
-                    )
-                    self.file_index[str(filepath.absolute())] = metadata
-                    files_found.append(metadata)
-                    
-                    logger.info(f"Indexed: {filepath.name} -> {label}")
+                    key = str(filepath.absolute())
+                    seen.add(key)
+
+                    # Fingerprint (size, mtime) không đổi -> dùng lại metadata đã lưu
+                    if self._is_unchanged(key, stat):
+                        files_found.append(self.file_index[key])
+                        hits += 1
+                        continue
+
+                    pending[key] = (filepath, stat)
                     
                 except Exception as e:
                     logger.error(f"Lỗi index file {filepath}: {e}")
+
+        changed = self._index_pending(pending, workers)
+        files_found.extend(changed)
+
+        # Xóa các file đã bị xóa khỏi thư mục vừa quét
+        root = str(directory.absolute())
+        with self._lock:
+            removed = [
+                path for path in self.file_index
+                if path not in seen and Path(path).is_relative_to(root)
+            ]
+        self.remove_paths(removed)
+        self.save_vectors()
+
+        misses = len(changed)
+        self.last_scan_stats = {"hits": hits, "misses": misses, "removed": len(removed)}
+        logger.info(f"Scan {directory}: {hits} cache hit, {misses} cache miss, {len(removed)} file đã xóa")
         
         return files_found
     
+    def search_ranked(self, query: str, top_k: int = SEARCH_TOP_K) -> List[tuple]:
+        """Tìm kiếm BM25 trên inverted index, trả về [(metadata, score)]"""
+        with self._lock:
+            ranked = self.search_index.search(query, top_k)
+            if not ranked:
+                return []
+            # Bỏ các kết quả chỉ khớp từ phổ biến (điểm quá thấp so với kết quả tốt nhất)
+            min_score = ranked[0][1] * SEARCH_MIN_SCORE_RATIO
+            return [
+                (self.file_index[doc_id], score)
+                for doc_id, score in ranked
+                if score >= min_score and doc_id in self.file_index
+            ]
+
+    def semantic_search(self, query: str, top_k: int = SEMANTIC_TOP_K,
+                        min_score: float = SEMANTIC_MIN_SCORE) -> List[tuple]:
+        """Tìm kiếm theo ngữ nghĩa (embedding của chunk khớp nhất), trả về [(metadata, score)]"""
+        if not self.vectors_enabled():
+            return []
+        ranked = self.vector_index.search(query, top_k, min_score)
+        with self._lock:
+            return [(self.file_index[doc_id], score) for doc_id, score, _ in ranked if doc_id in self.file_index]
+
+    def hybrid_search(self, query: str, top_k: int = SEARCH_TOP_K, rrf_k: int = HYBRID_RRF_K,
+                      semantic_query: Optional[str] = None) -> List[tuple]:
+        """
+        BM25 (trên query) và vector (trên semantic_query, mặc định là query) chạy song song,
+        gộp bằng reciprocal rank fusion.
+        Trả về [(metadata, scores)] với scores = {"rrf", "lexical": {rank, score}, "semantic": {rank, score}}
+        (tín hiệu không tìm thấy file thì không có key tương ứng).
+        """
+        lexical = self._retrieval_pool.submit(self._lexical_ranking, query, top_k)
+        semantic = self._retrieval_pool.submit(self.semantic_search, semantic_query or query, top_k)
+        rankings = {"lexical": lexical.result()}
+        try:
+            rankings["semantic"] = [(m.filepath, score) for m, score in semantic.result()]
+        except Exception as e:
+            # Lỗi embedding không làm hỏng tìm kiếm, chỉ còn BM25
+            logger.error(f"Lỗi tìm kiếm ngữ nghĩa: {e}")
+        fused = reciprocal_rank_fusion(rankings, rrf_k)[:top_k]
+        with self._lock:
+            return [
+                (self.file_index[doc_id], {"rrf": round(score, 6), **signals})
+                for doc_id, score, signals in fused if doc_id in self.file_index
+            ]
+
+    def _lexical_ranking(self, query: str, top_k: int) -> List[tuple]:
+        """[(filepath, điểm BM25)], không khớp từ nào thì dùng so khớp chuỗi con (điểm None)"""
+        ranked = [(m.filepath, score) for m, score in self.search_ranked(query, top_k)]
+        return ranked or [(m.filepath, None) for m in self.search_files(query)[:top_k]]
+
     def search_files(self, query: str) -> List[FileMetadata]:
-        """Tìm kiếm file theo query"""
+        """Tìm kiếm file theo query (BM25 trên toàn văn, xếp hạng giảm dần)"""
+        results = [metadata for metadata, _ in self.search_ranked(query)]
+        if results:
+            return results
+
+        # Không khớp từ nào (vd. một phần của từ) -> so khớp chuỗi con như trước
         query_lower = query.lower()
-        results = []
-        
-        for metadata in self.file_index.values():
-            # Tìm trong tên file và nội dung
+        for metadata in self.snapshot():
             if (query_lower in metadata.filename.lower() or 
                 query_lower in metadata.content_preview.lower()):
                 results.append(metadata)
         return results
     
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê index: số file, lần quét gần nhất, content cache"""
+        return {
+            "indexed_files": len(self.file_index),
+            "last_scan": dict(self.last_scan_stats),
+            "content_cache": self.content_cache.stats() if self.content_cache is not None else None,
+            "verdict_cache": self.verdict_cache.stats() if self.verdict_cache is not None else None,
+            "vector_index": self.vector_index.stats() if self.vector_index is not None else None,
+            "summary_cache": summary_cache.stats(),
+        }
+
+    def snapshot(self) -> List[FileMetadata]:
+        """Danh sách metadata hiện tại (an toàn khi watcher đang cập nhật index)"""
+        with self._lock:
+            return list(self.file_index.values())
+
     def get_files_by_category(self, category: str) -> List[FileMetadata]:
         """Lấy file theo nhóm phân loại"""
         results = []
-        for metadata in self.file_index.values():
+        for metadata in self.snapshot():
             if category.lower() in metadata.label.lower():
                 results.append(metadata)
         return results
 
     def extract_full_content(self, filepath: Path) -> str:
-        extension = filepath.suffix.lower()
-        try:
-            if extension == '.pdf':
-                with open(filepath, 'rb') as file:
-                    reader = PyPDF2.PdfReader(file)
-                    return "\n".join([page.extract_text() or "" for page in reader.pages])
-            elif extension in ['.docx', '.doc']:
-                doc = docx.Document(filepath)
-                return "\n".join([p.text for p in doc.paragraphs])
-            elif extension in ['.pptx', '.ppt']:
-                prs = Presentation(filepath)
-                return "\n".join([shape.text for slide in prs.slides for shape in slide.shapes if hasattr(shape, 'text')])
-            elif extension == '.txt':
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    return file.read()
-            else:
-                return ""
-        except Exception as e:
-            logger.error(f"Lỗi đọc toàn bộ nội dung {filepath}: {e}")
-            return ""
+        """Trích xuất toàn bộ nội dung file (không cắt theo CONTENT_PREVIEW_LIMIT), qua content cache"""
+        if self.content_cache is None:
+            return self._parse_full_content(filepath)
+        return self.content_cache.get(filepath, self._parse_full_content)
+
+    @staticmethod
+    def _parse_full_content(filepath: Path) -> str:
+        return document_extractor.extract_content(filepath, limit=None)
+
+    def _cache_content(self, filepath: Path, stat: os.stat_result, content: str):
+        if self.content_cache is not None:
+            self.content_cache.put(filepath, content, (stat.st_mtime_ns, stat.st_size))
+
+    def _parse_and_cache(self, filepath: Path, stat: os.stat_result) -> str:
+        """Parse file (đã biết là chưa có trong cache) rồi lưu vào content cache"""
+        content = self._parse_full_content(filepath)
+        self._cache_content(filepath, stat, content)
+        return content
+
+    def summarize_file(self, filepath: str) -> str:
+        """Tóm tắt map-reduce toàn văn file (tóm tắt từng chunk được cache theo hash nội dung)"""
+        return summarize_text(self.extract_full_content(Path(filepath)))
 
     def classify_files_by_topic(self, topic: str):
-        """Cập nhật label cho từng file nếu liên quan chủ đề"""
-        for metadata in self.file_index.values():
+        """
+        Cập nhật label cho từng file nếu liên quan chủ đề (hỏi LLM theo lô nhiều file).
+        Verdict đã có trong verdict cache được dùng lại, chỉ tài liệu mới/đã thay đổi phải hỏi LLM.
+        """
+        documents = {}
+        by_path = {}
+        for metadata in self.snapshot():
             full_content = self.extract_full_content(Path(metadata.filepath))
-            if len(full_content) > 4000:
-                full_content = full_content[:3000] + '\n...\n' + full_content[-1000:]
             if not full_content.strip():
                 continue
-            if ask_llm_yesno(full_content, topic):
-                metadata.label = f"{topic}"
+            documents[metadata.filepath] = full_content
+            by_path[metadata.filepath] = metadata
+
+        hashes = {path: content_hash(content) for path, content in documents.items()}
+        cached = self.verdict_cache.get_many(hashes.values(), topic) if self.verdict_cache is not None else {}
+        verdicts = {path: cached[h] for path, h in hashes.items() if h in cached}
+        pending = [(path, content) for path, content in documents.items() if path not in verdicts]
+        if pending:
+            fresh = ask_llm_yesno_batch(pending, topic)
+            verdicts.update(fresh)
+            if self.verdict_cache is not None:
+                self.verdict_cache.put_many({hashes[path]: v for path, v in fresh.items()}, topic)
+        logger.info(f"Phân loại '{topic}': {len(documents) - len(pending)} từ cache, {len(pending)} hỏi LLM")
+
+        related = [by_path[path] for path, is_related in verdicts.items() if is_related]
+        for metadata in related:
+            metadata.label = f"{topic}"
+        self._persist(related)
         
-# Khởi tạo file indexer
-file_indexer = FileIndexer()
+# Khởi tạo file indexer (nạp index đã lưu trên đĩa nếu có)
+file_indexer = FileIndexer(index_store=IndexStore(), content_cache=ContentCache(),
+                           verdict_cache=VerdictCache(), vector_index=VectorIndex())
 
 # Tạo MCP Server
 server = Server("filesystem-manager")
@@ -229,6 +527,12 @@ async def handle_list_resources() -> list[types.Resource]:
             description="Tìm kiếm file theo từ khóa",
             mimeType="application/json",
         ),
+        types.Resource(
+            uri="filesystem://stats",
+            name="Index Stats",
+            description="Thống kê index và cache nội dung (hit rate, bộ nhớ)",
+            mimeType="application/json",
+        ),
     ]
 
 @server.read_resource()
@@ -236,13 +540,15 @@ async def handle_read_resource(uri: str) -> str:
     """Đọc resource theo URI"""
     if uri == "filesystem://index":
         # Trả về danh sách tất cả file đã index
-        files = list(file_indexer.file_index.values())
+        files = file_indexer.snapshot()
         return json.dumps([file.dict() for file in files], indent=2, ensure_ascii=False)
     elif uri.startswith("filesystem://search?q="):
         # Tìm kiếm file
         query = uri.split("q=")[1]
         results = file_indexer.search_files(query)
         return json.dumps([file.dict() for file in results], indent=2, ensure_ascii=False)
+    elif uri == "filesystem://stats":
+        return json.dumps(file_indexer.get_stats(), indent=2, ensure_ascii=False)
     else:
         raise ValueError(f"Unknown resource: {uri}")
 
@@ -259,6 +565,10 @@ async def handle_list_tools() -> list[types.Tool]:
                     "directory": {
                         "type": "string",
                         "description": "Đường dẫn thư mục cần quét (để trống = thư mục hiện tại)"
+                    },
+                    "workers": {
+                        "type": "integer",
+                        "description": "Số process trích xuất song song (để trống = theo cấu hình)"
                     }
                 }
             },
@@ -277,6 +587,67 @@ async def handle_list_tools() -> list[types.Tool]:
                 "required": ["query"]
             },
         ),
+        types.Tool(
+            name="semantic_search",
+            description="Tìm kiếm file theo ngữ nghĩa (embedding), tìm được cả tài liệu dùng từ đồng nghĩa",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Câu hỏi hoặc mô tả nội dung cần tìm"
+                    },
+                    "top_k": {
+                        "type": "integer",
+                        "description": "Số kết quả tối đa",
+                        "default": SEMANTIC_TOP_K
+                    },
+                    "min_score": {
+                        "type": "number",
+                        "description": "Điểm cosine tối thiểu (0-1)",
+                        "default": SEMANTIC_MIN_SCORE
+                    }
+                },
+                "required": ["query"]
+            },
+        ),
+        types.Tool(
+            name="hybrid_search",
+            description="Tìm kiếm kết hợp từ khóa (BM25) và ngữ nghĩa (embedding), xếp hạng bằng reciprocal rank fusion",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Từ khóa hoặc câu hỏi"
+                    },
+                    "semantic_query": {
+                        "type": "string",
+                        "description": "Câu hỏi đầy đủ cho nhánh ngữ nghĩa (mặc định dùng query)"
+                    },
+                    "top_k": {
+                        "type": "integer",
+                        "description": "Số kết quả tối đa",
+                        "default": SEARCH_TOP_K
+                    }
+                },
+                "required": ["query"]
+            },
+        ),
+        types.Tool(
+            name="summarize_file",
+            description="Tóm tắt toàn bộ nội dung file (kể cả tài liệu dài nhiều trang)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "filepath": {
+                        "type": "string",
+                        "description": "Đường dẫn file đã index"
+                    }
+                },
+                "required": ["filepath"]
+            },
+        ),
         types.Tool(
             name="get_file_info",
             description="Lấy thông tin chi tiết của file",
@@ -328,9 +699,12 @@ async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent
     if name == "scan_directory":
         directory = arguments.get("directory", ".")
         try:
-            files = file_indexer.scan_directory(Path(directory))
+            files = file_indexer.scan_directory(Path(directory), workers=arguments.get("workers"))
+            stats = file_indexer.last_scan_stats
             result = {
                 "message": f"Đã quét và index {len(files)} file",
+                "cache_hits": stats["hits"],
+                "cache_misses": stats["misses"],
                 "files": [
                     {
                         "filename": f.filename,
@@ -348,23 +722,86 @@ async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent
     elif name == "search_files":
         query = arguments["query"]
         try:
-            results = file_indexer.search_files(query)
+            ranked = file_indexer.search_ranked(query)
+            if not ranked:
+                ranked = [(f, None) for f in file_indexer.search_files(query)]
             result = {
                 "query": query,
-                "found": len(results),
+                "found": len(ranked),
                 "files": [
                     {
                         "filename": f.filename,
                         "filepath": f.filepath,
                         "label": f.label,
+                        "score": round(score, 4) if score is not None else None,
                         "content_preview": f.content_preview[:200] + "..." if len(f.content_preview) > 200 else f.content_preview
-                    } for f in results
+                    } for f, score in ranked
                 ]
             }
             return [types.TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
         except Exception as e:
             return [types.TextContent(type="text", text=f"Lỗi tìm kiếm: {e}")]
     
+    elif name == "semantic_search":
+        query = arguments["query"]
+        try:
+            if not file_indexer.vectors_enabled():
+                return [types.TextContent(type="text", text="Tìm kiếm ngữ nghĩa chưa sẵn sàng (thiếu model embedding)")]
+            ranked = file_indexer.semantic_search(
+                query,
+                top_k=arguments.get("top_k", SEMANTIC_TOP_K),
+                min_score=arguments.get("min_score", SEMANTIC_MIN_SCORE),
+            )
+            result = {
+                "query": query,
+                "found": len(ranked),
+                "files": [
+                    {
+                        "filename": f.filename,
+                        "filepath": f.filepath,
+                        "label": f.label,
+                        "score": round(score, 4),
+                        "content_preview": f.content_preview[:200] + "..." if len(f.content_preview) > 200 else f.content_preview
+                    } for f, score in ranked
+                ]
+            }
+            return [types.TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+        except Exception as e:
+            return [types.TextContent(type="text", text=f"Lỗi tìm kiếm ngữ nghĩa: {e}")]
+
+    elif name == "hybrid_search":
+        query = arguments["query"]
+        try:
+            ranked = file_indexer.hybrid_search(query, top_k=arguments.get("top_k", SEARCH_TOP_K),
+                                                semantic_query=arguments.get("semantic_query"))
+            result = {
+                "query": query,
+                "found": len(ranked),
+                "files": [
+                    {
+                        "filename": f.filename,
+                        "filepath": f.filepath,
+                        "label": f.label,
+                        "scores": scores,
+                        "content_preview": f.content_preview[:200] + "..." if len(f.content_preview) > 200 else f.content_preview
+                    } for f, scores in ranked
+                ]
+            }
+            return [types.TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+        except Exception as e:
+            return [types.TextContent(type="text", text=f"Lỗi tìm kiếm kết hợp: {e}")]
+
+    elif name == "summarize_file":
+        filepath = arguments["filepath"]
+        try:
+            metadata = file_indexer.file_index.get(filepath)
+            if not metadata:
+                return [types.TextContent(type="text", text=f"Không tìm thấy file: {filepath}")]
+            result = {"filename": metadata.filename, "summary": file_indexer.summarize_file(filepath)}
+            return [types.TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+        except Exception as e:
+            return [types.TextContent(type="text", text=f"Lỗi tóm tắt file: {e}")]
+
     elif name == "get_file_info":
         filepath = arguments["filepath"]
         print (f"filepath {filepath}")
@@ -380,40 +817,20 @@ async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent
     elif name == "export_metadata":
         format_type = arguments.get("format", "json")
         try:
-            files = list(file_indexer.file_index.values())
+            files = file_indexer.snapshot()
             
 
             if format_type == "json":
-                metadata_for_cloud = []
-                success_count = 0
-                error_count = 0
-                error_files = []
+                metadata_for_cloud = [metadata_record(f) for f in files]
 
-                for f in files:
-                    metadata = {
-                        "filename": f.filename,
-                        "label": f.label,
-                        "content": f.content_preview[:500],
-                        "file_type": f.file_type,
-                        "size": f.size
-                    }
-                    metadata_for_cloud.append(metadata)
-
-                    # Gửi metadata lên MCP Cloud
-                    try:
-                        resp = requests.post(MCP_CLOUD_API_URL, json=metadata)
-                        if resp.status_code == 200:
-                            success_count += 1
-                        else:
-                            error_count += 1
-                            error_files.append(f.filename)
-                    except Exception as e:
-                        error_count += 1
-                        error_files.append(f.filename)
-                
-                logger.info(f"Đã gửi {success_count} metadata thành công, {error_count} lỗi")
-                if error_files:
-                    logger.error(f"Các file gặp lỗi: {', '.join(error_files)}")
+                # Gửi metadata lên MCP Cloud theo lô NDJSON, các lô chạy song song
+                report = export_metadata_bulk(metadata_for_cloud)
+                logger.info(f"Đã gửi {report['sent']} metadata thành công, {report['failed']} lỗi")
+                for batch in report["batches"]:
+                    if batch["error"]:
+                        logger.error(f"Lô {batch['batch']} gửi thất bại: {batch['error']}")
+                    if batch["rejected"]:
+                        logger.error(f"Các file bị từ chối: {', '.join(r['filename'] for r in batch['rejected'])}")
 
                 return [types.TextContent(type="text", text=json.dumps(metadata_for_cloud, indent=2, ensure_ascii=False))]
             else:
@@ -446,7 +863,7 @@ async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent
     else:
         return [types.TextContent(type="text", text=f"Tool không được hỗ trợ: {name}")]
 
-async def main():
+async def main(watch: bool = WATCH_ENABLED, polling: bool = False):
     """Chạy MCP server"""
     # Quét thư mục ban đầu
     logger.info("Khởi động MCP Filesystem Server...")
@@ -456,6 +873,12 @@ async def main():
         logger.info(f"Đã index {len(initial_files)} file ban đầu")
     except Exception as e:
         logger.error(f"Lỗi quét thư mục ban đầu: {e}")
+
+    # Watcher mode: cập nhật index theo thay đổi, không cần quét lại
+    watcher = None
+    if watch:
+        watcher = IndexWatcher(file_indexer, str(file_indexer.base_path), use_polling=polling)
+        watcher.start()
     
     # Chạy server
     async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
@@ -472,5 +895,16 @@ async def main():
             ),
         )
 
+    if watcher is not None:
+        watcher.stop()
+    file_indexer.save_vectors()
+
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="MCP Filesystem Server")
+    parser.add_argument("--watch", action="store_true", default=WATCH_ENABLED,
+                        help="Theo dõi thư mục và cập nhật index theo thay đổi")
+    parser.add_argument("--polling", action="store_true",
+                        help="Dùng polling thay cho inotify/watchdog")
+    args = parser.parse_args()
+    asyncio.run(main(watch=args.watch, polling=args.polling)) 
\ No newline at end of file
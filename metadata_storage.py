@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+"""
+Metadata Storage
+Backend lưu metadata cho MCPMetadataService, có index theo filename để tra cứu O(1):
+- JsonlStorage: file JSONL append-only, index filename -> byte offset trong bộ nhớ (dựng lại khi khởi động)
+- SqliteStorage: bảng SQLite (WAL) có index trên filename
+Tra cứu theo filename trả về bản ghi mới nhất. compact() bỏ các bản cũ / trùng nội dung,
+MetadataCompactor chạy compact định kỳ trên thread nền.
+GroupCommitWriter: một task ghi duy nhất cho server async, gom các request đang chờ
+thành một lần append và fsync theo cửa sổ durability.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# SQLite compact: số bản ghi xóa / số trang trả lại mỗi lần giữ khóa
+COMPACT_DELETE_CHUNK = 500
+VACUUM_PAGES_PER_STEP = 256
+
+
+def _read_jsonl(path: Path) -> Iterator[dict]:
+    """Đọc tuần tự các bản ghi của file JSONL, bỏ qua dòng hỏng"""
+    with path.open("rb") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def _signature(record: dict) -> str:
+    """Nội dung bản ghi không tính timestamp: xuất lại file không đổi gì thì cùng signature"""
+    return json.dumps({k: v for k, v in record.items() if k != "timestamp"}, ensure_ascii=False, sort_keys=True)
+
+
+def _versions_to_keep(entries: Iterable[Tuple[Any, str, str]], keep_versions: int) -> Set[Any]:
+    """
+    entries: (khóa, filename, signature) theo thứ tự ghi.
+    Mỗi filename giữ bản mới nhất + keep_versions bản cũ; các bản liên tiếp trùng nội dung chỉ giữ bản mới hơn.
+    """
+    kept: Dict[str, List[Tuple[Any, str]]] = {}
+    for key, filename, signature in entries:
+        versions = kept.setdefault(filename, [])
+        if versions and versions[-1][1] == signature:
+            versions[-1] = (key, signature)
+        else:
+            versions.append((key, signature))
+            if len(versions) > keep_versions + 1:
+                versions.pop(0)
+    return {key for versions in kept.values() for key, _ in versions}
+
+
+class MetadataStorage:
+    """Giao diện chung của các backend lưu metadata"""
+
+    def append_many(self, records: List[dict]):
+        raise NotImplementedError
+
+    def append(self, record: dict):
+        self.append_many([record])
+
+    def get(self, filename: str) -> Optional[dict]:
+        """Metadata của filename, None nếu chưa có"""
+        raise NotImplementedError
+
+    def iter_from(self, cursor: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Duyệt (cursor, bản ghi) theo thứ tự ghi, bắt đầu sau vị trí cursor (None: từ đầu).
+        cursor đi kèm mỗi bản ghi trỏ tới ngay sau bản ghi đó, dùng để đọc tiếp trang sau.
+        cursor không hợp lệ / đã hết hạn -> ValueError (báo ngay, không đợi lúc duyệt).
+        """
+        raise NotImplementedError
+
+    def iter_records(self) -> Iterator[dict]:
+        """Duyệt lần lượt mọi bản ghi theo thứ tự ghi"""
+        return (record for _, record in self.iter_from())
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def sync(self):
+        """Đẩy dữ liệu đã ghi xuống đĩa (fsync)"""
+        raise NotImplementedError
+
+    def compact(self, keep_versions: int = 0) -> Dict[str, Any]:
+        """Bỏ bản ghi cũ / trùng, trả về báo cáo (số bản ghi, số byte thu hồi)"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonlStorage(MetadataStorage):
+    """File JSONL append-only + index filename -> offset của bản ghi"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch(exist_ok=True)
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._generation = 0
+        self._offsets: Dict[str, int] = {}
+        self._records = 0
+        self._rebuild_index()
+        self._writer = self.path.open("ab")
+
+    def _rebuild_index(self):
+        """Quét file một lần khi khởi động để dựng index offset"""
+        self._offsets.clear()
+        self._records = 0
+        offset = 0
+        with self.path.open("rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Dòng cuối ghi dở (tiến trình bị dừng giữa chừng): xuống dòng để bản ghi sau không dính vào
+                    logger.warning(f"{self.path}: dòng cuối ghi dở tại offset {offset}, bỏ qua")
+                    with self.path.open("ab") as w:
+                        w.write(b"\n")
+                    break
+                if line.strip():
+                    try:
+                        self._index(json.loads(line).get("filename"), offset)
+                    except (ValueError, AttributeError) as e:
+                        logger.warning(f"{self.path}: bỏ qua dòng hỏng tại offset {offset}: {e}")
+                offset += len(line)
+
+    def _index(self, filename: Optional[str], offset: int):
+        self._records += 1
+        if filename is not None:
+            # Bản ghi sau ghi đè index: tra cứu luôn ra bản mới nhất
+            self._offsets[filename] = offset
+
+    def append_many(self, records: List[dict]):
+        lines = [(json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8") for r in records]
+        with self._lock:
+            offset = self._writer.tell()
+            self._writer.write(b"".join(lines))
+            self._writer.flush()
+            for record, line in zip(records, lines):
+                self._index(record.get("filename"), offset)
+                offset += len(line)
+
+    def get(self, filename: str) -> Optional[dict]:
+        # Giữ khóa để không đọc offset cũ trong lúc compact thay file
+        with self._lock:
+            offset = self._offsets.get(filename)
+            if offset is None:
+                return None
+            with self.path.open("rb") as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+
+    def iter_from(self, cursor: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        # cursor "<generation>:<offset>": compact đổi offset nên cursor của generation cũ hết hạn
+        with self._lock:
+            self._writer.flush()
+            generation, end = self._generation, self._writer.tell()
+            offset = 0
+            if cursor:
+                try:
+                    cursor_generation, cursor_offset = (int(part) for part in cursor.split(":"))
+                except ValueError:
+                    raise ValueError(f"Cursor không hợp lệ: {cursor}")
+                if cursor_generation != generation or not 0 <= cursor_offset <= end:
+                    raise ValueError("Cursor đã hết hạn (dữ liệu vừa được compact), hãy đọc lại từ đầu")
+                offset = cursor_offset
+            # Mở file dưới khóa: compact thay file sau đó cũng không ảnh hưởng tới handle này
+            f = self.path.open("rb")
+        return self._iter_file(f, generation, offset, end)
+
+    @staticmethod
+    def _iter_file(f, generation: int, offset: int, end: int) -> Iterator[Tuple[str, dict]]:
+        with f:
+            f.seek(offset)
+            while offset < end:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                if line.strip():
+                    try:
+                        yield f"{generation}:{offset}", json.loads(line)
+                    except ValueError:
+                        continue
+
+    def stats(self) -> Dict[str, int]:
+        return {"records": self._records, "filenames": len(self._offsets),
+                "bytes": self.path.stat().st_size}
+
+    def sync(self):
+        with self._lock:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+
+    def compact(self, keep_versions: int = 0) -> Dict[str, Any]:
+        """
+        Ghi các bản ghi giữ lại sang file tạm rồi os.replace (nguyên tử).
+        Phần [0, end) được chọn lọc và tính offset mới mà không chặn ghi; dưới khóa chỉ chép (và index)
+        phần ghi thêm trong lúc đó rồi thay file và index offset.
+        """
+        with self._compact_lock:
+            started = time.time()
+            with self._lock:
+                self._writer.flush()
+                end = self._writer.tell()
+
+            entries = []
+            for offset, line in self._scan(end):
+                try:
+                    record = json.loads(line)
+                    entries.append((offset, record["filename"], _signature(record)))
+                except (ValueError, KeyError, TypeError):
+                    continue
+            keep = _versions_to_keep(entries, keep_versions)
+            filenames = {offset: filename for offset, filename, _ in entries if offset in keep}
+            del entries
+
+            tmp_path = self.path.with_name(self.path.name + ".compact")
+            offsets: Dict[str, int] = {}
+            records_after = 0
+            position = 0
+            replaced = False
+            try:
+                with tmp_path.open("wb") as dst:
+                    for offset, line in self._scan(end):
+                        if offset in filenames:
+                            dst.write(line)
+                            offsets[filenames[offset]] = position
+                            records_after += 1
+                            position += len(line)
+                    with self._lock:
+                        self._writer.flush()
+                        bytes_before = self._writer.tell()
+                        records_before = self._records
+                        # Phần ghi thêm từ lúc bắt đầu compact: chép nguyên và index theo offset mới
+                        with self.path.open("rb") as src:
+                            src.seek(end)
+                            for line in src:
+                                dst.write(line)
+                                if line.strip():
+                                    try:
+                                        filename = json.loads(line).get("filename")
+                                    except (ValueError, AttributeError):
+                                        filename = None
+                                    else:
+                                        records_after += 1
+                                    if filename is not None:
+                                        offsets[filename] = position
+                                position += len(line)
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                        dst.close()
+                        self._writer.close()
+                        try:
+                            os.replace(tmp_path, self.path)
+                            replaced = True
+                            self._generation += 1
+                            self._offsets = offsets
+                            self._records = records_after
+                        finally:
+                            # Thay file lỗi (vd. Windows: file đang được stream NDJSON mở) -> ghi tiếp vào file cũ
+                            self._writer = self.path.open("ab")
+                        bytes_after = self._writer.tell()
+            finally:
+                if not replaced:
+                    tmp_path.unlink(missing_ok=True)
+
+        report = {
+            "success": True,
+            "records_before": records_before,
+            "records_after": records_after,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_reclaimed": bytes_before - bytes_after,
+            "seconds": round(time.time() - started, 3),
+        }
+        logger.info(f"Compact {self.path}: {report}")
+        return report
+
+    def _scan(self, end: int) -> Iterator[Tuple[int, bytes]]:
+        """(offset, dòng) của các dòng hoàn chỉnh trong [0, end)"""
+        offset = 0
+        with self.path.open("rb") as f:
+            while offset < end:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                yield offset, line
+                offset += len(line)
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+
+
+class SqliteStorage(MetadataStorage):
+    """Bảng records(seq, filename, record) trong SQLite WAL, index trên (filename, seq)"""
+
+    def __init__(self, db_path: Path, import_from: Optional[Path] = None):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        # Phải đặt trước khi tạo bảng: compact trả dung lượng theo từng phần bằng incremental_vacuum
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT NOT NULL,
+                record TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_filename ON records (filename, seq)")
+        self._conn.commit()
+        if import_from is not None:
+            self._import_jsonl(Path(import_from))
+
+    def _import_jsonl(self, path: Path):
+        """Lần đầu chuyển sang SQLite: nạp dữ liệu từ file JSONL cũ"""
+        if not path.exists() or self._conn.execute("SELECT 1 FROM records LIMIT 1").fetchone():
+            return
+        records = list(_read_jsonl(path))
+        if records:
+            self.append_many(records)
+            logger.info(f"Đã chuyển {len(records)} bản ghi từ {path} sang {self.db_path}")
+
+    def append_many(self, records: List[dict]):
+        rows = [(r.get("filename", ""), json.dumps(r, ensure_ascii=False)) for r in records]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT INTO records (filename, record) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def get(self, filename: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM records WHERE filename = ? ORDER BY seq DESC LIMIT 1", (filename,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter_from(self, cursor: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        # cursor là seq của bản ghi cuối đã đọc (seq không đổi khi compact)
+        try:
+            last_seq = int(cursor) if cursor else 0
+        except ValueError:
+            raise ValueError(f"Cursor không hợp lệ: {cursor}")
+        return self._iter_seq(last_seq)
+
+    def _iter_seq(self, last_seq: int) -> Iterator[Tuple[str, dict]]:
+        # Đọc theo trang để không giữ khóa / toàn bộ kết quả trong bộ nhớ
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, record FROM records WHERE seq > ? ORDER BY seq LIMIT 500", (last_seq,)
+                ).fetchall()
+            if not rows:
+                return
+            for seq, raw in rows:
+                last_seq = seq
+                yield str(seq), json.loads(raw)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            records, filenames = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT filename) FROM records"
+            ).fetchone()
+        return {"records": records, "filenames": filenames, "bytes": self._size()}
+
+    def sync(self):
+        # WAL + synchronous=NORMAL: commit chưa fsync, checkpoint sẽ fsync WAL rồi chép vào file db
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def _size(self) -> int:
+        wal = self.db_path.with_name(self.db_path.name + "-wal")
+        return self.db_path.stat().st_size + (wal.stat().st_size if wal.exists() else 0)
+
+    def compact(self, keep_versions: int = 0) -> Dict[str, Any]:
+        """
+        Chọn bản ghi cần xóa trên snapshot seq <= max_seq bằng một connection đọc riêng (WAL: không chặn
+        đọc/ghi), duyệt theo (filename, seq) nên chỉ giữ trong bộ nhớ các bản của một filename.
+        Xóa theo từng lô nhỏ rồi trả dung lượng bằng incremental_vacuum, mỗi bước chỉ giữ khóa ngắn.
+        """
+        started = time.time()
+        with self._lock:
+            bytes_before = self._size()
+            records_before, max_seq = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(seq), 0) FROM records"
+            ).fetchone()
+
+        dropped, pending = 0, []
+        reader = sqlite3.connect(str(self.db_path))
+        try:
+            rows = reader.execute(
+                "SELECT seq, filename, record FROM records WHERE seq <= ? ORDER BY filename, seq", (max_seq,)
+            )
+            for _, group in itertools.groupby(rows, key=lambda row: row[1]):
+                entries = [(seq, filename, _signature(json.loads(raw))) for seq, filename, raw in group]
+                keep = _versions_to_keep(entries, keep_versions)
+                pending.extend(seq for seq, _, _ in entries if seq not in keep)
+                if len(pending) >= COMPACT_DELETE_CHUNK:
+                    dropped += self._delete(pending)
+                    pending = []
+        finally:
+            reader.close()
+        dropped += self._delete(pending)
+        if dropped:
+            self._reclaim_space()
+        with self._lock:
+            bytes_after = self._size()
+
+        report = {
+            "success": True,
+            "records_before": records_before,
+            "records_after": records_before - dropped,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_reclaimed": bytes_before - bytes_after,
+            "seconds": round(time.time() - started, 3),
+        }
+        logger.info(f"Compact {self.db_path}: {report}")
+        return report
+
+    def _delete(self, seqs: List[int]) -> int:
+        for i in range(0, len(seqs), COMPACT_DELETE_CHUNK):
+            chunk = [(seq,) for seq in seqs[i:i + COMPACT_DELETE_CHUNK]]
+            with self._lock:
+                self._conn.executemany("DELETE FROM records WHERE seq = ?", chunk)
+                self._conn.commit()
+        return len(seqs)
+
+    def _reclaim_space(self):
+        """Trả các trang trống về hệ điều hành theo từng bước nhỏ, rồi thu gọn WAL"""
+        with self._lock:
+            incremental = self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+            if not incremental:
+                # DB tạo trước khi bật auto_vacuum: VACUUM một lần để chuyển sang INCREMENTAL
+                self._conn.execute("VACUUM")
+        while incremental:
+            with self._lock:
+                self._conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})").fetchall()
+                self._conn.commit()
+                if not self._conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                    break
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MetadataCompactor:
+    """Thread nền: định kỳ compact khi số bản ghi vượt min_ratio lần số bản cần giữ"""
+
+    def __init__(self, storage: MetadataStorage, interval: float, keep_versions: int = 0,
+                 min_ratio: float = 2.0):
+        self.storage = storage
+        self.interval = interval
+        self.keep_versions = keep_versions
+        self.min_ratio = min_ratio
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def should_compact(self) -> bool:
+        stats = self.storage.stats()
+        return stats["records"] >= self.min_ratio * max(1, stats["filenames"] * (self.keep_versions + 1))
+
+    def run_once(self, force: bool = False) -> Dict[str, Any]:
+        if not force and not self.should_compact():
+            return {"success": True, "skipped": True, **self.storage.stats()}
+        self.last_report = self.storage.compact(self.keep_versions)
+        return self.last_report
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Lỗi compact metadata: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="metadata-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class GroupCommitWriter:
+    """
+    Hàng đợi một người ghi cho server async: mỗi vòng lấy hết các request đang chờ (tối đa max_batch
+    bản ghi), ghi bằng một lần append_many trên thread phụ rồi mới trả kết quả cho từng request.
+    durability_window = 0: fsync trước khi trả lời mỗi lần ghi.
+    durability_window > 0: trả lời ngay sau khi ghi, fsync tối đa mỗi durability_window giây
+    (mất điện có thể mất tối đa chừng đó giây dữ liệu đã xác nhận).
+    """
+
+    def __init__(self, storage: MetadataStorage, durability_window: float = 0.0, max_batch: int = 1000):
+        self.storage = storage
+        self.durability_window = durability_window
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+        self.stats = {"requests": 0, "records": 0, "commits": 0, "syncs": 0}
+
+    async def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        # Giữ nguyên hàng đợi cũ (nếu có): request đã xếp hàng vẫn được task mới xử lý
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name="metadata-writer")
+
+    async def stop(self):
+        """Ghi nốt các request còn trong hàng đợi, fsync rồi dừng"""
+        if self._task is None:
+            return
+        if not self._task.done():
+            await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, records: List[dict]):
+        """Chờ tới khi records đã được ghi (và fsync nếu durability_window = 0)"""
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((records, future))
+        await future
+
+    async def _run(self):
+        # Task dừng bất ngờ: báo lỗi cho các request đang chờ thay vì để chúng chờ mãi
+        try:
+            await self._loop()
+        except asyncio.CancelledError:
+            self._fail_pending(RuntimeError("Hàng đợi ghi metadata đã dừng"))
+            raise
+        except Exception as e:
+            logger.error(f"Hàng đợi ghi metadata dừng do lỗi: {e!r}")
+            self._fail_pending(e)
+
+    def _fail_pending(self, error: Exception):
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None and not item[1].done():
+                item[1].set_exception(error)
+
+    async def _loop(self):
+        stopping = False
+        while not stopping:
+            try:
+                # Còn dữ liệu chưa fsync: đợi tối đa tới hạn của cửa sổ durability
+                timeout = self._sync_due() if self._unsynced else None
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await self._idle_sync()
+                continue
+
+            batch, count = [], 0
+            while item is not None:
+                batch.append(item)
+                count += len(item[0])
+                if count >= self.max_batch or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            stopping = item is None
+            if batch:
+                await self._commit(batch)
+
+        if self._unsynced:
+            await self._idle_sync()
+
+    async def _idle_sync(self):
+        try:
+            await asyncio.to_thread(self._sync)
+        except Exception as e:
+            # Dữ liệu vẫn chưa fsync: thử lại ở cửa sổ sau
+            logger.error(f"Lỗi fsync metadata: {e}")
+            self._last_sync = time.monotonic()
+
+    def _sync_due(self) -> float:
+        return max(0.0, self._last_sync + self.durability_window - time.monotonic())
+
+    def _sync(self):
+        self.storage.sync()
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+        self.stats["syncs"] += 1
+
+    def _write(self, records: List[dict]):
+        self.storage.append_many(records)
+        self._unsynced = True
+        if self._sync_due() > 0:
+            return
+        if self.durability_window <= 0:
+            self._sync()
+            return
+        # Có cửa sổ durability thì bản ghi đã được xác nhận sau khi ghi, lỗi fsync chỉ ghi log
+        try:
+            self._sync()
+        except Exception as e:
+            logger.error(f"Lỗi fsync metadata: {e}")
+            self._last_sync = time.monotonic()
+
+    async def _commit(self, batch: List[Tuple[List[dict], "asyncio.Future"]]):
+        records = [record for item_records, _ in batch for record in item_records]
+        try:
+            await asyncio.to_thread(self._write, records)
+            error = None
+        except Exception as e:
+            logger.error(f"Lỗi ghi {len(records)} metadata: {e}")
+            error = e
+        self.stats["requests"] += len(batch)
+        self.stats["records"] += len(records)
+        self.stats["commits"] += 1
+        for _, future in batch:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+
+def open_storage(backend: str, store_dir: str, filename: str = "metadata.json") -> MetadataStorage:
+    """Tạo backend theo tên ("jsonl" | "sqlite")"""
+    store_dir = Path(store_dir)
+    jsonl_path = store_dir / filename
+    if backend == "jsonl":
+        return JsonlStorage(jsonl_path)
+    if backend == "sqlite":
+        return SqliteStorage(store_dir / (Path(filename).stem + ".db"), import_from=jsonl_path)
+    raise ValueError(f"Backend lưu metadata không hỗ trợ: {backend}")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Model Loader
+Tải model ở background thay vì lúc import: giao diện khởi động ngay,
+request đầu tiên chờ trên future cho đến khi model sẵn sàng.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def run_in_background(name: str, func: Callable[[], Any]) -> Future:
+    """Chạy func trên một daemon thread, trả về Future chứa kết quả"""
+    future: Future = Future()
+
+    def runner():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=runner, name=name, daemon=True).start()
+    return future
+
+
+class LazyModel:
+    """
+    Proxy tới model thật: thuộc tính/hàm được chuyển tiếp tới model sau khi tải xong,
+    nên code cũ dùng `llm.create_chat_completion(...)` không phải sửa.
+    """
+
+    def __init__(self, loader: Callable[[], Any], name: str = "model"):
+        self._loader = loader
+        self._name = name
+        self._future: Optional[Future] = None
+        self._lock = threading.Lock()
+        self._started_at: Optional[float] = None
+        self._load_seconds: Optional[float] = None
+
+    def _load(self):
+        model = self._loader()
+        self._load_seconds = time.monotonic() - self._started_at
+        logger.info(f"{self._name} sẵn sàng sau {self._load_seconds:.1f}s")
+        return model
+
+    def warm(self) -> Future:
+        """Bắt đầu tải model ở background (gọi nhiều lần chỉ tải một lần)"""
+        with self._lock:
+            if self._future is None:
+                self._started_at = time.monotonic()
+                self._future = run_in_background(f"{self._name}-loader", self._load)
+            return self._future
+
+    def wait(self, timeout: Optional[float] = None):
+        """Chờ model tải xong và trả về model thật (raise nếu tải lỗi)"""
+        return self.warm().result(timeout)
+
+    def is_ready(self) -> bool:
+        future = self._future
+        return future is not None and future.done() and future.exception() is None
+
+    def status(self) -> Dict[str, Any]:
+        """Trạng thái: not_started / loading / ready / failed"""
+        future = self._future
+        if future is None:
+            return {"state": "not_started"}
+        if not future.done():
+            return {"state": "loading", "elapsed_seconds": round(time.monotonic() - self._started_at, 1)}
+        error = future.exception()
+        if error is not None:
+            return {"state": "failed", "error": str(error)}
+        return {"state": "ready", "load_seconds": round(self._load_seconds, 1)}
+
+    def __getattr__(self, name: str):
+        # Chỉ được gọi với thuộc tính không có trên proxy -> chuyển sang model thật
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.wait(), name)
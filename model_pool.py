@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Model Pool
+Nhiều context llama.cpp cho cùng một file GGUF. Weights được mmap nên các context
+dùng chung page cache, mỗi context có KV-cache và số thread riêng.
+Các lời gọi độc lập (vd. phân loại nhiều lô tài liệu) chạy song song trên các context rảnh.
+"""
+
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+class ModelPool:
+    """Pool các context Llama; mỗi context chỉ phục vụ một lời gọi tại một thời điểm"""
+
+    def __init__(self, loader: Callable[[], Any], size: int = 1):
+        self.size = max(1, size)
+        self.contexts = []
+        for i in range(self.size):
+            self.contexts.append(loader())
+            logger.info(f"Đã tạo context {i + 1}/{self.size}")
+        self._idle: "queue.Queue" = queue.Queue()
+        for context in self.contexts:
+            self._idle.put(context)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="llm-pool")
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "batch_calls": 0, "waits": 0}
+
+    @contextmanager
+    def acquire(self, timeout: float = None):
+        """Mượn một context rảnh (chờ nếu tất cả đang bận)"""
+        try:
+            context = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.stats["waits"] += 1
+            context = self._idle.get(timeout=timeout)
+        try:
+            yield context
+        finally:
+            self._idle.put(context)
+
+    def create_chat_completion(self, **kwargs):
+        """Như Llama.create_chat_completion; với stream=True context được giữ đến khi đọc hết stream"""
+        with self._lock:
+            self.stats["calls"] += 1
+        if kwargs.get("stream"):
+            return self._stream_chat_completion(kwargs)
+        with self.acquire() as context:
+            return context.create_chat_completion(**kwargs)
+
+    def _stream_chat_completion(self, kwargs: Dict[str, Any]) -> Iterator[dict]:
+        with self.acquire() as context:
+            yield from context.create_chat_completion(**kwargs)
+
+    def tokenize(self, *args, **kwargs):
+        # Tokenizer chỉ đọc vocab của model, không cần mượn context
+        return self.contexts[0].tokenize(*args, **kwargs)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Chạy fn trên thread của pool (fn tự gọi các hàm của pool, vd. create_chat_completion)"""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn: Callable, items: Iterable, return_exceptions: bool = False) -> List:
+        """
+        Chạy fn(item) song song (tối đa `size` lời gọi cùng lúc), giữ nguyên thứ tự kết quả.
+        Không gọi map từ bên trong một task của pool (các thread của pool sẽ chờ lẫn nhau).
+        """
+        futures = [self.submit(fn, item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    def create_chat_completion_batch(self, requests: List[Dict[str, Any]],
+                                     return_exceptions: bool = False) -> List:
+        """Gửi nhiều request (mỗi request là kwargs của create_chat_completion) cùng lúc"""
+        with self._lock:
+            self.stats["batch_calls"] += 1
+        return self.map(lambda kwargs: self.create_chat_completion(**kwargs), requests, return_exceptions)
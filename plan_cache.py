@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Plan Cache
+Cache ActionPlan do planner LLM sinh ra (temperature 0 nên cùng prompt cho cùng plan).
+Khóa: prompt đã chuẩn hóa + hash của user_feedback.txt (feedback đổi thì plan cũ không dùng nữa).
+Prompt gần giống (chỉ khác dấu câu, vài ký tự) được tìm qua độ tương đồng trigram ký tự.
+Giới hạn số entry (LRU) và thời gian sống (TTL).
+"""
+
+import copy
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from plan_router import normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_key(user_input: str) -> str:
+    """Chuẩn hóa prompt: chữ thường, NFC, bỏ dấu câu, gộp khoảng trắng"""
+    return " ".join(re.sub(r"[^\w\s.\-]", " ", normalize_prompt(user_input)).split()).strip(" .-")
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Trigram ký tự của từng từ (có đệm đầu/cuối từ)"""
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def _numbers(text: str) -> FrozenSet[str]:
+    # Từ chứa chữ số (năm, tên file) phải khớp đúng: "marketing 2024" khác "marketing 2025"
+    return frozenset(word for word in text.split() if any(c.isdigit() for c in word))
+
+
+def file_hash(path: str) -> str:
+    """sha1 nội dung file, rỗng nếu chưa có file"""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return ""
+
+
+class PlanCache:
+    """LRU + TTL trong bộ nhớ: (hash feedback, prompt chuẩn hóa) -> plan (dict các field của ActionPlan)"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 24 * 3600,
+                 similarity: float = 0.9, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, FrozenSet[str], Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "stale": 0}
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    def _drop_stale(self, feedback_hash: str, now: float):
+        """Bỏ entry hết hạn hoặc sinh ra với feedback cũ"""
+        for key in [k for k, (created, _, _) in self._entries.items()
+                    if k[0] != feedback_hash or self._expired(created, now)]:
+            del self._entries[key]
+            self._stats["stale"] += 1
+
+    def get(self, user_input: str, feedback_hash: str) -> Optional[Dict[str, Any]]:
+        """Plan đã cache cho prompt (khớp đúng hoặc gần giống), None nếu không có"""
+        if not self.enabled:
+            return None
+        text = prompt_key(user_input)
+        now = time.time()
+        with self._lock:
+            self._drop_stale(feedback_hash, now)
+            key = (feedback_hash, text)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return copy.deepcopy(entry[2])
+
+            grams, numbers = trigrams(text), _numbers(text)
+            best_key, best_score = None, 0.0
+            for candidate, (_, candidate_grams, _) in self._entries.items():
+                if _numbers(candidate[1]) != numbers:
+                    continue
+                union = len(grams | candidate_grams)
+                score = len(grams & candidate_grams) / union if union else 0.0
+                if score > best_score:
+                    best_key, best_score = candidate, score
+            if best_key is not None and best_score >= self.similarity:
+                self._entries.move_to_end(best_key)
+                self._stats["near_hits"] += 1
+                logger.info(f"Plan cache: '{text}' ~ '{best_key[1]}' ({best_score:.2f})")
+                return copy.deepcopy(self._entries[best_key][2])
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, user_input: str, feedback_hash: str, plan: Dict[str, Any]):
+        if not self.enabled:
+            return
+        text = prompt_key(user_input)
+        with self._lock:
+            key = (feedback_hash, text)
+            self._entries[key] = (time.time(), trigrams(text), copy.deepcopy(plan))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["near_hits"] + self._stats["misses"]
+            hits = self._stats["hits"] + self._stats["near_hits"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            }
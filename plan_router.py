@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Plan Router
+Định tuyến nhanh trước planner LLM: các yêu cầu rõ ràng (khớp đúng một nhóm trigger word,
+tên file có trong index) được dựng ActionPlan trực tiếp, không tốn vài giây sinh JSON.
+Yêu cầu mơ hồ (nhiều nhóm trigger, không trích được tham số) vẫn chuyển cho LLM.
+Một model naive Bayes nhỏ học từ các plan của LLM để phủ quyết rule khi chắc chắn
+hành động khác, và định tuyến các yêu cầu không khớp rule nào.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from search_index import index_terms, strip_diacritics
+
+logger = logging.getLogger(__name__)
+
+# Trigger word của từng hành động (khớp bảng TRIGGER WORDS trong prompt planner)
+TRIGGERS: Dict[str, List[str]] = {
+    "learn": ["lần sau", "đừng", "không cần", "thay đổi cách", "tôi muốn bạn", "nhớ rằng", "từ giờ",
+              "phản hồi", "next time", "don't", "no need", "change the way", "i want you",
+              "remember that", "from now", "feedback"],
+    "search_exactly": ["so sánh", "tóm tắt", "đọc file", "đọc nội dung", "compare", "summarize", "read file"],
+    "classify_by_topic": ["theo chủ đề", "liên quan đến", "liên quan tới", "by topic", "related to"],
+    "classify": ["phân loại", "classify"],
+    "scan": ["quét", "scan"],
+    "export": ["xuất", "export", "backup", "sao lưu"],
+    "search": ["tìm", "search", "có file nào", "file về", "find"],
+}
+
+# Nhóm bị nhóm khác bao hàm khi xuất hiện cùng nhau
+# ("phân loại ... liên quan đến X" là classify_by_topic, "tìm file a.docx" là search_exactly)
+SUBSUMED_BY = {
+    "classify": "classify_by_topic",
+    "search": "search_exactly",
+}
+
+# Từ đệm bỏ khỏi đầu từ khóa/chủ đề trích được
+LEADING_FILLERS = ["các file", "những file", "tất cả file", "file", "tài liệu", "nào", "có",
+                   "nói về", "về", "liên quan đến", "liên quan tới", "chủ đề", "theo", "cho tôi", "giúp tôi",
+                   "giúp", "the", "files", "file about", "about", "related to", "for", "all"]
+
+LEADING_FILLER_PATTERN = re.compile(
+    r"^(?:(?:%s)(?!\w)[\s,:]*)+" % "|".join(re.escape(f) for f in sorted(LEADING_FILLERS, key=len, reverse=True)))
+
+# Từ đệm bỏ khỏi cuối ("... budget không?", "... marketing trong thư mục")
+TRAILING_FILLER_PATTERN = re.compile(
+    r"(?:[\s,]+(?:không|nào|gì|đâu|với|giúp tôi|cho tôi|trong thư mục|trong máy|please|nhé|nha))+$")
+
+# Cụm từ chứa trigger nhưng mang nghĩa khác ("tìm hiểu", "đề xuất"), bỏ đi trước khi khớp trigger
+FALSE_TRIGGERS = ["tìm hiểu", "đề xuất", "xuất sắc", "xuất hiện", "xuất bản"]
+
+# Mô tả/kết quả mong đợi cho plan dựng sẵn
+DESCRIPTIONS = {
+    "search": "Tìm kiếm file về '{arg}'",
+    "classify_by_topic": "Phân loại file theo chủ đề '{arg}'",
+    "classify": "Phân loại tất cả file",
+    "scan": "Quét các file trong thư mục",
+    "export": "Xuất metadata của các file",
+    "learn": "Ghi nhớ phản hồi của người dùng",
+    "general": "Trả lời yêu cầu của người dùng",
+}
+
+# Hành động không cần tham số: model học được có thể tự định tuyến khi không có rule nào khớp
+ARGUMENT_FREE_ACTIONS = ("classify", "general")
+
+# Hành động có tác dụng phụ (ghi user_feedback.txt, quét lại index, gửi dữ liệu lên cloud):
+# không định tuyến theo trigger word đơn lẻ ("đừng lo", "quét virus"), chỉ khi cả câu là một lệnh rõ ràng.
+# learn không có mẫu nào nên luôn để planner LLM quyết định.
+_POLITE = r"(?:(?:hãy|vui lòng|làm ơn|giúp tôi|please)\s+)*"
+IMPERATIVE_PATTERNS: Dict[str, Optional["re.Pattern"]] = {
+    "learn": None,
+    "scan": re.compile(
+        _POLITE + r"(?:quét|scan)(?:\s+lại)?(?:\s+(?:tất cả|các|toàn bộ|all|the))?"
+        r"(?:\s+(?:file|tài liệu|files|documents))?(?:\s+(?:trong|in))?(?:\s+(?:thư mục|folder|directory))?"
+        r"(?:\s+(?:giúp tôi|cho tôi|nhé|nha|please))?"),
+    "export": re.compile(
+        _POLITE + r"(?:xuất|export|sao lưu|backup)(?:\s+(?:tất cả|các|toàn bộ|all|the))?"
+        r"\s+(?:metadata|dữ liệu metadata)(?:\s+(?:của|of))?(?:\s+(?:các|tất cả|all|the))?"
+        r"(?:\s+(?:file|files|tài liệu))?(?:\s+(?:lên|to))?(?:\s+cloud)?(?:\s+(?:giúp tôi|cho tôi|nhé|nha|please))?"),
+}
+
+# Đuôi file: "budget.xlsx", "marketing-2024.docx"
+FILENAME_PATTERN = re.compile(r"[^\s\"'“”‘’,;:()]+\.(?:pdf|docx?|pptx?|txt|xlsx?)\b", re.IGNORECASE)
+
+
+def normalize_prompt(text: str) -> str:
+    """Chữ thường, NFC, gộp khoảng trắng"""
+    return " ".join(unicodedata.normalize("NFC", text.lower()).split())
+
+
+def _contains(text: str, phrase: str) -> bool:
+    return re.search(rf"(?<!\w){re.escape(phrase)}(?!\w)", text) is not None
+
+
+def _stem_key(filename: str) -> str:
+    """'Marketing-2024.docx' -> 'marketing 2024' (bỏ dấu) để so với câu người dùng gõ"""
+    stem = os.path.splitext(filename)[0]
+    return " ".join(strip_diacritics(normalize_prompt(re.sub(r"[-_.]+", " ", stem))).split())
+
+
+class KeywordModel:
+    """Naive Bayes đa thức trên term (có dấu + bỏ dấu) của prompt, nhãn là hàm đầu tiên của plan"""
+
+    def __init__(self):
+        self.class_counts: Counter = Counter()
+        self.term_counts: Dict[str, Counter] = {}
+        self.vocabulary = set()
+
+    @property
+    def samples(self) -> int:
+        return sum(self.class_counts.values())
+
+    def train(self, text: str, label: str):
+        self.class_counts[label] += 1
+        counts = self.term_counts.setdefault(label, Counter())
+        for term in index_terms(text):
+            counts[term] += 1
+            self.vocabulary.add(term)
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """(nhãn, xác suất hậu nghiệm) hoặc (None, 0) khi chưa học gì"""
+        if not self.class_counts:
+            return None, 0.0
+        terms = index_terms(text)
+        total = self.samples
+        vocab = len(self.vocabulary) + 1
+        scores = {}
+        for label, count in self.class_counts.items():
+            counts = self.term_counts.get(label, Counter())
+            denominator = sum(counts.values()) + vocab
+            score = math.log(count / total)
+            for term in terms:
+                score += math.log((counts[term] + 1) / denominator)
+            scores[label] = score
+        best = max(scores, key=scores.get)
+        # softmax trên log-score để ra xác suất
+        normalizer = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / normalizer
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"class_counts": dict(self.class_counts),
+                "term_counts": {label: dict(counts) for label, counts in self.term_counts.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KeywordModel":
+        model = cls()
+        model.class_counts = Counter(data.get("class_counts", {}))
+        for label, counts in data.get("term_counts", {}).items():
+            model.term_counts[label] = Counter(counts)
+            model.vocabulary.update(counts)
+        return model
+
+
+class PlanRouter:
+    """Dựng ActionPlan (dạng dict) cho yêu cầu rõ ràng, trả None để chuyển cho planner LLM"""
+
+    def __init__(self, model_path: Optional[str] = None,
+                 known_filenames: Optional[Callable[[], Iterable[str]]] = None,
+                 enabled: bool = True, min_confidence: float = 0.8, min_samples: int = 20):
+        self.model_path = model_path
+        self.known_filenames = known_filenames
+        self.enabled = enabled
+        self.min_confidence = min_confidence
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self.model = self._load_model()
+        self.stats = {"routed": 0, "routed_by_model": 0, "deferred": 0, "vetoed": 0, "trained": 0}
+
+    # ------------------------------------------------------------------ model học được
+
+    def _load_model(self) -> KeywordModel:
+        if not self.model_path or not os.path.exists(self.model_path):
+            return KeywordModel()
+        try:
+            with open(self.model_path, "r", encoding="utf-8") as f:
+                return KeywordModel.from_dict(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được model router {self.model_path}: {e}")
+            return KeywordModel()
+
+    def _save_model(self):
+        if not self.model_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.model_path) or ".", exist_ok=True)
+            tmp_path = self.model_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.model.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, self.model_path)
+        except OSError as e:
+            logger.warning(f"Không lưu được model router: {e}")
+
+    def learn(self, user_input: str, steps: List[Dict[str, Any]]):
+        """Học từ plan do LLM sinh ra (nhãn = hàm của bước đầu tiên)"""
+        if not steps:
+            return
+        label = steps[0].get("function")
+        if not label:
+            return
+        with self._lock:
+            self.model.train(user_input, label)
+            self.stats["trained"] += 1
+            self._save_model()
+
+    def _model_prediction(self, text: str) -> Tuple[Optional[str], float]:
+        with self._lock:
+            if self.model.samples < self.min_samples:
+                return None, 0.0
+            return self.model.predict(text)
+
+    # ------------------------------------------------------------------ rule
+
+    def _filenames_in(self, text: str, allow_stems: bool) -> List[str]:
+        """Tên file được nhắc tới: có đuôi file, hoặc (khi allow_stems) khớp tên file trong index"""
+        found = [m.group(0) for m in FILENAME_PATTERN.finditer(text)]
+        if found or not allow_stems or self.known_filenames is None:
+            return list(dict.fromkeys(found))
+        try:
+            filenames = list(self.known_filenames())
+        except Exception as e:
+            logger.warning(f"Không lấy được danh sách file cho router: {e}")
+            return []
+        folded = strip_diacritics(text)
+        for filename in filenames:
+            key = _stem_key(filename)
+            # Tên quá ngắn ("plan") dễ trùng từ thường, bỏ qua
+            if len(key) >= 4 and (" " in key or any(c.isdigit() for c in key)) and _contains(folded, key):
+                found.append(filename)
+        return list(dict.fromkeys(found))
+
+    @staticmethod
+    def _argument_after(text: str, triggers: List[str]) -> str:
+        """Phần câu sau trigger cuối cùng, bỏ từ đệm ở đầu và cuối"""
+        position = -1
+        for phrase in triggers:
+            for match in re.finditer(rf"(?<!\w){re.escape(phrase)}(?!\w)", text):
+                position = max(position, match.end())
+        if position < 0:
+            return ""
+        argument = LEADING_FILLER_PATTERN.sub("", text[position:].strip(" ?.!,:\"'“”"))
+        argument = TRAILING_FILLER_PATTERN.sub("", argument).strip(" ?.!,:\"'“”")
+        # Cần ít nhất một chữ/số mới coi là tham số
+        return argument if any(c.isalnum() for c in argument) else ""
+
+    def _matched_actions(self, text: str) -> List[str]:
+        for phrase in FALSE_TRIGGERS:
+            text = re.sub(rf"(?<!\w){re.escape(phrase)}(?!\w)", " ", text)
+        matched = [action for action, phrases in TRIGGERS.items() if any(_contains(text, p) for p in phrases)]
+        if FILENAME_PATTERN.search(text) and "search" in matched:
+            matched.append("search_exactly")
+        return [a for a in dict.fromkeys(matched) if SUBSUMED_BY.get(a) not in matched]
+
+    def _rule_plan(self, text: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(hành động khớp, plan) — plan None khi không trích được tham số hoặc mơ hồ"""
+        actions = self._matched_actions(text)
+        if len(actions) != 1:
+            return (None, None)
+        action = actions[0]
+        if action == "search":
+            keyword = self._argument_after(text, TRIGGERS["search"])
+            return action, (_plan(text, [_step(action, {"query": keyword})]) if keyword else None)
+        if action == "classify_by_topic":
+            topic = self._argument_after(text, TRIGGERS["classify_by_topic"])
+            return action, (_plan(text, [_step(action, {"topic": topic})]) if topic else None)
+        if action == "search_exactly":
+            filenames = self._filenames_in(text, allow_stems=True)
+            if not filenames:
+                return action, None
+            steps = [_step(action, {}, description=f"Tìm file {name}", required_data=[name]) for name in filenames]
+            if _contains(text, "so sánh") or _contains(text, "compare"):
+                steps.append(_step("general", {}, description="So sánh nội dung các file", required_data=["so sánh chi tiết"]))
+            elif _contains(text, "tóm tắt") or _contains(text, "summarize"):
+                steps.append(_step("general", {}, description="Tóm tắt nội dung file", required_data=["tóm tắt"]))
+            return action, _plan(text, steps)
+        if action in IMPERATIVE_PATTERNS:
+            pattern = IMPERATIVE_PATTERNS[action]
+            command = text.strip(" ?.!,:\"'“”")
+            if pattern is None or not pattern.fullmatch(command):
+                return action, None
+        return action, _plan(text, [_step(action, {})])
+
+    # ------------------------------------------------------------------ API
+
+    def route(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """Plan dạng dict (các field của ActionPlan) nếu chắc chắn, None nếu cần planner LLM"""
+        if not self.enabled:
+            return None
+        text = normalize_prompt(user_input)
+        action, plan = self._rule_plan(text)
+        label, confidence = self._model_prediction(text)
+        confident = label is not None and confidence >= self.min_confidence
+
+        if plan is not None:
+            if confident and label != action:
+                self.stats["vetoed"] += 1
+                self.stats["deferred"] += 1
+                logger.info(f"Router: rule chọn {action} nhưng model chọn {label} ({confidence:.2f}), chuyển LLM")
+                return None
+            self.stats["routed"] += 1
+            logger.info(f"Router: '{user_input}' -> {action} (rule)")
+            return plan
+
+        if action is None and confident and label in ARGUMENT_FREE_ACTIONS and not self._matched_actions(text):
+            self.stats["routed"] += 1
+            self.stats["routed_by_model"] += 1
+            logger.info(f"Router: '{user_input}' -> {label} (model {confidence:.2f})")
+            return _plan(text, [_step(label, {})])
+
+        self.stats["deferred"] += 1
+        return None
+
+
+def _step(function: str, parameters: Dict[str, Any], description: str = None,
+          required_data: List[str] = None) -> Dict[str, Any]:
+    arg = parameters.get("query") or parameters.get("topic") or ""
+    return {
+        "description": description or DESCRIPTIONS[function].format(arg=arg),
+        "function": function,
+        "parameters": parameters,
+        "required_data": required_data or [],
+    }
+
+
+def _plan(text: str, steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+    for number, step in enumerate(steps, 1):
+        step["step"] = number
+    return {
+        "task_description": text,
+        "steps": steps,
+        "expected_output": steps[-1]["description"],
+        "recommendations": "",
+    }
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Prompt Prefix Cache
+Giữ KV-cache của phần prompt tĩnh (hướng dẫn dài của planner / detect_intent) dưới dạng
+llama.cpp state đã lưu. Trước mỗi lần gọi chỉ cần nạp lại state, llama.cpp tự nhận ra
+phần token trùng ở đầu và chỉ evaluate phần đuôi riêng của người dùng.
+State được lưu riêng cho từng context của model pool.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PromptPrefixCache:
+    """Lưu llama.cpp state sau khi evaluate từng prefix tĩnh (theo tên, theo context)"""
+
+    def __init__(self, llm, enabled: bool = True):
+        self.llm = llm
+        self.enabled = enabled
+        self._states: Dict[Tuple[int, str], Tuple[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _stat(self, name: str) -> Dict[str, float]:
+        with self._lock:
+            return self.stats.setdefault(name, {"calls": 0, "warmups": 0, "warmup_seconds": 0.0,
+                                                "restore_seconds": 0.0, "call_seconds": 0.0})
+
+    def warm(self, model, name: str, prefix: str):
+        """
+        Evaluate prefix một lần trên context `model` rồi lưu state. Dùng chính
+        create_chat_completion (1 token) để prefix được format theo đúng chat template như lúc gọi thật.
+        """
+        stat = self._stat(name)
+        started = time.perf_counter()
+        model.reset()
+        model.create_chat_completion(
+            messages=[{"role": "user", "content": prefix}],
+            max_tokens=1,
+            temperature=0.0,
+        )
+        self._states[(id(model), name)] = (prefix, model.save_state())
+        stat["warmups"] += 1
+        stat["warmup_seconds"] += time.perf_counter() - started
+        logger.info(f"Prefix cache '{name}': đã lưu state ({model.n_tokens} token)")
+
+    def create_chat_completion(self, name: str, prefix: str, model=None, **kwargs):
+        """
+        Gọi create_chat_completion với KV của prefix đã được nạp sẵn.
+        Nội dung message đầu tiên phải bắt đầu bằng prefix thì mới tận dụng được cache.
+        model: context đang giữ sẵn (nếu không có thì mượn một context từ pool).
+        """
+        if not self.enabled:
+            return (model or self.llm).create_chat_completion(**kwargs)
+        if model is not None:
+            return self._call(model, name, prefix, kwargs)
+        if kwargs.get("stream"):
+            return self._stream_call(name, prefix, kwargs)
+        with self.llm.acquire() as context:
+            return self._call(context, name, prefix, kwargs)
+
+    def _stream_call(self, name: str, prefix: str, kwargs: Dict[str, Any]) -> Iterator[dict]:
+        # Giữ context tới khi stream kết thúc (như ModelPool._stream_chat_completion)
+        with self.llm.acquire() as context:
+            yield from self._call(context, name, prefix, kwargs)
+
+    def _call(self, model, name: str, prefix: str, kwargs: Dict[str, Any]):
+        stat = self._stat(name)
+        key = (id(model), name)
+        try:
+            cached = self._states.get(key)
+            if cached is None or cached[0] != prefix:
+                self.warm(model, name, prefix)
+            restore_started = time.perf_counter()
+            model.load_state(self._states[key][1])
+            stat["restore_seconds"] += time.perf_counter() - restore_started
+        except Exception as e:
+            # Không có state thì vẫn gọi bình thường (evaluate cả prompt)
+            logger.warning(f"Prefix cache '{name}' lỗi, evaluate toàn bộ prompt: {e}")
+            self._states.pop(key, None)
+
+        started = time.perf_counter()
+        response = model.create_chat_completion(**kwargs)
+        stat["calls"] += 1
+        stat["call_seconds"] += time.perf_counter() - started
+        return response
+
+    def clear(self):
+        """Bỏ các state đã lưu (vd. sau khi đổi model)"""
+        self._states.clear()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Search Index
+Inverted index toàn văn với xếp hạng BM25 cho FileIndexer.
+Chuẩn hóa tiếng Việt: mỗi từ được index cả dạng có dấu và dạng bỏ dấu,
+nên "ke hoach" vẫn tìm được "kế hoạch", còn truy vấn có dấu được ưu tiên khớp đúng dấu.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Chữ/số, tách cả theo dấu gạch dưới (user_manual -> user, manual)
+TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+# Tham số BM25 chuẩn
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Trọng số tên file so với nội dung (xấp xỉ BM25F bằng cách lặp lại trường tên file)
+FILENAME_WEIGHT = 3
+
+
+def strip_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'kế hoạch' -> 'ke hoach', 'đ' -> 'd'"""
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+    return stripped.replace("đ", "d").replace("Đ", "D")
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ (chữ thường, dạng NFC)"""
+    return TOKEN_PATTERN.findall(unicodedata.normalize("NFC", text.lower()))
+
+
+def index_terms(text: str) -> List[str]:
+    """Các term dùng để index/truy vấn: từ có dấu + dạng bỏ dấu (nếu khác)"""
+    terms = []
+    for token in tokenize(text):
+        terms.append(token)
+        folded = strip_diacritics(token)
+        if folded != token:
+            terms.append(folded)
+    return terms
+
+
+def document_text(filename: str, content: str) -> str:
+    """Văn bản dùng để index một file: tên file (có trọng số) + toàn bộ nội dung"""
+    return "\n".join([filename] * FILENAME_WEIGHT + [content])
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    """Đếm tần suất term của một văn bản"""
+    return dict(Counter(index_terms(text)))
+
+
+class InvertedIndex:
+    """Inverted index: term -> {doc_id: tf}, xếp hạng BM25"""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_lengths
+
+    def add_document(self, doc_id: str, text: str) -> Dict[str, int]:
+        """Index văn bản, trả về term counts để lưu lại"""
+        counts = term_counts(text)
+        self.add_term_counts(doc_id, counts)
+        return counts
+
+    def add_term_counts(self, doc_id: str, counts: Dict[str, int]):
+        """Index từ term counts đã tính sẵn (vd. nạp từ index store)"""
+        if doc_id in self.doc_lengths:
+            self.remove_document(doc_id)
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(counts.values())
+        self.doc_lengths[doc_id] = length
+        self.doc_terms[doc_id] = list(counts)
+        self.total_length += length
+
+    def remove_document(self, doc_id: str):
+        """Xóa văn bản khỏi index"""
+        if doc_id not in self.doc_lengths:
+            return
+        for term in self.doc_terms.pop(doc_id, []):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, query: str, top_k: int = None) -> List[Tuple[str, float]]:
+        """Trả về [(doc_id, score)] theo BM25 giảm dần"""
+        return self.score_terms(index_terms(query), top_k)
+
+    def score_terms(self, terms: Iterable[str], top_k: int = None) -> List[Tuple[str, float]]:
+        n_docs = len(self.doc_lengths)
+        if n_docs == 0:
+            return []
+        avg_length = self.total_length / n_docs or 1.0
+        scores: Dict[str, float] = {}
+
+        for term in set(terms):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            df = len(posting)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:top_k] if top_k else ranked
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[Tuple[str, Optional[float]]]],
+                           k: int = 60) -> List[Tuple[str, float, Dict[str, Dict[str, Any]]]]:
+    """
+    Gộp nhiều danh sách xếp hạng: điểm = tổng 1 / (k + hạng) trên các tín hiệu.
+    Trả về [(doc_id, điểm RRF, {tín hiệu: {"rank", "score"}})] giảm dần.
+    """
+    fused: Dict[str, float] = {}
+    signals: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for signal, ranked in rankings.items():
+        for rank, (doc_id, score) in enumerate(ranked, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+            signals.setdefault(doc_id, {})[signal] = {"rank": rank, "score": score}
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [(doc_id, score, signals[doc_id]) for doc_id, score in ordered]
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Summarizer
+Tóm tắt map-reduce trên toàn văn tài liệu: chia chunk lớn, tóm tắt các chunk theo lô
+trên model pool (map), rồi gộp dần các tóm tắt vừa ngân sách token cho đến khi còn một (reduce).
+Mọi tóm tắt trung gian được cache theo hash nội dung nên tóm tắt/so sánh lại cùng file là tức thì.
+"""
+
+import logging
+import re
+from typing import Dict, List
+
+from config import (SUMMARY_CHUNK_CHARS, SUMMARY_CHUNK_MAX_TOKENS, SUMMARY_FINAL_MAX_TOKENS,
+                    SUMMARY_REDUCE_TOKEN_BUDGET)
+from llm_processor import llm
+from llm_utils import count_tokens, make_excerpt
+from summary_cache import SummaryCache
+from vector_index import chunk_text
+from verdict_cache import content_hash
+
+logger = logging.getLogger(__name__)
+
+# Yêu cầu cần tóm tắt cả tài liệu thay vì chỉ lấy vài đoạn liên quan
+SUMMARY_TRIGGERS = ["tóm tắt", "so sánh", "tổng hợp", "summarize", "summary", "compare"]
+
+# Thống kê: số đoạn cần tóm tắt, số lấy từ cache, số lời gọi LLM, số vòng reduce
+summary_stats = {"sections": 0, "cached": 0, "llm_calls": 0, "reduce_rounds": 0}
+
+summary_cache = SummaryCache()
+
+MAP_PROMPT = (
+    "Tóm tắt đoạn trích sau của một tài liệu bằng tiếng Việt, tối đa 5 gạch đầu dòng. "
+    "Giữ lại số liệu, tên riêng, ngày tháng và kết luận quan trọng. Không thêm thông tin ngoài đoạn trích.\n\n"
+    "Đoạn trích:\n{text}"
+)
+REDUCE_PROMPT = (
+    "Dưới đây là các bản tóm tắt của những phần liên tiếp trong cùng một tài liệu. "
+    "Gộp thành một bản tóm tắt mạch lạc bằng tiếng Việt, giữ lại số liệu và ý chính, bỏ ý trùng lặp.\n\n"
+    "{text}"
+)
+
+
+def wants_summary(text: str) -> bool:
+    """Yêu cầu có cần tóm tắt/so sánh toàn bộ tài liệu không"""
+    lowered = text.lower()
+    return any(re.search(rf"(?<!\w){re.escape(t)}(?!\w)", lowered) for t in SUMMARY_TRIGGERS)
+
+
+def _summarize_many(texts: List[str], kind: str) -> List[str]:
+    """
+    Tóm tắt nhiều đoạn (kind: "map" cho chunk, "reduce" cho nhóm tóm tắt, "single" cho tài liệu
+    vừa một chunk: prompt của map, độ dài của bản tóm tắt cuối),
+    đoạn đã có trong cache không gọi LLM; các đoạn còn lại gửi cùng lúc lên model pool.
+    """
+    hashes = [content_hash(text) for text in texts]
+    cached = summary_cache.get_many(hashes, kind)
+    pending = {h: text for h, text in zip(hashes, texts) if h not in cached}
+    summary_stats["sections"] += len(texts)
+    summary_stats["cached"] += len(texts) - len(pending)
+
+    template = REDUCE_PROMPT if kind == "reduce" else MAP_PROMPT
+    max_tokens = SUMMARY_CHUNK_MAX_TOKENS if kind == "map" else SUMMARY_FINAL_MAX_TOKENS
+    requests = [
+        {
+            "messages": [
+                {"role": "system", "content": "Bạn là trợ lý tóm tắt tài liệu."},
+                {"role": "user", "content": template.format(text=text)},
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.0,
+        }
+        for text in pending.values()
+    ]
+    responses = llm.create_chat_completion_batch(requests, return_exceptions=True) if requests else []
+    summary_stats["llm_calls"] += len(requests)
+
+    fresh: Dict[str, str] = {}
+    for h, response in zip(pending, responses):
+        try:
+            if isinstance(response, Exception):
+                raise response
+            summary = response["choices"][0]["message"]["content"].strip()
+            if summary:
+                fresh[h] = summary
+        except Exception as e:
+            logger.error(f"Lỗi LLM khi tóm tắt ({kind}): {e}")
+    summary_cache.put_many(fresh, kind)
+
+    # Đoạn tóm tắt lỗi: dùng tạm phần đầu + cuối của đoạn (không cache)
+    return [cached.get(h) or fresh.get(h) or make_excerpt(text, SUMMARY_CHUNK_MAX_TOKENS * 3)
+            for h, text in zip(hashes, texts)]
+
+
+def _pack_for_reduce(summaries: List[str], token_budget: int) -> List[List[str]]:
+    """Gom các tóm tắt liên tiếp thành nhóm vừa token_budget (mỗi nhóm ít nhất 2 để luôn giảm được)"""
+    groups, current, used = [], [], 0
+    for summary in summaries:
+        cost = count_tokens(summary)
+        if current and used + cost > token_budget and len(current) >= 2:
+            groups.append(current)
+            current, used = [], 0
+        current.append(summary)
+        used += cost
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    return groups
+
+
+def summarize_text(text: str) -> str:
+    """Tóm tắt toàn văn: map trên từng chunk, reduce theo nhóm đến khi còn một bản tóm tắt"""
+    text = text.strip()
+    if not text:
+        return ""
+    chunks = chunk_text(text, SUMMARY_CHUNK_CHARS, overlap=0)
+    if len(chunks) == 1:
+        # Văn bản gốc chứ không phải các bản tóm tắt: dùng prompt map
+        return _summarize_many(chunks, "single")[0]
+
+    summaries = _summarize_many(chunks, "map")
+    while len(summaries) > 1:
+        groups = _pack_for_reduce(summaries, SUMMARY_REDUCE_TOKEN_BUDGET)
+        summaries = _summarize_many(["\n\n".join(group) for group in groups], "reduce")
+        summary_stats["reduce_rounds"] += 1
+    logger.info(f"Tóm tắt {len(chunks)} chunk: {summary_stats}")
+    return summaries[0]
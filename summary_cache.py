@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Summary Cache
+Lưu tóm tắt do LLM sinh ra (tóm tắt từng chunk và các bước gộp) xuống SQLite,
+theo khóa (hash đoạn văn, loại tóm tắt, model, phiên bản prompt).
+Tóm tắt/so sánh lại cùng một file không phải gọi LLM lần nữa.
+"""
+
+from config import SUMMARY_CACHE_DB_PATH, SUMMARY_CACHE_MAX_ENTRIES, MODEL_FILENAME, SUMMARY_PROMPT_VERSION
+from llm_cache import LLMResultCache
+
+
+class SummaryCache(LLMResultCache):
+    """Cache tóm tắt của LLM (khóa phụ là loại tóm tắt: "map" / "reduce")"""
+
+    def __init__(self, db_path: str = SUMMARY_CACHE_DB_PATH, model_id: str = MODEL_FILENAME,
+                 prompt_version: str = str(SUMMARY_PROMPT_VERSION),
+                 max_entries: int = SUMMARY_CACHE_MAX_ENTRIES):
+        super().__init__(db_path, table="summaries", key_column="kind", value_column="summary",
+                         value_type="TEXT", model_id=model_id, prompt_version=prompt_version,
+                         max_entries=max_entries)
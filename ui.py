@@ -1,29 +1,57 @@
 import gradio as gr
 import os
 import logging
-from agentic_ai import process_prompt_agent
-from llm_processor import process_prompt
+from agentic_ai import submit_prompt
+from llm_scheduler import SchedulerBusy
+from llm_processor import process_prompt, is_ready, readiness_status
 
 logger = logging.getLogger(__name__)
 
-def chat_with_llm(message, history):
-    """Simple chat interface with LLM"""
+def chat_with_llm(message, history, request: gr.Request = None):
+    """Chat interface with LLM - stream từng bước / từng token lên giao diện"""
+    history.append({"role": "user", "content": message})
+    if is_ready():
+        history.append({"role": "assistant", "content": "⏳ Đang xử lý..."})
+    else:
+        history.append({"role": "assistant", "content": "⏳ Hệ thống đang khởi động (tải model / quét file), yêu cầu sẽ được xử lý ngay khi sẵn sàng..."})
+    yield history, ""
+
+    session_id = getattr(request, "session_hash", None) or "default"
+    response = ""
     try:
-        # Process with simplified LLM processor
-        history.append({"role": "user", "content": message})
-        response = process_prompt_agent(message)
-        
-        # Add to history using messages format
-        history.append({"role": "assistant", "content": response})
-        
-        return history, ""
-        
+        for piece in submit_prompt(message, session_id):
+            response += piece
+            history[-1]["content"] = response
+            yield history, ""
+
+        history[-1]["content"] = response.strip() or "Xin lỗi, tôi không hiểu."
+        yield history, ""
+
+    except SchedulerBusy as e:
+        logger.warning(f"Từ chối request của session {session_id}: {e}")
+        history[-1]["content"] = "⚠️ Hệ thống đang bận, vui lòng thử lại sau ít phút."
+        yield history, ""
+
     except Exception as e:
         logger.error(f"Chat error: {e}")
-        error_msg = f"Lỗi xử lý: {str(e)}"
-        history.append({"role": "user", "content": message})
-        history.append({"role": "assistant", "content": error_msg})
-        return history, ""
+        history[-1]["content"] = f"Lỗi xử lý: {str(e)}"
+        yield history, ""
+
+def format_readiness() -> str:
+    """Dòng trạng thái khởi động hiển thị trên giao diện"""
+    status = readiness_status()
+    model, filesystem = status["model"], status["filesystem"]
+    model_text = {
+        "ready": f"✅ Model sẵn sàng ({model.get('load_seconds')}s)",
+        "loading": f"⏳ Đang tải model ({model.get('elapsed_seconds')}s)",
+        "failed": f"❌ Lỗi tải model: {model.get('error')}",
+    }.get(model["state"], "⏳ Chưa tải model")
+    filesystem_text = {
+        "ready": "✅ Đã index file",
+        "scanning": "⏳ Đang quét file",
+        "failed": "⚠️ Quét file lỗi",
+    }.get(filesystem["state"], "⚠️ Filesystem không khả dụng")
+    return f"**Trạng thái:** {model_text} · {filesystem_text}"
 
 def create_interface():
     """Create modern and visually appealing Gradio interface"""
@@ -212,6 +240,9 @@ def create_interface():
         with gr.Row(elem_classes=["chat-container"]):
             with gr.Column():
                 gr.Markdown("### 💬 Giao diện Chat")
+                with gr.Row():
+                    status_md = gr.Markdown(format_readiness())
+                    status_btn = gr.Button("🔄 Cập nhật trạng thái", size="sm", scale=0)
                 
                 # Chat interface with messages format
                 chatbot = gr.Chatbot(
@@ -265,22 +296,29 @@ def create_interface():
                     )
         
         # Event handlers
+        # concurrency_limit=None: không để hàng đợi Gradio xếp hàng từng request,
+        # LLMScheduler mới là nơi giới hạn số request và trả lời "bận"
         msg.submit(
             chat_with_llm,
             inputs=[msg, chatbot],
-            outputs=[chatbot, msg]
+            outputs=[chatbot, msg],
+            concurrency_limit=None
         )
         
         submit_btn.click(
             chat_with_llm,
             inputs=[msg, chatbot],
-            outputs=[chatbot, msg]
+            outputs=[chatbot, msg],
+            concurrency_limit=None
         )
         
         clear_btn.click(
             lambda: ([], ""),
             outputs=[chatbot, msg]
         )
+
+        status_btn.click(format_readiness, outputs=[status_md])
+        demo.load(format_readiness, outputs=[status_md])
         
         # Footer Section
         with gr.Row(elem_classes=["footer-section"]):
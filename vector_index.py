@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Vector Index
+Tìm kiếm ngữ nghĩa trên toàn văn tài liệu: nội dung được chia chunk, embedding bằng
+llama.cpp (chế độ embedding, chạy CPU) và lưu thành ma trận NumPy float16/int8 trên đĩa
+(mmap khi nạp lại). Từ VECTOR_ANN_MIN_ROWS chunk trở lên dùng IVF (k-means) để chỉ
+so với các cụm gần truy vấn nhất thay vì toàn bộ ma trận.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (EMBEDDING_BATCH_SIZE, EMBEDDING_N_CTX, LLM_THREADS_PER_CONTEXT, MODEL_DIR,
+                    EMBEDDING_MODEL_FILENAME, SEMANTIC_MIN_SCORE, SEMANTIC_TOP_K, VECTOR_ANN_MIN_ROWS,
+                    VECTOR_ANN_PROBES, VECTOR_CHUNK_CHARS, VECTOR_CHUNK_OVERLAP, VECTOR_DTYPE,
+                    VECTOR_INDEX_DIR, VECTOR_MMAP)
+from verdict_cache import content_hash
+
+try:
+    from llama_cpp import Llama
+except ImportError:
+    Llama = None
+
+logger = logging.getLogger(__name__)
+
+# Số hàng nhân ma trận mỗi lần khi tính điểm (giới hạn bộ nhớ tạm khi đổi sang float32)
+SCORE_BLOCK_ROWS = 65536
+# Số vector tối đa dùng để huấn luyện k-means của IVF
+ANN_TRAIN_SAMPLE = 50000
+ANN_TRAIN_ITERATIONS = 10
+
+
+def chunk_text(text: str, max_chars: int = VECTOR_CHUNK_CHARS, overlap: int = VECTOR_CHUNK_OVERLAP) -> List[str]:
+    """Chia văn bản thành các đoạn <= max_chars, cắt ở ranh giới đoạn/câu/từ, chồng lấn overlap ký tự"""
+    text = text.strip()
+    chunks = []
+    start, length = 0, len(text)
+    while start < length:
+        end = min(length, start + max_chars)
+        if end < length:
+            window = text[start:end]
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = window.rfind(separator, max_chars // 2)
+                if cut > 0:
+                    end = start + cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+        # Bắt đầu chunk sau ở đầu một từ
+        space = text.find(" ", start, end)
+        if space != -1:
+            start = space + 1
+    return chunks
+
+
+class LlamaEmbedder:
+    """Model embedding GGUF chạy bằng llama.cpp, tải ở lần embed đầu tiên"""
+
+    def __init__(self, model_path: str = None, n_ctx: int = EMBEDDING_N_CTX,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, n_threads: int = LLM_THREADS_PER_CONTEXT):
+        self.model_path = model_path or os.path.join(MODEL_DIR, EMBEDDING_MODEL_FILENAME)
+        self.n_ctx = n_ctx
+        self.batch_size = batch_size
+        self.n_threads = n_threads
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return Llama is not None and os.path.exists(self.model_path)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.model_path)
+
+    def _load(self):
+        if self._model is None:
+            if not self.available:
+                raise FileNotFoundError(f"Không có model embedding: {self.model_path}")
+            self._model = Llama(
+                model_path=self.model_path,
+                embedding=True,
+                n_ctx=self.n_ctx,
+                n_batch=self.n_ctx,
+                n_ubatch=self.n_ctx,
+                n_threads=self.n_threads,
+                verbose=False,
+            )
+            logger.info(f"Đã tải model embedding {self.name}")
+        return self._model
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embedding đã chuẩn hóa L2, shape (len(texts), dim), float32"""
+        rows = []
+        with self._lock:
+            model = self._load()
+            for i in range(0, len(texts), self.batch_size):
+                rows.extend(model.embed(texts[i:i + self.batch_size], normalize=True, truncate=True))
+        return np.asarray(rows, dtype=np.float32)
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """float32 -> (float16, None) hoặc (int8, scale theo từng hàng)"""
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(np.float16), None
+
+
+class IVFIndex:
+    """Inverted file: gom vector thành các cụm k-means, truy vấn chỉ duyệt `probes` cụm gần nhất"""
+
+    def __init__(self, centroids: np.ndarray, lists: List[np.ndarray]):
+        self.centroids = centroids
+        self.lists = lists
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, scales: Optional[np.ndarray], seed: int = 0) -> "IVFIndex":
+        rows = len(matrix)
+        nlist = max(1, int(np.sqrt(rows)))
+        rng = np.random.default_rng(seed)
+        sample_idx = rng.choice(rows, size=min(rows, ANN_TRAIN_SAMPLE), replace=False)
+        sample = _as_float(matrix[np.sort(sample_idx)], None if scales is None else scales[np.sort(sample_idx)])
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(ANN_TRAIN_ITERATIONS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        assign = np.empty(rows, dtype=np.int32)
+        for start in range(0, rows, SCORE_BLOCK_ROWS):
+            block = _as_float(matrix[start:start + SCORE_BLOCK_ROWS],
+                              None if scales is None else scales[start:start + SCORE_BLOCK_ROWS])
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        lists = [np.flatnonzero(assign == c) for c in range(nlist)]
+        return cls(centroids, lists)
+
+    def candidates(self, query: np.ndarray, probes: int) -> np.ndarray:
+        nearest = np.argsort(-(self.centroids @ query))[:probes]
+        return np.concatenate([self.lists[c] for c in nearest])
+
+
+def _as_float(rows: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    values = np.asarray(rows, dtype=np.float32)
+    return values * scales[:, None] if scales is not None else values
+
+
+class VectorIndex:
+    """Embedding theo chunk của từng tài liệu: doc_id -> (hash nội dung, vectors, scales)"""
+
+    def __init__(self, index_dir: str = VECTOR_INDEX_DIR, embedder: Optional[LlamaEmbedder] = None,
+                 dtype: str = VECTOR_DTYPE, use_mmap: bool = VECTOR_MMAP,
+                 ann_min_rows: int = VECTOR_ANN_MIN_ROWS, ann_probes: int = VECTOR_ANN_PROBES):
+        self.index_dir = Path(index_dir)
+        self.embedder = embedder or LlamaEmbedder()
+        self.dtype = dtype
+        self.use_mmap = use_mmap
+        self.ann_min_rows = ann_min_rows
+        self.ann_probes = ann_probes
+        self._docs: Dict[str, Tuple[str, np.ndarray, Optional[np.ndarray]]] = {}
+        self._lock = threading.RLock()
+        self._matrix: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._row_docs: List[str] = []
+        self._row_chunks: Optional[np.ndarray] = None
+        self._ann: Optional[IVFIndex] = None
+        self._dirty = False     # cần ghép lại ma trận
+        self._unsaved = False   # cần ghi xuống đĩa
+        self._generation = 0
+        self.load()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def available(self) -> bool:
+        return self.embedder.available
+
+    # ------------------------------------------------------------------ lưu trữ
+
+    def _manifest_path(self) -> Path:
+        return self.index_dir / "manifest.json"
+
+    def load(self):
+        """Nạp ma trận đã lưu (mmap nếu bật); bỏ qua nếu đổi model embedding hoặc kiểu lưu"""
+        path = self._manifest_path()
+        if not path.exists():
+            return
+        try:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+            if manifest.get("model") != self.embedder.name or manifest.get("dtype") != self.dtype:
+                logger.info("Vector index được tạo với model/kiểu khác, sẽ embedding lại")
+                return
+            mmap_mode = "r" if self.use_mmap else None
+            matrix = np.load(self.index_dir / manifest["vectors"], mmap_mode=mmap_mode)
+            scales = np.load(self.index_dir / manifest["scales"]) if manifest.get("scales") else None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Không đọc được vector index: {e}")
+            return
+
+        docs, row = {}, 0
+        for entry in manifest["docs"]:
+            count = entry["rows"]
+            docs[entry["id"]] = (entry["hash"], matrix[row:row + count],
+                                 None if scales is None else scales[row:row + count])
+            row += count
+        with self._lock:
+            self._docs = docs
+            self._generation = manifest.get("generation", 0)
+            self._set_matrix(matrix, scales)
+        logger.info(f"Đã nạp vector index: {len(docs)} tài liệu, {row} chunk")
+
+    def save(self):
+        """Ghi ma trận sang file thế hệ mới rồi mới đổi manifest (file cũ có thể đang được mmap)"""
+        with self._lock:
+            if not self._unsaved:
+                return
+            self._ensure_matrix()
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            generation = self._generation + 1
+            vectors_name = f"vectors-{generation}.npy"
+            scales_name = f"scales-{generation}.npy" if self._scales is not None else None
+            np.save(self.index_dir / vectors_name, self._matrix)
+            if scales_name:
+                np.save(self.index_dir / scales_name, self._scales)
+            manifest = {
+                "model": self.embedder.name,
+                "dtype": self.dtype,
+                "generation": generation,
+                "vectors": vectors_name,
+                "scales": scales_name,
+                "docs": [{"id": doc_id, "hash": h, "rows": len(rows)} for doc_id, (h, rows, _) in self._docs.items()],
+            }
+            tmp_path = self._manifest_path().with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self._manifest_path())
+            self._remove_old_generations(generation)
+            self._unsaved = False
+            self.load()
+
+    def _remove_old_generations(self, keep: int):
+        for path in self.index_dir.glob("*-*.npy"):
+            if not path.stem.endswith(f"-{keep}"):
+                try:
+                    path.unlink()
+                except OSError:
+                    # Windows: file cũ còn đang mmap, xóa ở lần lưu sau
+                    pass
+
+    # ------------------------------------------------------------------ cập nhật
+
+    def add_document(self, doc_id: str, text: str) -> int:
+        """Chia chunk + embedding tài liệu (bỏ qua nếu nội dung không đổi), trả về số chunk mới"""
+        digest = content_hash(text)
+        existing = self._docs.get(doc_id)
+        if existing is not None and existing[0] == digest:
+            return 0
+        chunks = chunk_text(text)
+        if not chunks:
+            self.remove_documents([doc_id])
+            return 0
+        vectors, scales = quantize(self.embedder.embed(chunks), self.dtype)
+        with self._lock:
+            self._docs[doc_id] = (digest, vectors, scales)
+            self._dirty = self._unsaved = True
+        return len(chunks)
+
+    def remove_documents(self, doc_ids: List[str]) -> int:
+        removed = 0
+        with self._lock:
+            for doc_id in doc_ids:
+                if self._docs.pop(doc_id, None) is not None:
+                    removed += 1
+            if removed:
+                self._dirty = self._unsaved = True
+        return removed
+
+    def _set_matrix(self, matrix: np.ndarray, scales: Optional[np.ndarray]):
+        self._matrix, self._scales = matrix, scales
+        self._row_docs = []
+        chunk_numbers = []
+        for doc_id, (_, rows, _) in self._docs.items():
+            self._row_docs.extend([doc_id] * len(rows))
+            chunk_numbers.extend(range(len(rows)))
+        self._row_chunks = np.asarray(chunk_numbers, dtype=np.int32)
+        self._ann = None
+        self._dirty = False
+
+    def _ensure_matrix(self):
+        if self._matrix is not None and not self._dirty:
+            return
+        docs = list(self._docs.values())
+        if not docs:
+            self._set_matrix(np.zeros((0, 0), dtype=np.float16), None)
+            return
+        matrix = np.concatenate([rows for _, rows, _ in docs])
+        scales = np.concatenate([s for _, _, s in docs]) if docs[0][2] is not None else None
+        self._set_matrix(matrix, scales)
+
+    # ------------------------------------------------------------------ truy vấn
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        if rows is not None:
+            return _as_float(self._matrix[rows], None if self._scales is None else self._scales[rows]) @ query
+        scores = np.empty(len(self._matrix), dtype=np.float32)
+        for start in range(0, len(self._matrix), SCORE_BLOCK_ROWS):
+            stop = start + SCORE_BLOCK_ROWS
+            block = _as_float(self._matrix[start:stop], None if self._scales is None else self._scales[start:stop])
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+    def search(self, query: str, top_k: int = SEMANTIC_TOP_K,
+               min_score: float = SEMANTIC_MIN_SCORE) -> List[Tuple[str, float, int]]:
+        """[(doc_id, điểm cosine của chunk khớp nhất, số thứ tự chunk)] giảm dần theo điểm"""
+        if not self._docs:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        with self._lock:
+            self._ensure_matrix()
+            if len(self._matrix) == 0:
+                return []
+            rows = None
+            if len(self._matrix) >= self.ann_min_rows:
+                if self._ann is None:
+                    self._ann = IVFIndex.build(self._matrix, self._scales)
+                    logger.info(f"Đã dựng IVF với {len(self._ann.lists)} cụm cho {len(self._matrix)} chunk")
+                rows = self._ann.candidates(query_vector, self.ann_probes)
+            scores = self._scores(query_vector, rows)
+            row_ids = rows if rows is not None else np.arange(len(scores))
+
+            results, seen = [], set()
+            for i in np.argsort(-scores):
+                score = float(scores[i])
+                if score < min_score or len(results) >= top_k:
+                    break
+                row = int(row_ids[i])
+                doc_id = self._row_docs[row]
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                results.append((doc_id, score, int(self._row_chunks[row])))
+            return results
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            rows = sum(len(r) for _, r, _ in self._docs.values())
+            nbytes = sum(r.nbytes + (s.nbytes if s is not None else 0) for _, r, s in self._docs.values())
+            return {
+                "available": self.available,
+                "documents": len(self._docs),
+                "chunks": rows,
+                "dtype": self.dtype,
+                "bytes": nbytes,
+                "mmap": self.use_mmap,
+                "ann_lists": len(self._ann.lists) if self._ann is not None else None,
+            }
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Verdict Cache
+Lưu kết quả phân loại theo chủ đề (có liên quan / không) của LLM xuống SQLite,
+theo khóa (hash nội dung, chủ đề đã chuẩn hóa, model, phiên bản prompt).
+Hỏi lại cùng chủ đề chỉ tốn LLM cho các tài liệu đã thay đổi.
+"""
+
+import hashlib
+import unicodedata
+
+from config import (VERDICT_CACHE_DB_PATH, VERDICT_CACHE_MAX_ENTRIES, MODEL_FILENAME,
+                    CLASSIFY_PROMPT_VERSION, CLASSIFY_EXCERPT_CHARS)
+from llm_cache import LLMResultCache
+
+
+def content_hash(content: str) -> str:
+    """Hash nội dung tài liệu (không phụ thuộc đường dẫn: file đổi tên vẫn dùng lại được)"""
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def normalize_topic(topic: str) -> str:
+    """'  Marketing ' và 'marketing' là cùng một chủ đề"""
+    return " ".join(unicodedata.normalize("NFC", topic).lower().split())
+
+
+class VerdictCache(LLMResultCache):
+    """Cache verdict của LLM, đẩy các mục lâu không dùng ra khi vượt max_entries"""
+
+    def __init__(self, db_path: str = VERDICT_CACHE_DB_PATH, model_id: str = MODEL_FILENAME,
+                 prompt_version: str = f"{CLASSIFY_PROMPT_VERSION}:{CLASSIFY_EXCERPT_CHARS}",
+                 max_entries: int = VERDICT_CACHE_MAX_ENTRIES):
+        super().__init__(db_path, table="verdicts", key_column="topic", value_column="verdict",
+                         value_type="INTEGER", model_id=model_id, prompt_version=prompt_version,
+                         max_entries=max_entries)
+
+    def _normalize_key(self, topic: str) -> str:
+        return normalize_topic(topic)
+
+    def _encode(self, verdict: bool) -> int:
+        return int(verdict)
+
+    def _decode(self, raw: int) -> bool:
+        return bool(raw)